@@ -0,0 +1,109 @@
+"""
+Compare file downloads as `/direct_download` served them before (Starlette's FileResponse,
+64 KiB reads) with DownloadResponse, read in DOWNLOAD_CHUNK_SIZE pieces under uvicorn.
+
+Each server runs in its own process; the table reports throughput and the server's CPU
+time per GiB sent (Linux, read from /proc).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_downloads --size 1073741824 --requests 4 --concurrency 2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import aiohttp
+from starlette.requests import Request
+from starlette.responses import FileResponse
+from starlette.routing import Route, Router
+
+from flexport.downloads import DownloadResponse
+
+
+def make_app(path: str):
+    async def legacy(request: Request):
+        return FileResponse(path, filename="bench.bin")
+
+    async def download(request: Request):
+        return DownloadResponse(path, filename="bench.bin")
+
+    return Router([Route("/legacy", legacy), Route("/download", download)])
+
+
+def run_server(path: str, port: int):
+    import uvicorn
+    uvicorn.run(make_app(path), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def wait_ready(url: str):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.head(url):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def download_all(url: str, requests: int, concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    received = 0
+
+    async def one(session):
+        nonlocal received
+        async with semaphore, session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(1024 * 1024):
+                received += len(chunk)
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        await asyncio.gather(*(one(session) for _ in range(requests)))
+    return received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256 * 1024 * 1024, help="Bytes in the served file.")
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8792)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as f:
+        block = os.urandom(1024 * 1024)
+        for written in range(0, args.size, len(block)):
+            f.write(block[:args.size - written])
+        f.flush()
+
+        print(f"{'impl':>10} {'seconds':>10} {'MiB/s':>10} {'cpu s/GiB':>10}")
+        for kind, route in [("legacy", "/legacy"), ("chunked", "/download")]:
+            process = multiprocessing.Process(target=run_server, args=(f.name, args.port), daemon=True)
+            process.start()
+            url = f"http://127.0.0.1:{args.port}{route}"
+            try:
+                asyncio.run(wait_ready(url))
+                cpu_before = cpu_seconds(process.pid)
+                start = time.perf_counter()
+                received = asyncio.run(download_all(url, args.requests, args.concurrency))
+                seconds = time.perf_counter() - start
+                cpu = cpu_seconds(process.pid) - cpu_before
+            finally:
+                process.terminate()
+                process.join()
+            gib = received / 2**30
+            print(f"{kind:>10} {seconds:>10.3f} {received / 2**20 / seconds:>10.1f} {cpu / gib:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare link downloads through the shared HTTP client with a client session per link,
+against a local aiohttp server serving many small files.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_links --files 1000 --size 16384 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import aiohttp
+import aiofiles
+from aiohttp import web
+
+from flexport.http_client import HttpClient
+
+
+def start_server(payload: bytes, port: int):
+    """Serve `payload` at /<anything> from a background thread; returns the set of client ports seen."""
+    peers = set()
+    ready = threading.Event()
+
+    async def handler(request):
+        peers.add(request.transport.get_extra_info("peername")[1])
+        return web.Response(body=payload)
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_get("/{name}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return peers
+
+
+async def fetch(session, url: str, destination: str):
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async with aiofiles.open(destination, mode="wb") as f:
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                await f.write(chunk)
+
+
+async def per_link_session(url: str, destination: str, _client):
+    """What `download_file_from_link` did before the shared client."""
+    async with aiohttp.ClientSession() as session:
+        await fetch(session, url, destination)
+
+
+async def shared_session(url: str, destination: str, client):
+    await fetch(client.session, url, destination)
+
+
+async def run(impl, base_url: str, files: int, concurrency: int, directory: str):
+    client = HttpClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await impl(f"{base_url}/file_{i:06d}.bin", os.path.join(directory, f"file_{i:06d}.bin"), client)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(files)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=16 * 1024, help="Bytes per file.")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Downloads in flight at once (the scheduler's global cap).")
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+
+    peers = start_server(os.urandom(args.size), args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'impl':>12} {'seconds':>10} {'files/s':>10} {'MiB/s':>10} {'connections':>12}")
+    for name, impl in [("per-link", per_link_session), ("shared", shared_session)]:
+        peers.clear()
+        with tempfile.TemporaryDirectory() as tmp:
+            seconds = asyncio.run(run(impl, base_url, args.files, args.concurrency, tmp))
+        mib = args.files * args.size / 2**20
+        print(f"{name:>12} {seconds:>10.3f} {args.files / seconds:>10.1f} {mib / seconds:>10.1f} {len(peers):>12}")
+
+
+if __name__ == "__main__":
+    main()
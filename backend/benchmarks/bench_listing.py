@@ -0,0 +1,90 @@
+"""
+Compare the scandir listing engine (uncached and cached) with the previous pathlib-based listing.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_listing --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from flexport.listing import LISTING_CACHE, list_directory_page, scan_directory_page
+
+
+def legacy_list_page(target_path: Path, page: int, page_size: int):
+    """The listing loop `/list_files` used before the scandir engine."""
+    all_items = []
+    for item in target_path.iterdir():
+        if not isinstance(item, PermissionError) and item.exists():
+            all_items.append({
+                "name": item.name,
+                "is_file": item.is_file(),
+                "is_dir": item.is_dir(),
+                "size": item.stat().st_size,
+                "owner": item.owner(),
+                "group": item.group(),
+                "date_created": item.stat().st_ctime,
+                "date_modified": item.stat().st_mtime,
+                "permissions": oct(item.stat().st_mode & 0o777),
+                "path": str(item),
+            })
+    sorted_items = sorted(all_items, key=lambda x: (not x["is_dir"], x["name"]))
+    start_idx = (page - 1) * page_size
+    return sorted_items[start_idx:start_idx + page_size], len(sorted_items)
+
+
+def populate(directory: Path, count: int, dir_ratio: float = 0.05):
+    """Create `count` empty entries, a `dir_ratio` share of them directories."""
+    dir_every = max(int(1 / dir_ratio), 1) if dir_ratio else 0
+    for i in range(count):
+        path = directory / f"entry_{i:08d}"
+        if dir_every and i % dir_every == 0:
+            os.mkdir(path)
+        else:
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+
+
+def measure(fn, *args, repeat: int = 3):
+    """Return the best wall time and the peak traced memory of `fn(*args)`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Skip the legacy listing for directories larger than this.")
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'impl':>8} {'seconds':>10} {'peak MiB':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            populate(directory, size)
+            LISTING_CACHE.clear()
+            impls = [("scandir", scan_directory_page), ("cached", list_directory_page)]
+            if args.skip_legacy_above is None or size <= args.skip_legacy_above:
+                impls.append(("legacy", legacy_list_page))
+            for name, fn in impls:
+                seconds, peak = measure(fn, directory, args.page, args.page_size, repeat=args.repeat)
+                print(f"{size:>10} {name:>8} {seconds:>10.3f} {peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+Benchmark FlexPort end to end against local FTP, SFTP and HTTP stand-in servers.
+
+The application runs under uvicorn in this process, next to an aioftp server, an
+asyncssh SFTP server and an aiohttp static server that share one background thread.
+Generated files are then pushed through the real endpoints:
+
+    list_files     GET  /list_files (first page of a directory of --files entries)
+    search_files   GET  /search_files (a tree of --files files; the first, indexing request is reported apart)
+    direct_upload  POST /direct_upload (--files uploads of --size bytes)
+    links          POST /links_upload/ (--files links to the HTTP server)
+    ftp            POST /ftp/download/ (a folder of --files files)
+    sftp           POST /sftp/download/ (the same folder)
+
+--concurrency applies to the request scenarios. Transfers run through the scheduler,
+so they are bounded by SCHEDULER_MAX_CONCURRENT/SCHEDULER_MAX_PER_USER and by
+FTP_PARALLEL_CONNECTIONS/SFTP_CONCURRENT_FILES, which are recorded with the results.
+A transfer is timed from the request until the session event stream reports its
+last session finished.
+
+Requests run as the user running the benchmark: only PAM login is bypassed, by
+overriding the `get_current_user` dependency. The database and search index are
+created in a temporary working directory.
+
+Results are printed (or written to --output) as JSON. With --baseline, the throughput
+of every scenario is compared with an earlier result and the run fails when one
+dropped by more than --tolerance.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_suite --files 200 --size 65536 --concurrency 8 --output bench.json
+"""
+import argparse
+import asyncio
+import getpass
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import aioftp
+import aiohttp
+import asyncssh
+from aiohttp import web
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("list_files", "search_files", "direct_upload", "links", "ftp", "sftp")
+REMOTE_USER = "bench"
+REMOTE_PASSWORD = "bench"
+FINISHED = ("Completed", "Failed")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _SFTPStandIn(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def validate_password(self, username: str, password: str) -> bool:
+        return username == REMOTE_USER and password == REMOTE_PASSWORD
+
+
+def start_stand_ins(root: Path) -> dict:
+    """
+    Serve `root` over FTP, SFTP and HTTP from a background thread; returns the ports.
+    """
+    ports = {"ftp": free_port(), "sftp": free_port(), "http": free_port()}
+    ready = threading.Event()
+
+    async def serve():
+        user = aioftp.User(REMOTE_USER, REMOTE_PASSWORD, base_path=root)
+        await aioftp.Server([user], path_io_factory=aioftp.PathIO).start("127.0.0.1", ports["ftp"])
+
+        await asyncssh.create_server(
+            _SFTPStandIn,
+            "127.0.0.1",
+            ports["sftp"],
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            sftp_factory=lambda channel: asyncssh.SFTPServer(channel, chroot=str(root).encode()),
+        )
+
+        app = web.Application()
+        app.router.add_static("/", root)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", ports["http"]).start()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return ports
+
+
+def populate(directory: Path, files: int, size: int = 0, per_directory: int = 0) -> list:
+    """
+    Create `files` files of `size` bytes, `per_directory` to a subdirectory when set;
+    returns their paths relative to `directory`.
+    """
+    payload = os.urandom(size)
+    names = []
+    for i in range(files):
+        name = f"file_{i:06d}.bin"
+        if per_directory:
+            name = f"dir_{i // per_directory:04d}/{name}"
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(payload)
+        names.append(name)
+    return names
+
+
+def latency_summary(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"p50": None, "p95": None, "max": None}
+
+    def at(share):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000, 2)
+
+    return {"p50": at(0.5), "p95": at(0.95), "max": round(latencies[-1] * 1000, 2)}
+
+
+def tree_bytes(directory: Path) -> int:
+    return sum(entry.stat().st_size for entry in directory.rglob("*") if entry.is_file())
+
+
+class SessionWatcher:
+    """
+    Follow the current user's `/events/sessions` stream and record the final status
+    of every session it reports.
+    """
+
+    def __init__(self, client: aiohttp.ClientSession, base_url: str):
+        self.client = client
+        self.base_url = base_url
+        self.finished = {}
+        self._changed = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        response = await self.client.get(f"{self.base_url}/events/sessions")
+        response.raise_for_status()
+        self._task = asyncio.create_task(self._read(response))
+
+    async def _read(self, response):
+        event = None
+        async with response:
+            async for line in response.content:
+                line = line.decode().rstrip("\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event == "update":
+                    for session in json.loads(line[len("data: "):])["sessions"]:
+                        if session.get("status") in FINISHED:
+                            self.finished[session["session_id"]] = session["status"]
+                            self._changed.set()
+
+    async def wait(self, session_ids: list) -> dict:
+        """
+        Wait until all `session_ids` finished; returns the number of sessions per final status.
+        """
+        while not all(session_id in self.finished for session_id in session_ids):
+            await self._changed.wait()
+            self._changed.clear()
+        statuses = {}
+        for session_id in session_ids:
+            statuses[self.finished[session_id]] = statuses.get(self.finished[session_id], 0) + 1
+        return statuses
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def run_requests(count: int, concurrency: int, request) -> dict:
+    """
+    Call `request(i)` for `i` in range(count), `concurrency` at a time; `request`
+    returns whether it succeeded.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await request(i)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    seconds = time.perf_counter() - start
+    return {
+        "requests": count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "throughput": round(count / seconds, 2),
+        "unit": "requests/s",
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+async def bench_list_files(client, base_url: str, work: Path, args) -> dict:
+    directory = work / "listing"
+    populate(directory, args.files)
+
+    async def request(_):
+        async with client.get(f"{base_url}/list_files", params={"path": str(directory), "page_size": 100}) as r:
+            await r.read()
+            return r.status == 200
+
+    return await run_requests(args.requests, args.concurrency, request)
+
+
+async def bench_search_files(client, base_url: str, work: Path, args) -> dict:
+    directory = work / "search"
+    populate(directory, args.files, per_directory=100)
+    params = {"path": str(directory), "query": "file_0000"}
+
+    async def request(_):
+        async with client.get(f"{base_url}/search_files", params=params) as r:
+            await r.read()
+            return r.status == 200
+
+    start = time.perf_counter()
+    indexed = await request(0)
+    indexing_ms = round((time.perf_counter() - start) * 1000, 2)
+    result = await run_requests(args.requests, args.concurrency, request)
+    result["errors"] += not indexed
+    return {**result, "first_request_ms": indexing_ms}
+
+
+async def bench_direct_upload(client, base_url: str, work: Path, args) -> dict:
+    directory = work / "uploaded"
+    directory.mkdir()
+    payload = os.urandom(args.size)
+
+    async def request(i):
+        form = aiohttp.FormData()
+        form.add_field("current_path", str(directory))
+        form.add_field("file", payload, filename=f"file_{i:06d}.bin", content_type="application/octet-stream")
+        async with client.post(f"{base_url}/direct_upload", data=form) as r:
+            await r.read()
+            return r.status == 200
+
+    result = await run_requests(args.files, args.concurrency, request)
+    result["bytes"] = tree_bytes(directory)
+    result["mib_per_second"] = round(result["bytes"] / 2**20 / result["seconds"], 2)
+    return result
+
+
+async def run_transfer(watcher: SessionWatcher, destination: Path, start_transfer) -> dict:
+    """
+    Time `start_transfer()` (which returns the session ids it created) until all its
+    sessions finished.
+    """
+    destination.mkdir()
+    start = time.perf_counter()
+    session_ids = await start_transfer()
+    statuses = await watcher.wait(session_ids)
+    seconds = time.perf_counter() - start
+    transferred = tree_bytes(destination)
+    return {
+        "sessions": len(session_ids),
+        "statuses": statuses,
+        "errors": len(session_ids) - statuses.get("Completed", 0),
+        "files": sum(1 for entry in destination.rglob("*") if entry.is_file()),
+        "bytes": transferred,
+        "seconds": round(seconds, 4),
+        "throughput": round(transferred / 2**20 / seconds, 2),
+        "unit": "MiB/s",
+    }
+
+
+async def bench_links(client, base_url: str, watcher, work: Path, ports: dict, names: list) -> dict:
+    destination = work / "links"
+
+    async def start_transfer():
+        links = [f"http://127.0.0.1:{ports['http']}/data/{name}" for name in names]
+        async with client.post(f"{base_url}/links_upload/", json={"links": links, "path": str(destination)}) as r:
+            r.raise_for_status()
+            return (await r.json())["session_ids"]
+
+    return await run_transfer(watcher, destination, start_transfer)
+
+
+async def bench_remote(client, base_url: str, watcher, work: Path, ports: dict, protocol: str) -> dict:
+    destination = work / protocol
+
+    async def start_transfer():
+        body = {
+            "host": "127.0.0.1",
+            "port": ports[protocol],
+            "username": REMOTE_USER,
+            "password": REMOTE_PASSWORD,
+            "path": "/data",
+            "local_path": str(destination),
+            "local_user_id": getpass.getuser(),
+        }
+        async with client.post(f"{base_url}/{protocol}/download/", json=body) as r:
+            r.raise_for_status()
+            return [(await r.json())["session_id"]]
+
+    return await run_transfer(watcher, destination, start_transfer)
+
+
+def environment() -> dict:
+    from flexport.scheduler import SCHEDULER
+    from flexport.sftp_ftp import FTP_PARALLEL_CONNECTIONS, SFTP_CONCURRENT_FILES
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scheduler_max_concurrent": SCHEDULER.max_concurrent,
+        "scheduler_max_per_user": SCHEDULER.max_per_user,
+        "ftp_parallel_connections": FTP_PARALLEL_CONNECTIONS,
+        "sftp_concurrent_files": SFTP_CONCURRENT_FILES,
+    }
+
+
+async def run_suite(args, work: Path) -> dict:
+    import uvicorn
+
+    import main
+    from flexport.tokens import get_current_user
+
+    username = getpass.getuser()
+    main.app.dependency_overrides[get_current_user] = lambda: username
+
+    remote = work / "remote"
+    names = populate(remote / "data", args.files, args.size)
+    ports = start_stand_ins(remote)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    results = {}
+    connector = aiohttp.TCPConnector(limit=max(args.concurrency, 1) + 1)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as client:
+        watcher = SessionWatcher(client, base_url)
+        await watcher.start()
+        try:
+            for scenario in args.scenarios:
+                if scenario == "list_files":
+                    results[scenario] = await bench_list_files(client, base_url, work, args)
+                elif scenario == "search_files":
+                    results[scenario] = await bench_search_files(client, base_url, work, args)
+                elif scenario == "direct_upload":
+                    results[scenario] = await bench_direct_upload(client, base_url, work, args)
+                elif scenario == "links":
+                    results[scenario] = await bench_links(client, base_url, watcher, work, ports, names)
+                else:
+                    results[scenario] = await bench_remote(client, base_url, watcher, work, ports, scenario)
+                print(f"{scenario}: {results[scenario]['throughput']} {results[scenario]['unit']}", file=sys.stderr)
+        finally:
+            await watcher.stop()
+
+    server.should_exit = True
+    await serving
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Scenarios whose throughput fell more than `tolerance` below the baseline.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if previous and previous.get("throughput") and result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append({
+                "scenario": scenario,
+                "baseline": previous["throughput"],
+                "current": result["throughput"],
+                "unit": result["unit"],
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200, help="Files per scenario.")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="Bytes per uploaded or transferred file.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight in the request scenarios.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests in the listing and search scenarios.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare throughput with.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed drop in throughput against the baseline, as a share.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    with tempfile.TemporaryDirectory(prefix="flexport-bench-") as tmp:
+        work = Path(tmp)
+        # The database and search index paths are relative to the working directory
+        os.chdir(work)
+        scenarios = asyncio.run(run_suite(args, work))
+        os.chdir(BACKEND_DIR)
+
+    report = {
+        "started_at": started_at,
+        "parameters": {
+            "files": args.files,
+            "size": args.size,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "environment": environment(),
+        "scenarios": scenarios,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(scenarios, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
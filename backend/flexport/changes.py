@@ -0,0 +1,14 @@
+from pathlib import Path
+
+from flexport.listing import invalidate_listing
+from flexport.search_index import SEARCH_INDEX
+
+
+def path_changed(path):
+    """
+    Tell the listing cache and the search index that `path` was written, created or removed.
+    """
+    path = Path(path).resolve()
+    invalidate_listing(path)
+    SEARCH_INDEX.mark_stale(path)
+    SEARCH_INDEX.mark_stale(path.parent)
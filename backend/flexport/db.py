@@ -1,19 +1,156 @@
-import aiosqlite
+import os
+import json
 import time
+import sqlite3
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from dotenv import load_dotenv
+
 from flexport.models import SessionStatus, SessionStatusEnum
+from flexport.metrics import DB_SECONDS, DB_WAIT_SECONDS
 
+load_dotenv()
 DATABASE_PATH = "db.db"
+# Number of long-lived read connections kept open next to the single writer
+DB_READERS = int(os.getenv("DB_READERS", 4))
+# Prepared statements cached per connection
+DB_CACHED_STATEMENTS = 256
+# Session columns returned to callers, in the order of the original schema
+SESSION_COLUMNS = (
+    "session_id, username, type, status, file_name, started_at, "
+    "started_at_unix, uploaded_at, completed_at, details, progress"
+)
+UPLOAD_COLUMNS = "upload_id, username, target, part_path, size, chunk_size, created_at"
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+)
 
 
-async def init_db():
+class Database:
+    """
+    Long-lived aiosqlite connections shared by the whole application: a single
+    writer serialised by a lock and a small pool of readers.
+
+    Connections are opened once at startup with WAL and the other pragmas applied,
+    so requests and transfers neither reconnect nor spawn a thread per query, and
+    each connection's prepared-statement cache stays warm.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, readers: int = DB_READERS):
+        self.path = path
+        self.reader_count = readers
+        self._writer = None
+        self._write_lock = None
+        self._readers = None
+        self._all = []
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path, cached_statements=DB_CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        self._all.append(conn)
+        return conn
+
+    async def open(self):
+        if self._writer is not None:
+            return
+        self._writer = await self._connect()
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            self._readers.put_nowait(await self._connect())
+
+    async def close(self):
+        for conn in self._all:
+            await conn.close()
+        self._all.clear()
+        self._writer = None
+        self._readers = None
+
+    @asynccontextmanager
+    async def write(self):
+        """
+        Hold the writer connection; the transaction commits on exit and rolls back on error.
+        """
+        if self._writer is None:
+            raise RuntimeError("Database is not open")
+        requested = time.perf_counter()
+        async with self._write_lock:
+            acquired = time.perf_counter()
+            DB_WAIT_SECONDS.observe(acquired - requested, operation="write")
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            finally:
+                DB_SECONDS.observe(time.perf_counter() - acquired, operation="write")
+
+    @asynccontextmanager
+    async def read(self):
+        """
+        Borrow a reader connection from the pool.
+        """
+        if self._readers is None:
+            raise RuntimeError("Database is not open")
+        requested = time.perf_counter()
+        conn = await self._readers.get()
+        acquired = time.perf_counter()
+        DB_WAIT_SECONDS.observe(acquired - requested, operation="read")
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+            DB_SECONDS.observe(time.perf_counter() - acquired, operation="read")
+
+
+DB = Database()
+
+_sync_local = threading.local()
+_sync_connections = []
+_sync_connections_lock = threading.Lock()
+
+
+def get_sync_connection() -> sqlite3.Connection:
     """
-    Initialize the database with tables for tokens and sessions.
+    Return this thread's long-lived synchronous connection, opening it on first use.
+
+    Used for reads by code that runs in worker threads (e.g. authentication
+    dependencies). The connection is read-only (`query_only`): writes go through
+    `DB.write()`, so the single writer stays the only one taking the write lock.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
-        # Enable write-ahead logging for better concurrency
-        await conn.execute("PRAGMA journal_mode=WAL;")
-        await conn.execute("PRAGMA synchronous=NORMAL;")
+    conn = getattr(_sync_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("PRAGMA query_only=ON;")
+        _sync_local.conn = conn
+        with _sync_connections_lock:
+            _sync_connections.append(conn)
+    return conn
 
+
+def close_sync_connections():
+    with _sync_connections_lock:
+        for conn in _sync_connections:
+            conn.close()
+        _sync_connections.clear()
+
+
+async def init_db():
+    """
+    Open the shared connections and create the tables for tokens and sessions.
+    """
+    await DB.open()
+    async with DB.write() as conn:
         await conn.execute("""
         CREATE TABLE IF NOT EXISTS tokens (
             token TEXT PRIMARY KEY,
@@ -38,25 +175,98 @@ async def init_db():
         )
         """)
 
+        # Columns added after the original schema
+        async with conn.execute("PRAGMA table_info(sessions)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "job" not in columns:
+            await conn.execute("ALTER TABLE sessions ADD COLUMN job TEXT")
+        if "priority" not in columns:
+            await conn.execute("ALTER TABLE sessions ADD COLUMN priority INTEGER DEFAULT 0")
+        if "bytes_done" not in columns:
+            await conn.execute("ALTER TABLE sessions ADD COLUMN bytes_done INTEGER DEFAULT 0")
+        if "validator" not in columns:
+            await conn.execute("ALTER TABLE sessions ADD COLUMN validator TEXT")
+        if "resume_state" not in columns:
+            await conn.execute("ALTER TABLE sessions ADD COLUMN resume_state TEXT")
+
+        # Last synced state of every file written by FTP/SFTP sync downloads
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_manifest (
+            source TEXT,
+            local_path TEXT,
+            remote_path TEXT,
+            size INTEGER,
+            mtime INTEGER,
+            checksum TEXT,
+            local_size INTEGER,
+            local_mtime_ns INTEGER,
+            synced_at REAL,
+            PRIMARY KEY (source, local_path)
+        )
+        """)
+
+        # Chunked uploads in progress and the chunks each has received
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS uploads (
+            upload_id TEXT PRIMARY KEY,
+            username TEXT,
+            target TEXT,
+            part_path TEXT,
+            size INTEGER,
+            chunk_size INTEGER,
+            created_at REAL
+        )
+        """)
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            upload_id TEXT,
+            chunk INTEGER,
+            PRIMARY KEY (upload_id, chunk)
+        )
+        """)
+
+        # Per-day counts of finished sessions removed by the retention job
+        await conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_archive (
+            username TEXT,
+            type TEXT,
+            status TEXT,
+            day INTEGER,
+            sessions INTEGER,
+            PRIMARY KEY (username, type, status, day)
+        )
+        """)
+
         # Add indexes for faster queries
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions (status);")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username);")
+        # Session history is read per user, newest first; this index also serves plain username lookups
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_username_started "
+            "ON sessions (username, started_at_unix, session_id);"
+        )
+        await conn.execute("DROP INDEX IF EXISTS idx_sessions_username;")
 
-        await conn.commit()
+
+async def close_db():
+    """
+    Close the shared connections at shutdown.
+    """
+    await DB.close()
+    close_sync_connections()
 
 
-async def create_session(session: SessionStatus):
+async def create_session(session: SessionStatus, job: dict | None = None, priority: int = 0):
     """
-    Add a new session to the database.
+    Add a new session to the database, optionally with the scheduler job that runs it.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
+    async with DB.write() as conn:
         await conn.execute(
             """
             INSERT INTO sessions (
                 session_id, username, type, status, file_name, started_at, 
-                started_at_unix, uploaded_at, completed_at, details, progress
+                started_at_unix, uploaded_at, completed_at, details, progress, job, priority
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 session.session_id,
@@ -70,20 +280,65 @@ async def create_session(session: SessionStatus):
                 session.completed_at,
                 session.details,
                 session.progress,
+                json.dumps(job) if job is not None else None,
+                priority,
             ),
         )
-        await conn.commit()
 
 
-async def update_session_status(session_id: str, status: SessionStatusEnum, details: str = "", progress: int = 0):
+async def get_pending_jobs():
     """
-    Update the status, details, and progress of a session.
+    Get `(session_id, username, job, priority)` for unfinished sessions that carry a job,
+    oldest first.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
-        await conn.execute(
+    async with DB.read() as conn:
+        async with conn.execute(
             """
+            SELECT session_id, username, job, priority FROM sessions
+            WHERE status IN (?, ?) AND job IS NOT NULL
+            ORDER BY started_at_unix
+            """,
+            (SessionStatusEnum.queued.value, SessionStatusEnum.processing.value),
+        ) as cursor:
+            return [(row[0], row[1], json.loads(row[2]), row[3] or 0) for row in await cursor.fetchall()]
+
+
+async def fail_orphaned_sessions(details: str):
+    """
+    Mark unfinished sessions without a job as failed; nothing can resume them.
+    """
+    async with DB.write() as conn:
+        await conn.execute(
+            "UPDATE sessions SET status = ?, details = ? WHERE status IN (?, ?) AND job IS NULL",
+            (
+                SessionStatusEnum.failed.value,
+                details,
+                SessionStatusEnum.queued.value,
+                SessionStatusEnum.processing.value,
+            ),
+        )
+
+
+async def clear_session_job(session_id: str):
+    """
+    Drop the stored job (including any credentials) of a session that finished.
+    """
+    async with DB.write() as conn:
+        await conn.execute("UPDATE sessions SET job = NULL WHERE session_id = ?", (session_id,))
+
+
+async def update_session_status(
+    session_id: str, status: SessionStatusEnum, details: str = "", progress: int = 0, clear_job: bool = False
+):
+    """
+    Update the status, details, and progress of a session; with `clear_job`, also
+    drop its stored job, as for a final state.
+    """
+    async with DB.write() as conn:
+        await conn.execute(
+            f"""
             UPDATE sessions
-            SET status = ?, details = ?, progress = ?, completed_at = ?
+            SET status = ?, details = ?, progress = ?, completed_at = ?{", job = NULL" if clear_job else ""}
             WHERE session_id = ?
             """,
             (
@@ -94,31 +349,328 @@ async def update_session_status(session_id: str, status: SessionStatusEnum, deta
                 session_id,
             ),
         )
-        await conn.commit()
 
 
-async def delete_session(session_id: str):
+async def update_sessions_progress(updates: list):
+    """
+    Apply `(session_id, status, progress, bytes_done)` updates in one transaction.
+
+    A `bytes_done` of None leaves the stored checkpoint unchanged. Sessions that
+    already reached a final state are left untouched, so a late progress batch
+    never overwrites a completed or failed status.
+    """
+    async with DB.write() as conn:
+        await conn.executemany(
+            """
+            UPDATE sessions
+            SET status = ?, progress = ?, bytes_done = COALESCE(?, bytes_done)
+            WHERE session_id = ? AND status IN (?, ?)
+            """,
+            [
+                (
+                    status.value,
+                    progress,
+                    bytes_done,
+                    session_id,
+                    SessionStatusEnum.queued.value,
+                    SessionStatusEnum.processing.value,
+                )
+                for session_id, status, progress, bytes_done in updates
+            ],
+        )
+
+
+async def save_session_checkpoint(session_id: str, bytes_done: int, validator: str | None, state: dict | None = None):
+    """
+    Record how many bytes of a resumable transfer are on disk, the validator
+    (ETag or Last-Modified) of the remote content they came from, and the
+    transfer's own resume `state` (e.g. its URL).
+    """
+    async with DB.write() as conn:
+        await conn.execute(
+            "UPDATE sessions SET bytes_done = ?, validator = ?, resume_state = ? WHERE session_id = ?",
+            (bytes_done, validator, json.dumps(state) if state is not None else None, session_id),
+        )
+
+
+async def get_session_checkpoint(session_id: str):
+    """
+    Get `(bytes_done, validator, state)` of a session, or None if it does not exist.
+    """
+    async with DB.read() as conn:
+        async with conn.execute(
+            "SELECT bytes_done, validator, resume_state FROM sessions WHERE session_id = ?", (session_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return (row[0] or 0, row[1], json.loads(row[2]) if row[2] else None) if row else None
+
+
+async def adopt_session_checkpoint(session_id: str, url: str):
+    """
+    Take over the checkpoint of the latest failed session of the same user, type,
+    destination and file that was fetching `url`, so a resubmitted link continues
+    the partial file that session left. Returns the adopted `(bytes_done, validator,
+    state)`, or None if there is none; the old session's checkpoint is cleared.
+    """
+    async with DB.write() as conn:
+        async with conn.execute(
+            """
+            SELECT s.session_id, s.bytes_done, s.validator, s.resume_state FROM sessions s
+            JOIN sessions current ON current.session_id = ?
+            WHERE s.username = current.username AND s.type = current.type
+                AND s.uploaded_at = current.uploaded_at AND s.file_name = current.file_name
+                AND s.session_id != current.session_id AND s.status = ? AND s.validator IS NOT NULL
+            ORDER BY s.started_at_unix DESC
+            """,
+            (session_id, SessionStatusEnum.failed.value),
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for previous_id, bytes_done, validator, state in rows:
+            state = json.loads(state) if state else None
+            if state is None or state.get("url") != url:
+                continue
+            await conn.execute(
+                "UPDATE sessions SET bytes_done = ?, validator = ?, resume_state = ? WHERE session_id = ?",
+                (bytes_done, validator, json.dumps(state), session_id),
+            )
+            await conn.execute(
+                "UPDATE sessions SET validator = NULL, resume_state = NULL WHERE session_id = ?", (previous_id,)
+            )
+            return bytes_done or 0, validator, state
+    return None
+
+
+async def get_sync_manifest(source: str, local_root: str) -> dict:
+    """
+    Get the manifest rows of `source` for files under `local_root`, keyed by local path:
+    `(size, mtime, checksum, local_size, local_mtime_ns)`.
+    """
+    prefix = local_root.rstrip("/") + "/"
+    async with DB.read() as conn:
+        async with conn.execute(
+            """
+            SELECT local_path, size, mtime, checksum, local_size, local_mtime_ns FROM sync_manifest
+            WHERE source = ? AND (local_path = ? OR (local_path >= ? AND local_path < ?))
+            """,
+            (source, local_root, prefix, prefix[:-1] + chr(ord("/") + 1)),
+        ) as cursor:
+            return {row[0]: row[1:] for row in await cursor.fetchall()}
+
+
+async def save_sync_manifest(source: str, entries: list):
+    """
+    Record `(local_path, remote_path, size, mtime, checksum, local_size, local_mtime_ns)`
+    for files just synced from `source`.
+    """
+    if not entries:
+        return
+    synced_at = time.time()
+    async with DB.write() as conn:
+        await conn.executemany(
+            """
+            INSERT OR REPLACE INTO sync_manifest
+            (source, local_path, remote_path, size, mtime, checksum, local_size, local_mtime_ns, synced_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(source, *entry, synced_at) for entry in entries],
+        )
+
+
+async def reserve_upload(upload: dict, max_open: int, max_reserved: int) -> bool:
     """
-    Delete a session by session_id.
+    Record a chunked upload, `upload` having the columns of the uploads table,
+    unless its user would then have more than `max_open` unfinished uploads or more than `max_reserved` bytes
+    reserved across them. Returns whether the upload was recorded; the check and
+    the insert run under the single writer, so concurrent starts cannot overshoot.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
-        await conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        await conn.commit()
+    async with DB.write() as conn:
+        async with conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads WHERE username = ?", (upload["username"],)
+        ) as cursor:
+            count, reserved = await cursor.fetchone()
+        if count >= max_open or reserved + upload["size"] > max_reserved:
+            return False
+        await conn.execute(
+            f"""
+            INSERT INTO uploads ({UPLOAD_COLUMNS})
+            VALUES (:upload_id, :username, :target, :part_path, :size, :chunk_size, :created_at)
+            """,
+            upload,
+        )
+    return True
 
 
-async def get_user_sessions(username: str):
+async def get_upload(upload_id: str) -> dict | None:
     """
-    Get all sessions for a specific user.
+    Get a chunked upload with the sorted indexes of the chunks it received.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
-        async with conn.execute("SELECT * FROM sessions WHERE username = ?", (username,)) as cursor:
+    async with DB.read() as conn:
+        async with conn.execute(f"SELECT {UPLOAD_COLUMNS} FROM uploads WHERE upload_id = ?", (upload_id,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        async with conn.execute(
+            "SELECT chunk FROM upload_chunks WHERE upload_id = ? ORDER BY chunk", (upload_id,)
+        ) as cursor:
+            received = [chunk for (chunk,) in await cursor.fetchall()]
+    return {**dict(zip(UPLOAD_COLUMNS.split(", "), row)), "received": received}
+
+
+async def mark_upload_chunk(upload_id: str, chunk: int):
+    async with DB.write() as conn:
+        await conn.execute("INSERT OR IGNORE INTO upload_chunks (upload_id, chunk) VALUES (?, ?)", (upload_id, chunk))
+
+
+async def delete_upload(upload_id: str):
+    async with DB.write() as conn:
+        await conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (upload_id,))
+        await conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+
+
+async def get_stale_uploads(created_before: float):
+    """
+    Get `(upload_id, part_path)` of uploads started before `created_before`.
+    """
+    async with DB.read() as conn:
+        async with conn.execute(
+            "SELECT upload_id, part_path FROM uploads WHERE created_at < ?", (created_before,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+
+async def delete_session(session_id: str) -> str | None:
+    """
+    Delete a session by session_id; returns its username, or None if there was no such session.
+    """
+    async with DB.write() as conn:
+        async with conn.execute(
+            "DELETE FROM sessions WHERE session_id = ? RETURNING username", (session_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+def _session_filters(username: str, statuses=(), types=(), since: int | None = None, until: int | None = None,
+                     time_column: str = "started_at_unix"):
+    clauses, params = ["username = ?"], [username]
+    if statuses:
+        clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if types:
+        clauses.append(f"type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    if since is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(until)
+    return clauses, params
+
+
+async def query_user_sessions(username: str, statuses=(), types=(), since: int | None = None, until: int | None = None,
+                              before: tuple | None = None, limit: int = 100):
+    """
+    Get a page of a user's sessions, newest first, filtered by status, type and a
+    `[since, until)` range of `started_at_unix`.
+
+    Pages are keyset-paginated on `(started_at_unix, session_id)`: pass the values
+    of the last row of the previous page as `before`.
+    """
+    clauses, params = _session_filters(username, statuses, types, since, until)
+    if before is not None:
+        clauses.append("(started_at_unix, session_id) < (?, ?)")
+        params.extend(before)
+    async with DB.read() as conn:
+        async with conn.execute(
+            f"""
+            SELECT {SESSION_COLUMNS} FROM sessions
+            WHERE {" AND ".join(clauses)}
+            ORDER BY started_at_unix DESC, session_id DESC
+            LIMIT ?
+            """,
+            (*params, limit),
+        ) as cursor:
             return await cursor.fetchall()
 
 
+async def count_user_sessions(username: str, types=(), since: int | None = None, until: int | None = None) -> tuple:
+    """
+    Count a user's sessions per status, and the archived ones, under the same filters
+    as `query_user_sessions`. Returns `(counts by status, archived count)`.
+    """
+    clauses, params = _session_filters(username, (), types, since, until)
+    # Archived sessions are kept per day, so the range applies to whole days
+    archive_clauses, archive_params = _session_filters(username, (), types, since, until, time_column="day")
+    async with DB.read() as conn:
+        async with conn.execute(
+            f"SELECT status, COUNT(*) FROM sessions WHERE {' AND '.join(clauses)} GROUP BY status", params
+        ) as cursor:
+            counts = dict(await cursor.fetchall())
+        async with conn.execute(
+            f"SELECT COALESCE(SUM(sessions), 0) FROM session_archive WHERE {' AND '.join(archive_clauses)}",
+            archive_params,
+        ) as cursor:
+            archived = (await cursor.fetchone())[0]
+    return counts, archived
+
+
+async def archive_finished_sessions(started_before: int, batch: int = 1000):
+    """
+    Fold up to `batch` finished sessions started before `started_before` into the
+    per-day counts of `session_archive` and delete them.
+
+    Returns how many were archived, and the `(directory, file_name)` of downloads
+    whose partial file only archived sessions could have resumed, so the caller
+    can remove it.
+    """
+    async with DB.write() as conn:
+        await conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS archiving (session_id TEXT PRIMARY KEY)
+            """
+        )
+        await conn.execute("DELETE FROM archiving")
+        await conn.execute(
+            """
+            INSERT INTO archiving
+            SELECT session_id FROM sessions
+            WHERE started_at_unix < ? AND status IN (?, ?) AND job IS NULL
+            LIMIT ?
+            """,
+            (started_before, SessionStatusEnum.completed.value, SessionStatusEnum.failed.value, batch),
+        )
+        await conn.execute(
+            """
+            INSERT INTO session_archive (username, type, status, day, sessions)
+            SELECT username, type, status, started_at_unix - started_at_unix % 86400, COUNT(*)
+            FROM sessions WHERE session_id IN (SELECT session_id FROM archiving)
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (username, type, status, day) DO UPDATE SET sessions = sessions + excluded.sessions
+            """
+        )
+        async with conn.execute(
+            """
+            SELECT DISTINCT s.uploaded_at, s.file_name FROM sessions s
+            WHERE s.session_id IN (SELECT session_id FROM archiving) AND s.resume_state IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM sessions other
+                    WHERE other.uploaded_at = s.uploaded_at AND other.file_name = s.file_name
+                        AND other.session_id NOT IN (SELECT session_id FROM archiving)
+                        AND (other.status NOT IN (?, ?) OR other.resume_state IS NOT NULL)
+                )
+            """,
+            (SessionStatusEnum.completed.value, SessionStatusEnum.failed.value),
+        ) as cursor:
+            partials = await cursor.fetchall()
+        cursor = await conn.execute("DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM archiving)")
+        return cursor.rowcount, partials
+
+
 async def get_session(session_id: str):
     """
     Get a session by session_id.
     """
-    async with aiosqlite.connect(DATABASE_PATH) as conn:
-        async with conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)) as cursor:
+    async with DB.read() as conn:
+        async with conn.execute(f"SELECT {SESSION_COLUMNS} FROM sessions WHERE session_id = ?", (session_id,)) as cursor:
             return await cursor.fetchone()
@@ -0,0 +1,135 @@
+import os
+import json
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Seconds between keep-alive comments on an idle event stream
+SESSION_EVENTS_KEEPALIVE = float(os.getenv("SESSION_EVENTS_KEEPALIVE", 15))
+
+
+class _Subscription:
+    def __init__(self, username: str):
+        self.username = username
+        # session_id -> fields changed since the client last received them
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, session_id: str, fields: dict):
+        self.pending.setdefault(session_id, {"session_id": session_id}).update(fields)
+        self.ready.set()
+
+    async def next(self, timeout: float) -> list:
+        """
+        Wait up to `timeout` seconds for changes; returns the coalesced deltas, or
+        an empty list on timeout.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+
+class SessionEvents:
+    """
+    In-process pub/sub hub for session changes.
+
+    Transfer code publishes the fields of a session that changed; each subscriber
+    (one per open event stream) keeps only the latest value of every field per
+    session until its client reads them, so a slow client receives the current
+    state on its next read instead of a backlog of every intermediate update.
+    Publishing a value equal to the last one is a no-op.
+    """
+
+    def __init__(self):
+        # session_id -> (username, last published fields)
+        self._sessions = {}
+        # username -> set of subscriptions
+        self._subscribers = {}
+        self.published = 0
+
+    def track(self, session_id: str, username: str, fields: dict | None = None):
+        """
+        Start routing events of `session_id` to `username`'s subscribers, announcing
+        `fields` (e.g. a new session) when given.
+        """
+        self._sessions[session_id] = (username, {})
+        if fields:
+            self._update(session_id, {name: value for name, value in fields.items() if name != "session_id"})
+
+    def publish(self, session_id: str, **fields):
+        self._update(session_id, fields)
+
+    def _update(self, session_id: str, fields: dict):
+        tracked = self._sessions.get(session_id)
+        if tracked is None:
+            return
+        username, last = tracked
+        changed = {name: value for name, value in fields.items() if last.get(name) != value}
+        if not changed:
+            return
+        last.update(changed)
+        self.published += 1
+        for subscription in self._subscribers.get(username, ()):
+            subscription.push(session_id, changed)
+
+    def finish(self, session_id: str, **fields):
+        """
+        Publish the final state of a session and stop tracking it.
+        """
+        self.publish(session_id, **fields)
+        self._sessions.pop(session_id, None)
+
+    def deleted(self, session_id: str, username: str):
+        self._sessions.pop(session_id, None)
+        for subscription in self._subscribers.get(username, ()):
+            subscription.pending.pop(session_id, None)
+            subscription.push(session_id, {"deleted": True})
+
+    def subscribe(self, username: str) -> _Subscription:
+        subscription = _Subscription(username)
+        self._subscribers.setdefault(username, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: _Subscription):
+        subscribers = self._subscribers.get(subscription.username)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.username]
+
+    def stats(self) -> dict:
+        return {
+            "tracked_sessions": len(self._sessions),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+        }
+
+
+SESSION_EVENTS = SessionEvents()
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_session_events(subscription: _Subscription, snapshot: dict):
+    """
+    Server-sent events for one client: a `snapshot` of its sessions, then an
+    `update` with the changed sessions whenever any changed, and keep-alive
+    comments while idle.
+    """
+    try:
+        yield _sse("snapshot", snapshot)
+        while True:
+            deltas = await subscription.next(SESSION_EVENTS_KEEPALIVE)
+            if deltas:
+                yield _sse("update", {"sessions": deltas})
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        SESSION_EVENTS.unsubscribe(subscription)
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Threads for directory listings, which may read slow (e.g. NFS) directories
+IO_SCAN_WORKERS = int(os.getenv("IO_SCAN_WORKERS", 8))
+# Scans running at once for a single user; further ones wait for that user's slot
+IO_SCAN_PER_USER = int(os.getenv("IO_SCAN_PER_USER", 2))
+# Threads for paged searches, kept apart so slow searches never hold up listings
+IO_SEARCH_WORKERS = int(os.getenv("IO_SEARCH_WORKERS", 4))
+IO_SEARCH_PER_USER = int(os.getenv("IO_SEARCH_PER_USER", 1))
+# Threads for streaming searches, each of which walks a tree for up to its timeout
+IO_STREAM_WORKERS = int(os.getenv("IO_STREAM_WORKERS", 4))
+IO_STREAM_PER_USER = int(os.getenv("IO_STREAM_PER_USER", 1))
+# Threads for quick metadata operations: stat, statvfs, unlink
+IO_QUICK_WORKERS = int(os.getenv("IO_QUICK_WORKERS", 16))
+IO_QUICK_PER_USER = int(os.getenv("IO_QUICK_PER_USER", 8))
+# Recent queue times kept per pool for percentiles
+IO_QUEUE_SAMPLES = 1000
+
+
+class IOPool:
+    """
+    Bounded thread pool for one class of blocking filesystem work.
+
+    Each pool has its own threads, so a handful of long searches on a slow mount
+    cannot hold up quick operations or Starlette's default thread pool (which
+    also serves the blocking token checks). Within a pool, a user runs at most
+    `per_user` calls at once, so one user's scans cannot occupy every thread.
+    Queue time is measured from submission to the start of the call, including
+    the wait for the user's slot.
+    """
+
+    def __init__(self, name: str, workers: int, per_user: int):
+        self.name = name
+        self.workers = workers
+        self.per_user = per_user
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"io-{name}")
+        # username -> [semaphore, calls holding or waiting for it]
+        self._users = {}
+        self._lock = threading.Lock()
+        self._queue_times = deque(maxlen=IO_QUEUE_SAMPLES)
+        self.submitted = 0
+        self.completed = 0
+        self.running = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    def _call(self, submitted: float, fn, *args, **kwargs):
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self.running += 1
+            self._queue_times.append(waited)
+            self.queue_seconds_total += waited
+            self.queue_seconds_max = max(self.queue_seconds_max, waited)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, username: str, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on this pool under `username`'s limit and return its result.
+
+        If the caller is cancelled once the call has started, the user's slot is
+        held until the call finishes, as the thread cannot be interrupted.
+        """
+        submitted = time.monotonic()
+        self.submitted += 1
+        user = self._users.setdefault(username, [asyncio.Semaphore(self.per_user), 0])
+        user[1] += 1
+        try:
+            async with user[0]:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self._executor, partial(self._call, submitted, fn, *args, **kwargs)
+                )
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    await asyncio.wait([future])
+                    raise
+        finally:
+            user[1] -= 1
+            if not user[1]:
+                del self._users[username]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._queue_times)
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+            started = self.completed + self.running
+            return {
+                "workers": self.workers,
+                "per_user": self.per_user,
+                "submitted": self.submitted,
+                "running": self.running,
+                "waiting": sum(calls for _, calls in self._users.values()) - self.running,
+                "completed": self.completed,
+                "queue_ms_avg": round(self.queue_seconds_total / started * 1000, 2) if started else 0.0,
+                "queue_ms_p95": round(p95 * 1000, 2),
+                "queue_ms_max": round(self.queue_seconds_max * 1000, 2),
+                "users": len(self._users),
+            }
+
+
+SCAN_POOL = IOPool("scan", IO_SCAN_WORKERS, IO_SCAN_PER_USER)
+QUICK_POOL = IOPool("quick", IO_QUICK_WORKERS, IO_QUICK_PER_USER)
+SEARCH_POOL = IOPool("search", IO_SEARCH_WORKERS, IO_SEARCH_PER_USER)
+STREAM_POOL = IOPool("stream", IO_STREAM_WORKERS, IO_STREAM_PER_USER)
+IO_POOLS = (SCAN_POOL, QUICK_POOL, SEARCH_POOL, STREAM_POOL)
+
+
+async def stop_io_pools():
+    """
+    Stop the I/O pools, dropping calls that have not started.
+    """
+    for pool in IO_POOLS:
+        pool.shutdown()
@@ -0,0 +1,107 @@
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from flexport.metrics import REMOTE_CONNECT_SECONDS, REMOTE_CONNECTIONS
+
+load_dotenv()
+# Open connections across all hosts
+HTTP_CLIENT_LIMIT = int(os.getenv("HTTP_CLIENT_LIMIT", 100))
+# Open connections to a single host
+HTTP_CLIENT_LIMIT_PER_HOST = int(os.getenv("HTTP_CLIENT_LIMIT_PER_HOST", 16))
+# Seconds a resolved host name is reused
+HTTP_CLIENT_DNS_TTL = int(os.getenv("HTTP_CLIENT_DNS_TTL", 300))
+# Seconds an idle connection is kept open for reuse
+HTTP_CLIENT_KEEPALIVE = float(os.getenv("HTTP_CLIENT_KEEPALIVE", 30))
+# Seconds to wait for a connection from the pool and for the server to accept it
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", 30))
+# Seconds without receiving data before a read fails
+HTTP_CLIENT_READ_TIMEOUT = float(os.getenv("HTTP_CLIENT_READ_TIMEOUT", 60))
+
+
+async def _on_connection_create_start(session, context, params):
+    context.connect_started = time.perf_counter()
+
+
+async def _on_connection_create_end(session, context, params):
+    REMOTE_CONNECT_SECONDS.observe(time.perf_counter() - context.connect_started, protocol="http")
+    REMOTE_CONNECTIONS.inc(protocol="http")
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    """
+    Record new (not reused) connections and the time taken to open them.
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    return trace_config
+
+
+class HttpClient:
+    """
+    Application-wide aiohttp session for outgoing HTTP requests.
+
+    Sharing one session keeps connections alive between requests, caches DNS
+    lookups and reuses TLS sessions; its connector caps the number of sockets
+    open in total and per host, so a large batch of links to one server queues
+    for connections instead of opening hundreds of them.
+    """
+
+    def __init__(self, limit: int = HTTP_CLIENT_LIMIT, limit_per_host: int = HTTP_CLIENT_LIMIT_PER_HOST):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        The shared session, created on first use inside the running event loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=HTTP_CLIENT_DNS_TTL,
+                keepalive_timeout=HTTP_CLIENT_KEEPALIVE,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=HTTP_CLIENT_CONNECT_TIMEOUT,
+                sock_read=HTTP_CLIENT_READ_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trace_configs=[_trace_config()]
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        return {
+            "open": self._session is not None and not self._session.closed,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+        }
+
+
+HTTP_CLIENT = HttpClient()
+
+
+async def start_http_client():
+    """
+    Create the shared HTTP session at startup.
+    """
+    HTTP_CLIENT.session
+
+
+async def stop_http_client():
+    """
+    Close the shared HTTP session and its pooled connections.
+    """
+    await HTTP_CLIENT.close()
@@ -0,0 +1,338 @@
+import os
+import asyncio
+from pathlib import Path
+
+import aiohttp
+import aiofiles
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.models import SessionStatusEnum
+from flexport.db import (
+    update_session_status,
+    save_session_checkpoint,
+    get_session_checkpoint,
+    adopt_session_checkpoint,
+)
+from flexport.progress import PROGRESS
+from flexport.http_client import HTTP_CLIENT
+from flexport.changes import path_changed
+from flexport.metrics import TRANSFER_BYTES
+
+load_dotenv()
+LINK_CHUNK_SIZE = 1024 * 64  # 64KB chunks
+# Attempts per link before the session is marked failed
+LINK_MAX_ATTEMPTS = int(os.getenv("LINK_MAX_ATTEMPTS", 6))
+# Exponential backoff between attempts: base * 2**attempt, capped
+LINK_BACKOFF_BASE_SECONDS = float(os.getenv("LINK_BACKOFF_BASE_SECONDS", 1))
+LINK_BACKOFF_MAX_SECONDS = float(os.getenv("LINK_BACKOFF_MAX_SECONDS", 60))
+# Files at least this large are fetched over several Range connections when the server allows it
+LINK_SEGMENTED_MIN_SIZE = int(os.getenv("LINK_SEGMENTED_MIN_SIZE", 64 * 1024 * 1024))
+# Concurrent connections per segmented download
+LINK_SEGMENTS = int(os.getenv("LINK_SEGMENTS", 8))
+LINK_SEGMENT_CHUNK_SIZE = 1024 * 1024  # 1MB writes per segment
+# How often a segmented download checkpoints the progress of its segments
+LINK_CHECKPOINT_SECONDS = float(os.getenv("LINK_CHECKPOINT_SECONDS", 5))
+PART_SUFFIX = ".part"
+
+
+class PermanentLinkError(Exception):
+    """A failure that retrying the request will not fix."""
+
+
+class LinkCancelled(Exception):
+    """The session was deleted while downloading."""
+
+
+class RangesNotHonoured(Exception):
+    """The server answered a segment request with something other than the requested range."""
+
+
+def _validator(headers) -> str | None:
+    """
+    Pick the validator to send in `If-Range`: a strong ETag, else Last-Modified.
+    """
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _total_size(response, offset: int) -> int:
+    if response.status == 206:
+        content_range = response.headers.get("Content-Range", "")
+        total = content_range.rpartition("/")[2]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length and length.isdigit() else 0
+
+
+async def _fetch(session, url: str, part_path: Path, session_id: str, validator: str | None):
+    """
+    Make one attempt at the remaining bytes of `url`, appending them to `part_path`.
+
+    Resumes from the current size of the partial file with `Range`; `If-Range`
+    makes the server send the whole file instead if it changed since `validator`.
+    """
+    offset = part_path.stat().st_size if part_path.exists() and validator else 0
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    async with session.get(url, headers=headers) as response:
+        if response.status == 416 and offset:
+            # Nothing left to fetch: the partial file already holds everything
+            return
+        if response.status >= 500 or response.status == 429:
+            raise aiohttp.ClientResponseError(
+                response.request_info, response.history, status=response.status, message=response.reason or ""
+            )
+        if response.status not in (200, 206):
+            raise PermanentLinkError(f"Failed to download file. Status: {response.status}")
+
+        if response.status == 200:
+            offset = 0
+        validator = _validator(response.headers)
+        total_size = _total_size(response, offset)
+        await save_session_checkpoint(session_id, offset, validator, {"url": url})
+
+        downloaded_size = offset
+        async with aiofiles.open(part_path, mode="ab" if offset else "wb") as f:
+            async for chunk in response.content.iter_chunked(LINK_CHUNK_SIZE):
+                if PROGRESS.is_cancelled(session_id):
+                    raise LinkCancelled()
+                await f.write(chunk)
+                downloaded_size += len(chunk)
+                TRANSFER_BYTES.inc(len(chunk), protocol="http")
+
+                # Update progress if we know the total size
+                if total_size > 0:
+                    PROGRESS.report(session_id, (downloaded_size / total_size) * 100, bytes_done=downloaded_size)
+
+        if total_size and downloaded_size < total_size:
+            raise aiohttp.ClientPayloadError(f"Connection closed after {downloaded_size} of {total_size} bytes")
+
+
+async def _backoff(url: str, attempt: int, error: Exception):
+    delay = min(LINK_BACKOFF_BASE_SECONDS * 2 ** attempt, LINK_BACKOFF_MAX_SECONDS)
+    logger.logger.warning(f"Retrying {url} in {delay:.0f}s after error: {error}")
+    await asyncio.sleep(delay)
+
+
+async def _download_stream(session, url: str, part_path: Path, session_id: str):
+    """
+    Fetch `url` over a single connection, resuming from the checkpoint on every retry.
+    """
+    for attempt in range(LINK_MAX_ATTEMPTS):
+        checkpoint = await get_session_checkpoint(session_id)
+        validator = checkpoint[1] if checkpoint else None
+        try:
+            await _fetch(session, url, part_path, session_id, validator)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == LINK_MAX_ATTEMPTS - 1:
+                raise
+            await _backoff(url, attempt, e)
+
+
+async def _probe(session, url: str):
+    """
+    Return `(size, validator)` if `url` can be fetched in segments, otherwise None.
+
+    Segmenting needs a known size, `Accept-Ranges: bytes` and a validator, so
+    every segment can be pinned to the same version of the file with `If-Range`.
+    """
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            if response.status != 200:
+                return None
+            if response.headers.get("Accept-Ranges", "").lower() != "bytes":
+                return None
+            length = response.headers.get("Content-Length", "")
+            validator = _validator(response.headers)
+            if not length.isdigit() or validator is None:
+                return None
+            return int(length), validator
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+
+def _preallocate(part_path: Path, size: int) -> int:
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not supported by every platform and filesystem; a sparse file works too
+        os.ftruncate(fd, size)
+    return fd
+
+
+async def _fetch_segment(session, url: str, fd: int, segment: list, validator: str, on_progress):
+    """
+    Fetch the byte range `segment` = [position, end] into `fd` with `os.pwrite`,
+    advancing `segment[0]` as bytes land so a retry continues where it stopped.
+    """
+    for attempt in range(LINK_MAX_ATTEMPTS):
+        position, end = segment
+        if position > end:
+            return
+        headers = {"Range": f"bytes={position}-{end}", "If-Range": validator}
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status >= 500 or response.status == 429:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status, message=response.reason or ""
+                    )
+                if response.status != 206:
+                    raise RangesNotHonoured(f"Range request answered with status {response.status}")
+                async for chunk in response.content.iter_chunked(LINK_SEGMENT_CHUNK_SIZE):
+                    chunk = chunk[:end + 1 - segment[0]]
+                    await asyncio.to_thread(os.pwrite, fd, chunk, segment[0])
+                    segment[0] += len(chunk)
+                    TRANSFER_BYTES.inc(len(chunk), protocol="http")
+                    on_progress()
+            if segment[0] <= end:
+                raise aiohttp.ClientPayloadError(f"Segment closed at byte {segment[0]} of {end}")
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == LINK_MAX_ATTEMPTS - 1:
+                raise
+            await _backoff(url, attempt, e)
+
+
+async def _download_segmented(session, url: str, part_path: Path, session_id: str, checkpoint=None) -> bool:
+    """
+    Fetch `url` over LINK_SEGMENTS concurrent Range connections into a preallocated
+    partial file. Returns False, having written nothing, when the file is smaller
+    than LINK_SEGMENTED_MIN_SIZE or the server does not support ranges.
+
+    The `[position, end]` of every segment is checkpointed with the validator
+    every LINK_CHECKPOINT_SECONDS; given such a `checkpoint`, the partial file is
+    reopened as is and each segment continues from its position.
+    """
+    state = checkpoint[2] if checkpoint else None
+    if state and "segments" in state:
+        size, validator, segments = state["size"], checkpoint[1], state["segments"]
+        fd = os.open(part_path, os.O_WRONLY)
+    else:
+        probe = await _probe(session, url)
+        if probe is None or probe[0] < LINK_SEGMENTED_MIN_SIZE:
+            return False
+        size, validator = probe
+        count = max(1, min(LINK_SEGMENTS, size // LINK_SEGMENT_CHUNK_SIZE))
+        bounds = [size * i // count for i in range(count + 1)]
+        segments = [[bounds[i], bounds[i + 1] - 1] for i in range(count)]
+        fd = _preallocate(part_path, size)
+
+    def remaining() -> int:
+        return sum(end + 1 - position for position, end in segments)
+
+    async def save_checkpoint():
+        # Positions only advance once their bytes are written, so a checkpoint never overstates
+        await save_session_checkpoint(
+            session_id, size - remaining(), validator, {"url": url, "size": size, "segments": segments}
+        )
+
+    async def keep_checkpoint():
+        while True:
+            await asyncio.sleep(LINK_CHECKPOINT_SECONDS)
+            await save_checkpoint()
+
+    def on_progress():
+        if PROGRESS.is_cancelled(session_id):
+            raise LinkCancelled()
+        done = size - remaining()
+        PROGRESS.report(session_id, done / size * 100, bytes_done=done)
+
+    await save_checkpoint()
+    tasks = [
+        asyncio.ensure_future(_fetch_segment(session, url, fd, segment, validator, on_progress))
+        for segment in segments
+    ]
+    saver = asyncio.ensure_future(keep_checkpoint())
+    fallback = False
+    try:
+        await asyncio.gather(*tasks)
+    except RangesNotHonoured as e:
+        logger.logger.warning(f"Falling back to a single connection for {url}: {e}")
+        fallback = True
+        return False
+    finally:
+        for task in tasks + [saver]:
+            task.cancel()
+        await asyncio.gather(*tasks, saver, return_exceptions=True)
+        os.close(fd)
+        if fallback:
+            # The single connection starts over, whatever the segments wrote
+            await save_session_checkpoint(session_id, 0, None)
+        else:
+            await save_checkpoint()
+    return True
+
+
+async def download_file_from_link(url, destination, session_id):
+    """
+    Download a file from a URL to a destination, resuming after failures and restarts.
+
+    Bytes go to `<name>.part`; the offset and the remote validator are
+    checkpointed in the session so retries (with exponential backoff) and a
+    restarted service continue where they stopped. Large files on servers that
+    support ranges are fetched in concurrent segments instead. The partial file
+    is renamed into place once complete.
+
+    When the retries run out on a transient error, the partial file and the
+    checkpoint are kept and the session fails as resumable: submitting the same
+    link to the same directory again continues from there. The partial file is
+    only removed on cancellation or a permanent error.
+    """
+    # Get the file name from the URL
+    file_name = Path(url).name
+    file_path = Path(destination) / file_name
+    part_path = file_path.with_name(file_path.name + PART_SUFFIX)
+
+    await update_session_status(session_id, SessionStatusEnum.processing)
+
+    try:
+        session = HTTP_CLIENT.session
+        checkpoint = await get_session_checkpoint(session_id)
+        if checkpoint is not None and not checkpoint[1] and part_path.exists():
+            checkpoint = await adopt_session_checkpoint(session_id, url) or checkpoint
+        resumable = checkpoint is not None and checkpoint[1] and part_path.exists()
+        segmented = resumable and checkpoint[2] is not None and "segments" in checkpoint[2]
+        if (resumable and not segmented) or not await _download_segmented(
+            session, url, part_path, session_id, checkpoint if segmented else None
+        ):
+            await _download_stream(session, url, part_path, session_id)
+
+        os.replace(part_path, file_path)
+        path_changed(file_path)
+        await PROGRESS.finish(session_id, status=SessionStatusEnum.completed, progress=100)
+    except LinkCancelled:
+        # If session was removed, remove the partial file
+        part_path.unlink(missing_ok=True)
+        await PROGRESS.finish(session_id, status=SessionStatusEnum.failed, details="Cancelled")
+    except PermanentLinkError as e:
+        part_path.unlink(missing_ok=True)
+        await PROGRESS.finish(
+            session_id,
+            status=SessionStatusEnum.failed,
+            details=f"Error downloading file: {str(e)}"
+        )
+    except Exception as e:
+        # A transient failure outlasted the retries: keep what can be resumed
+        checkpoint = await get_session_checkpoint(session_id)
+        kept = 0
+        if part_path.exists() and checkpoint and checkpoint[1]:
+            # A segmented file is preallocated: only its checkpoint knows how much is there
+            segmented = checkpoint[2] is not None and "segments" in checkpoint[2]
+            kept = checkpoint[0] if segmented else part_path.stat().st_size
+        if not kept:
+            part_path.unlink(missing_ok=True)
+        await PROGRESS.finish(
+            session_id,
+            status=SessionStatusEnum.failed,
+            details=f"Error downloading file: {str(e)}"
+            + (f" (resumable: {kept} bytes kept, submit the link again to continue)" if kept else ""),
+        )
@@ -0,0 +1,340 @@
+import os
+import stat
+import heapq
+import itertools
+from bisect import bisect_left, bisect_right, insort
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from grp import getgrgid
+from operator import itemgetter
+from pathlib import Path
+from pwd import getpwuid
+
+from dotenv import load_dotenv
+
+from flexport.pagination import directory_fingerprint
+from flexport.metrics import DIRECTORY_SCAN_SECONDS
+
+load_dotenv()
+OWNER_CACHE_SIZE = 4096
+# Upper bound on the number of entries held across all cached directory snapshots
+LISTING_CACHE_MAX_RECORDS = int(os.getenv("LISTING_CACHE_MAX_RECORDS", 500_000))
+# Directories sorted directories-first, then by name
+SORT_DIRS_FIRST_NAME = "dirs_first_name"
+
+_sort_key = itemgetter(0, 1)
+
+
+@lru_cache(maxsize=OWNER_CACHE_SIZE)
+def uid_to_name(uid: int) -> str:
+    """
+    Resolve a uid to a user name, falling back to the numeric id.
+    """
+    try:
+        return getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+@lru_cache(maxsize=OWNER_CACHE_SIZE)
+def gid_to_name(gid: int) -> str:
+    """
+    Resolve a gid to a group name, falling back to the numeric id.
+    """
+    try:
+        return getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def scan_entries(directory):
+    """
+    Yield a `(not is_dir, name, path, stat)` record for every entry in `directory`.
+
+    Each entry costs a single `lstat`; symlinks are followed with one extra `stat`
+    and dangling links are skipped. Records sort directories first, then by name.
+    """
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISLNK(st.st_mode):
+                    st = os.stat(entry.path)
+            except OSError:
+                continue
+            yield (not stat.S_ISDIR(st.st_mode), entry.name, entry.path, st)
+
+
+def scan_entry(directory: str, name: str):
+    """
+    Return the record for a single entry of `directory`, or None if it no longer exists.
+    """
+    path = os.path.join(directory, name)
+    try:
+        st = os.lstat(path)
+        if stat.S_ISLNK(st.st_mode):
+            st = os.stat(path)
+    except OSError:
+        return None
+    return (not stat.S_ISDIR(st.st_mode), name, path, st)
+
+
+def format_entry(record) -> dict:
+    """
+    Build the API representation of a listing record.
+    """
+    _, name, path, st = record
+    return {
+        "name": name,
+        "is_file": stat.S_ISREG(st.st_mode),
+        "is_dir": stat.S_ISDIR(st.st_mode),
+        "size": st.st_size,
+        "owner": uid_to_name(st.st_uid),
+        "group": gid_to_name(st.st_gid),
+        "date_created": st.st_ctime,
+        "date_modified": st.st_mtime,
+        "permissions": oct(st.st_mode & 0o777),
+        "path": path,
+    }
+
+
+class ListingCache:
+    """
+    LRU cache of sorted directory snapshots keyed by (resolved path, st_mtime_ns, sort key).
+
+    The cache is bounded by the total number of records it holds; a directory larger
+    than the whole budget is never cached. Writers that change a directory's contents
+    without necessarily bumping its mtime (uploads, deletions, transfers) call
+    `invalidate` so the next listing rescans.
+    """
+
+    def __init__(self, max_records: int = LISTING_CACHE_MAX_RECORDS):
+        self.max_records = max_records
+        self.hits = 0
+        self.misses = 0
+        self._records = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        # Called with the path of every directory stored, e.g. to start watching it
+        self.on_store = None
+
+    def get(self, path: str, mtime_ns: int, sort: str = SORT_DIRS_FIRST_NAME):
+        """
+        Return the cached snapshot for `path` if it was taken at `mtime_ns`, else None.
+        """
+        with self._lock:
+            key = (path, sort)
+            cached = self._snapshots.get(key)
+            if cached is None or cached[0] != mtime_ns:
+                self.misses += 1
+                return None
+            self._snapshots.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, path: str, mtime_ns: int, records: list, sort: str = SORT_DIRS_FIRST_NAME):
+        """
+        Store a sorted snapshot, evicting least recently used snapshots to stay in budget.
+        """
+        if len(records) > self.max_records:
+            return
+        with self._lock:
+            key = (path, sort)
+            previous = self._snapshots.pop(key, None)
+            if previous is not None:
+                self._records -= len(previous[1])
+            self._snapshots[key] = (mtime_ns, records)
+            self._records += len(records)
+            while self._records > self.max_records:
+                _, (_, evicted) = self._snapshots.popitem(last=False)
+                self._records -= len(evicted)
+        if self.on_store is not None:
+            self.on_store(path)
+
+    def apply_delta(self, path: str, names, mtime_ns: int):
+        """
+        Patch cached snapshots of the directory at `path` for the changed entry `names`.
+
+        Each name is re-stat'ed and replaced, removed or inserted in sort order in place,
+        so a burst of changes to one entry of a large directory costs a binary search
+        each instead of a copy of the snapshot. `mtime_ns` is the directory's mtime
+        observed when the batch of changes was taken: the snapshot is re-keyed to it
+        so it keeps serving hits, unless the directory changed again since, in which
+        case it is dropped rather than let a change outside the batch go unnoticed.
+        Readers slice snapshots under the cache lock, so they never see a half-applied
+        change.
+        """
+        with self._lock:
+            if not any(key[0] == path for key in self._snapshots):
+                return
+        changed = [scan_entry(path, name) for name in names]
+        try:
+            moved = os.stat(path).st_mtime_ns != mtime_ns
+        except OSError:
+            moved = True
+        if moved:
+            self.invalidate(path)
+            return
+        with self._lock:
+            for key in [key for key in self._snapshots if key[0] == path]:
+                _, records = self._snapshots[key]
+                before = len(records)
+                for name, record in zip(names, changed):
+                    for is_file in (False, True):
+                        idx = bisect_left(records, (is_file, name), key=_sort_key)
+                        if idx < len(records) and _sort_key(records[idx]) == (is_file, name):
+                            if record is not None and _sort_key(record) == (is_file, name):
+                                records[idx] = record
+                                record = None
+                            else:
+                                del records[idx]
+                    if record is not None:
+                        insort(records, record, key=_sort_key)
+                self._snapshots[key] = (mtime_ns, records)
+                self._records += len(records) - before
+            while self._records > self.max_records:
+                _, (_, evicted) = self._snapshots.popitem(last=False)
+                self._records -= len(evicted)
+
+    def invalidate(self, path):
+        """
+        Drop every snapshot of the directory at `path`.
+        """
+        resolved = str(Path(path).resolve())
+        with self._lock:
+            for key in [key for key in self._snapshots if key[0] == resolved]:
+                _, records = self._snapshots.pop(key)
+                self._records -= len(records)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._records = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "directories": len(self._snapshots),
+                "records": self._records,
+                "max_records": self.max_records,
+            }
+
+
+LISTING_CACHE = ListingCache()
+
+
+def invalidate_listing(path):
+    """
+    Invalidate cached listings affected by a write to `path`: the path itself and its parent.
+    """
+    path = Path(path)
+    LISTING_CACHE.invalidate(path)
+    LISTING_CACHE.invalidate(path.parent)
+
+
+def _load_directory(directory):
+    """
+    Return `(stat, records, rest)` for `directory`.
+
+    Normally `records` is the sorted snapshot, from the cache when the directory's
+    mtime is unchanged, and `rest` is None. For a directory too large to be cached,
+    `records` holds the (unsorted) entries scanned before giving up and `rest` is
+    the still open scan over the remaining ones, so callers can finish it instead
+    of reading the directory again.
+    """
+    path = str(Path(directory).resolve())
+    st = os.stat(path)
+    records = LISTING_CACHE.get(path, st.st_mtime_ns)
+    if records is not None:
+        return st, records, None
+
+    records = []
+    entries = scan_entries(path)
+    with DIRECTORY_SCAN_SECONDS.time():
+        for record in entries:
+            records.append(record)
+            if len(records) > LISTING_CACHE.max_records:
+                return st, records, entries
+        records.sort(key=_sort_key)
+    LISTING_CACHE.put(path, st.st_mtime_ns, records)
+    return st, records, None
+
+
+def _scan_top(records, limit: int, after=None):
+    """
+    Consume the scan `records`, keeping only the `limit` smallest records sorting after `after`.
+
+    Returns `(records, total_items)` where `total_items` counts every scanned record.
+    """
+    total_items = 0
+
+    def counted(records):
+        nonlocal total_items
+        for record in records:
+            total_items += 1
+            if after is None or _sort_key(record) > after:
+                yield record
+
+    with DIRECTORY_SCAN_SECONDS.time():
+        head = heapq.nsmallest(limit, counted(records), key=_sort_key)
+    return head, total_items
+
+
+def scan_directory_page(directory, page: int, page_size: int):
+    """
+    Return `(items, total_items)` for one page of a directory listing without caching.
+
+    Only the smallest `page * page_size` records are kept while scanning and only
+    the requested page is formatted, so memory stays bounded by the page depth.
+    """
+    head, total_items = _scan_top(scan_entries(directory), page * page_size)
+    page_records = head[(page - 1) * page_size:]
+    return [format_entry(record) for record in page_records], total_items
+
+
+def list_directory_page(directory, page: int, page_size: int):
+    """
+    Return `(items, total_items, next_key, fingerprint)` for one page of a directory listing.
+
+    Pages of an unchanged directory are slices of the cached snapshot; directories
+    too large for the cache fall back to a bounded top-k selection over the same
+    scan. `next_key` is the sort key to resume after, or None on the last page.
+    """
+    st, records, rest = _load_directory(directory)
+    start_idx = (page - 1) * page_size
+    if rest is not None:
+        head, total_items = _scan_top(itertools.chain(records, rest), page * page_size + 1)
+        page_records = head[start_idx:start_idx + page_size]
+        has_more = len(head) > page * page_size
+    else:
+        with LISTING_CACHE._lock:
+            total_items = len(records)
+            page_records = records[start_idx:start_idx + page_size]
+        has_more = start_idx + page_size < total_items
+    next_key = _sort_key(page_records[-1]) if has_more and page_records else None
+    return [format_entry(record) for record in page_records], total_items, next_key, directory_fingerprint(st)
+
+
+def list_directory_after(directory, after, page_size: int):
+    """
+    Return `(items, total_items, next_key, fingerprint)` for the page following sort key `after`.
+
+    Resuming from a cached snapshot is a binary search plus a slice, so deep pages cost
+    the same as the first one and items added before `after` never shift the page.
+    """
+    st, records, rest = _load_directory(directory)
+    if rest is not None:
+        head, total_items = _scan_top(itertools.chain(records, rest), page_size + 1, after)
+        page_records = head[:page_size]
+        has_more = len(head) > page_size
+    else:
+        with LISTING_CACHE._lock:
+            total_items = len(records)
+            start_idx = bisect_right(records, after, key=_sort_key)
+            page_records = records[start_idx:start_idx + page_size]
+        has_more = start_idx + page_size < total_items
+    next_key = _sort_key(page_records[-1]) if has_more and page_records else None
+    return [format_entry(record) for record in page_records], total_items, next_key, directory_fingerprint(st)
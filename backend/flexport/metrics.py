@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Seconds between event-loop lag probes
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 1))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    @abstractmethod
+    def samples(self):
+        """
+        Return `(sample name, formatted labels, value)` for every series of the metric.
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonic count, per combination of label values; with `collect`, read from a
+    counter the application keeps itself, only when scraped.
+
+    `collect` returns a number, or for labelled counters a mapping of label-value
+    tuples to numbers.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), collect=None):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self._collect is None:
+            with self._lock:
+                values = list(self._values.items())
+        else:
+            collected = self._collect()
+            values = list(collected.items()) if isinstance(collected, dict) else [((), collected)]
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down; with `collect`, read from the application only when scraped.
+
+    `collect` returns a number, or for labelled gauges a mapping of label-value
+    tuples to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), collect=None):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self._collect is None:
+            values = dict(self._values)
+        else:
+            collected = self._collect()
+            values = collected if isinstance(collected, dict) else {(): collected}
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (usually seconds) over fixed buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a `with` block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                samples.append((f"{self.name}_bucket", _format_labels(self.labels, key, le), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labels, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labels, key), cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "flexport_http_request_duration_seconds",
+    "Time from receiving a request until the response starts, per route.",
+    ("method", "route", "status"),
+)
+TRANSFER_BYTES = Counter(
+    "flexport_transfer_bytes_total", "Bytes moved by transfers and uploads, per protocol.", ("protocol",)
+)
+TRANSFERS = Counter("flexport_transfers_total", "Finished transfers, per final status.", ("status",))
+DB_SECONDS = Histogram(
+    "flexport_db_seconds",
+    "Time a database connection was held for reads, and for writes including the commit.",
+    ("operation",),
+)
+DB_WAIT_SECONDS = Histogram(
+    "flexport_db_wait_seconds", "Time spent waiting for a database connection.", ("operation",)
+)
+ACCESS_CHECK_SECONDS = Histogram("flexport_access_check_seconds", "Duration of has_access_to_path.")
+DIRECTORY_SCAN_SECONDS = Histogram(
+    "flexport_directory_scan_seconds", "Duration of uncached directory scans for listings."
+)
+REMOTE_CONNECT_SECONDS = Histogram(
+    "flexport_remote_connect_seconds",
+    "Time to connect and log in to an FTP/SFTP server, or to open an HTTP connection.",
+    ("protocol",),
+)
+REMOTE_CONNECTIONS = Counter(
+    "flexport_remote_connections_total", "Remote connections opened, per protocol.", ("protocol",)
+)
+LOOP_LAG_SECONDS = Histogram(
+    "flexport_event_loop_lag_seconds",
+    "How late the event loop ran a timer, sampled every METRICS_LOOP_LAG_INTERVAL seconds.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing HTTP_REQUEST_SECONDS. Requests are labelled with the
+    route's path template, so path parameters do not multiply the series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        observed = False
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                route = scope.get("route")
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    route=route.path if route is not None else "unmatched",
+                    status=message["status"],
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+async def _loop_lag_probe():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + METRICS_LOOP_LAG_INTERVAL
+        await asyncio.sleep(METRICS_LOOP_LAG_INTERVAL)
+        LOOP_LAG_SECONDS.observe(max(loop.time() - expected, 0))
+
+
+_lag_task = None
+
+
+async def start_loop_lag_probe():
+    """
+    Start sampling event-loop lag in the background.
+    """
+    global _lag_task
+    _lag_task = asyncio.get_running_loop().create_task(_loop_lag_probe())
+
+
+async def stop_loop_lag_probe():
+    if _lag_task is not None:
+        _lag_task.cancel()
@@ -44,8 +44,19 @@ class SFTPRequest(BaseModel):
     local_user_id: str
     port: int = 21
     path: str = "/"  # Default to root directory
+    priority: int = 0  # Higher runs sooner among the user's queued transfers
+    sync: bool = False  # Only transfer files that are new or changed since the last sync
+    checksum: bool = False  # With sync, also compare checksums computed on the server
+
+
+class UploadInitBody(BaseModel):
+    current_path: str
+    file_name: str
+    size: int
+    chunk_size: int | None = None  # Bytes per chunk; the server picks one if omitted
 
 
 class LinksUploadBody(BaseModel):
     links: list[str]
     path: str
+    priority: int = 0
@@ -0,0 +1,51 @@
+import base64
+import hashlib
+import json
+
+
+def encode_cursor(key, fingerprint: str) -> str:
+    """
+    Encode the sort key of the last returned item and a result-set fingerprint
+    into an opaque, URL-safe continuation cursor.
+    """
+    payload = json.dumps({"k": list(key), "f": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_types: tuple):
+    """
+    Decode a cursor produced by `encode_cursor` into `(key, fingerprint)`.
+
+    Raises ValueError for malformed cursors or keys not shaped like `key_types`.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, fingerprint = tuple(payload["k"]), str(payload["f"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    if len(key) != len(key_types) or not all(isinstance(v, t) for v, t in zip(key, key_types)):
+        raise ValueError("Invalid cursor")
+    return key, fingerprint
+
+
+def directory_fingerprint(st) -> str:
+    """
+    Identify a directory's contents by inode and modification time.
+    """
+    return f"{st.st_ino}:{st.st_mtime_ns}"
+
+
+def search_fingerprint(root: str, query: str) -> str:
+    """
+    Identify a search result set by its root and query.
+    """
+    return hashlib.sha1(f"{root}\0{query}".encode()).hexdigest()[:16]
+
+
+def sessions_fingerprint(username: str, statuses, types, since, until) -> str:
+    """
+    Identify a filtered session history by its user and filters.
+    """
+    filters = json.dumps([username, sorted(statuses), sorted(types), since, until])
+    return hashlib.sha1(filters.encode()).hexdigest()[:16]
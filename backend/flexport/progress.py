@@ -0,0 +1,147 @@
+import os
+import time
+import asyncio
+
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.models import SessionStatusEnum
+from flexport.db import update_session_status, update_sessions_progress
+from flexport.events import SESSION_EVENTS
+from flexport.metrics import TRANSFERS
+
+load_dotenv()
+# Dirty sessions are flushed at most this often
+PROGRESS_FLUSH_MS = int(os.getenv("PROGRESS_FLUSH_MS", 1000))
+# A session whose progress advanced this many percent since its last write is flushed early
+PROGRESS_FLUSH_PERCENT = int(os.getenv("PROGRESS_FLUSH_PERCENT", 10))
+
+
+class ProgressWriter:
+    """
+    In-memory aggregator of transfer progress.
+
+    Transfers report progress as often as they like; dirty sessions are written
+    together in a single transaction every PROGRESS_FLUSH_MS, or as soon as one of
+    them advanced PROGRESS_FLUSH_PERCENT since its last write. Final states bypass the batching and are
+    written immediately. Cancellation is an in-process flag, so transfers no
+    longer re-read their session row for every chunk.
+    """
+
+    def __init__(self, interval_ms: int = PROGRESS_FLUSH_MS, flush_percent: int = PROGRESS_FLUSH_PERCENT):
+        self.interval = interval_ms / 1000
+        self.flush_percent = flush_percent
+        self._dirty = {}
+        self._written = {}
+        self._cancelled = set()
+        self._wakeup = None
+        self._task = None
+        self.flushes = 0
+        self.reports = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.logger.error(f"Failed to write transfer progress: {e}")
+
+    def report(self, session_id: str, progress, status: SessionStatusEnum = SessionStatusEnum.processing,
+               bytes_done: int | None = None):
+        """
+        Record the latest progress of a session, and optionally the byte offset
+        checkpointed for resumable transfers; it is written on the next flush.
+        """
+        self.reports += 1
+        progress = int(progress)
+        SESSION_EVENTS.publish(session_id, status=status.value, progress=progress)
+        written = self._written.get(session_id)
+        if bytes_done is None and written is not None and written[:2] == (status, progress):
+            return
+        self._dirty[session_id] = (status, progress, bytes_done)
+        if self._wakeup is not None and (written is None or progress - written[1] >= self.flush_percent):
+            self._wakeup.set()
+
+    async def flush(self):
+        """
+        Write every dirty session in one transaction.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        await update_sessions_progress([(session_id, *update) for session_id, update in dirty.items()])
+        self._written.update(dirty)
+        self.flushes += 1
+
+    async def finish(self, session_id: str, status: SessionStatusEnum, details: str = "", progress: int = 0):
+        """
+        Write a final state immediately, drop the session's stored job (and the
+        credentials in it) and forget the session.
+        """
+        self._dirty.pop(session_id, None)
+        self._written.pop(session_id, None)
+        self._cancelled.discard(session_id)
+        await update_session_status(session_id, status, details=details, progress=progress, clear_job=True)
+        TRANSFERS.inc(status=status.value)
+        SESSION_EVENTS.finish(
+            session_id,
+            status=status.value,
+            details=details,
+            progress=progress,
+            completed_at=time.strftime("%Y-%m-%d %H:%M:%S") if status == SessionStatusEnum.completed else "",
+        )
+
+    def cancel(self, session_id: str):
+        """
+        Ask a running transfer to stop at its next chunk. The flag is dropped by
+        `finish`, so it must only be set for transfers that are running.
+        """
+        self._cancelled.add(session_id)
+        self._dirty.pop(session_id, None)
+
+    def is_cancelled(self, session_id: str) -> bool:
+        return session_id in self._cancelled
+
+    def stats(self) -> dict:
+        return {
+            "dirty_sessions": len(self._dirty),
+            "tracked_sessions": len(self._written),
+            "reports": self.reports,
+            "flushes": self.flushes,
+        }
+
+
+PROGRESS = ProgressWriter()
+
+
+async def start_progress_writer():
+    """
+    Start flushing transfer progress in the background.
+    """
+    PROGRESS.start()
+
+
+async def stop_progress_writer():
+    """
+    Stop the background flush and write any pending progress.
+    """
+    await PROGRESS.stop()
@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+
+import aioftp
+import asyncssh
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.metrics import REMOTE_CONNECT_SECONDS, REMOTE_CONNECTIONS
+
+load_dotenv()
+# Connections open at once to one FTP/SFTP server (host and port), in use or idle
+REMOTE_POOL_MAX_PER_HOST = int(os.getenv("REMOTE_POOL_MAX_PER_HOST", 4))
+# Seconds an unused connection is kept open for reuse
+REMOTE_POOL_IDLE_SECONDS = float(os.getenv("REMOTE_POOL_IDLE_SECONDS", 60))
+# Connections idle longer than this are probed before they are handed out again
+REMOTE_POOL_HEALTHCHECK_SECONDS = float(os.getenv("REMOTE_POOL_HEALTHCHECK_SECONDS", 15))
+
+
+class _SFTPConnection:
+    def __init__(self, conn, client):
+        self.conn = conn
+        self.client = client
+
+    @classmethod
+    async def open(cls, host, port, username, password):
+        conn = await asyncssh.connect(host, port=port, username=username, password=password, known_hosts=None)
+        try:
+            return cls(conn, await conn.start_sftp_client())
+        except BaseException:
+            conn.close()
+            raise
+
+    def is_closed(self) -> bool:
+        return self.conn.is_closed()
+
+    async def check(self):
+        await self.client.realpath(".")
+
+    async def close(self):
+        self.client.exit()
+        self.conn.close()
+        await self.conn.wait_closed()
+
+
+class _FTPConnection:
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    async def open(cls, host, port, username, password):
+        client = aioftp.Client()
+        await client.connect(host, port)
+        try:
+            await client.login(username, password)
+        except BaseException:
+            client.close()
+            raise
+        return cls(client)
+
+    def is_closed(self) -> bool:
+        try:
+            return self.client.stream.writer.is_closing()
+        except ConnectionError:
+            return True
+
+    async def check(self):
+        await self.client.command("NOOP", "200")
+
+    async def close(self):
+        try:
+            await asyncio.wait_for(self.client.quit(), timeout=5)
+        except Exception:
+            pass
+        finally:
+            self.client.close()
+
+
+class RemotePool:
+    """
+    Pool of logged-in FTP and SFTP connections keyed by protocol, host, port and credentials.
+
+    A connection is leased to one operation at a time and returned afterwards, so
+    browsing a remote tree or queueing several downloads from the same server pays
+    for the handshake and login once. At most REMOTE_POOL_MAX_PER_HOST connections
+    are open per server; further leases wait for one to be returned. Idle
+    connections are closed after REMOTE_POOL_IDLE_SECONDS and probed before reuse
+    once idle for REMOTE_POOL_HEALTHCHECK_SECONDS.
+    """
+
+    def __init__(self, max_per_host: int = REMOTE_POOL_MAX_PER_HOST, idle_seconds: float = REMOTE_POOL_IDLE_SECONDS):
+        self.max_per_host = max_per_host
+        self.idle_seconds = idle_seconds
+        # (protocol, host, port, username, password digest) -> list of (connection, last used)
+        self._idle = {}
+        # (protocol, host, port) -> open connections, in use or idle
+        self._open = {}
+        self._available = None
+        self._reaper = None
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def start(self):
+        self._available = asyncio.Condition()
+        self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        idle, self._idle = self._idle, {}
+        await asyncio.gather(
+            *(connection.close() for connections in idle.values() for connection, _ in connections),
+            return_exceptions=True,
+        )
+        self._open.clear()
+
+    @staticmethod
+    def _key(protocol, host, port, username, password):
+        return protocol, host, port, username, hashlib.sha256(password.encode()).hexdigest()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(self.idle_seconds / 2, 1))
+            now = time.monotonic()
+            expired = []
+            for key, connections in list(self._idle.items()):
+                keep = [(connection, used) for connection, used in connections if now - used < self.idle_seconds]
+                expired.extend((key, connection) for connection, used in connections if now - used >= self.idle_seconds)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            for key, connection in expired:
+                await self._discard(key, connection)
+
+    async def _discard(self, key, connection):
+        try:
+            await connection.close()
+        except Exception as e:
+            logger.logger.warning(f"Failed to close pooled connection to {key[1]}:{key[2]}: {e}")
+        self.discarded += 1
+        async with self._available:
+            if self._open.get(key[:3]):
+                self._open[key[:3]] -= 1
+            self._available.notify_all()
+
+    async def _acquire(self, factory, key, host, port, username, password):
+        if self._available is None:
+            self.start()
+        while True:
+            idle = self._idle.get(key)
+            if idle:
+                connection, used = idle.pop()
+                if not idle:
+                    del self._idle[key]
+                if connection.is_closed():
+                    await self._discard(key, connection)
+                    continue
+                if time.monotonic() - used >= REMOTE_POOL_HEALTHCHECK_SECONDS:
+                    try:
+                        await connection.check()
+                    except Exception:
+                        await self._discard(key, connection)
+                        continue
+                self.reused += 1
+                return connection
+
+            async with self._available:
+                if self._open.get(key[:3], 0) >= self.max_per_host:
+                    # Make room by closing an idle connection of other credentials, else wait
+                    other = next((k for k in self._idle if k[:3] == key[:3]), None)
+                    if other is None:
+                        await self._available.wait()
+                        continue
+                else:
+                    self._open[key[:3]] = self._open.get(key[:3], 0) + 1
+                    other = None
+            if other is not None:
+                connection, _ = self._idle[other].pop(0)
+                if not self._idle[other]:
+                    del self._idle[other]
+                await self._discard(other, connection)
+                continue
+
+            try:
+                with REMOTE_CONNECT_SECONDS.time(protocol=key[0]):
+                    connection = await factory.open(host, port, username, password)
+            except BaseException:
+                async with self._available:
+                    self._open[key[:3]] -= 1
+                    self._available.notify_all()
+                raise
+            self.opened += 1
+            REMOTE_CONNECTIONS.inc(protocol=key[0])
+            return connection
+
+    async def _release(self, key, connection, healthy: bool):
+        if not healthy or connection.is_closed() or self._reaper is None:
+            await self._discard(key, connection)
+            return
+        self._idle.setdefault(key, []).append((connection, time.monotonic()))
+        async with self._available:
+            self._available.notify_all()
+
+    @asynccontextmanager
+    async def _lease(self, factory, protocol, host, port, username, password, reusable_errors=(), unwrap=None):
+        key = self._key(protocol, host, port, username, password)
+        connection = await self._acquire(factory, key, host, port, username, password)
+        healthy = False
+        try:
+            yield unwrap(connection) if unwrap is not None else connection.client
+            healthy = True
+        except reusable_errors:
+            healthy = True
+            raise
+        finally:
+            await self._release(key, connection, healthy)
+
+    def sftp(self, host: str, port: int, username: str, password: str, with_ssh: bool = False):
+        """
+        Lease a logged-in `asyncssh` SFTP client for the duration of an `async with` block.
+
+        With `with_ssh`, the lease is an `(ssh_connection, sftp_client)` pair, for
+        callers that also run commands on the server.
+        """
+        return self._lease(
+            _SFTPConnection, "sftp", host, port, username, password, (asyncssh.SFTPError,),
+            unwrap=(lambda connection: (connection.conn, connection.client)) if with_ssh else None,
+        )
+
+    def ftp(self, host: str, port: int, username: str, password: str):
+        """
+        Lease a logged-in `aioftp` client for the duration of an `async with` block.
+
+        A connection that raised is closed rather than returned, as the control
+        connection may be left in the middle of a transfer.
+        """
+        return self._lease(_FTPConnection, "ftp", host, port, username, password)
+
+    def stats(self) -> dict:
+        return {
+            "max_per_host": self.max_per_host,
+            "open": sum(self._open.values()),
+            "idle": sum(len(connections) for connections in self._idle.values()),
+            "opened": self.opened,
+            "reused": self.reused,
+            "discarded": self.discarded,
+        }
+
+
+REMOTE_POOL = RemotePool()
+
+
+async def start_remote_pool():
+    """
+    Start closing idle remote connections in the background.
+    """
+    REMOTE_POOL.start()
+
+
+async def stop_remote_pool():
+    """
+    Close every pooled FTP and SFTP connection.
+    """
+    await REMOTE_POOL.stop()
@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+from pathlib import Path
+
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.db import archive_finished_sessions
+from flexport.links import PART_SUFFIX
+
+load_dotenv()
+# Finished sessions older than this many days are folded into per-day counts; 0 keeps them forever
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS", 90))
+# Interval between retention runs
+SESSION_RETENTION_SECONDS = int(os.getenv("SESSION_RETENTION_SECONDS", 3600))
+# Sessions archived per write transaction, so transfers are not blocked behind one long write
+SESSION_RETENTION_BATCH = 1000
+
+
+def _remove_partial_files(partials):
+    for directory, file_name in partials:
+        (Path(directory) / (file_name + PART_SUFFIX)).unlink(missing_ok=True)
+
+
+async def compact_sessions() -> int:
+    """
+    Archive completed and failed sessions older than SESSION_RETENTION_DAYS, in
+    batches; returns how many were archived. Partial downloads left by archived
+    failed sessions can no longer be resumed and are removed.
+    """
+    if SESSION_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = int(time.time() - SESSION_RETENTION_DAYS * 86400)
+    archived = 0
+    while True:
+        count, partials = await archive_finished_sessions(cutoff, SESSION_RETENTION_BATCH)
+        if partials:
+            await asyncio.to_thread(_remove_partial_files, partials)
+        archived += count
+        if count < SESSION_RETENTION_BATCH:
+            return archived
+        await asyncio.sleep(0)
+
+
+async def _retention_loop():
+    while True:
+        try:
+            archived = await compact_sessions()
+            if archived:
+                logger.logger.info(f"Archived {archived} finished sessions")
+        except Exception as e:
+            logger.logger.error(f"Failed to archive old sessions: {e}")
+        await asyncio.sleep(SESSION_RETENTION_SECONDS)
+
+
+_retention_task = None
+
+
+async def start_session_retention():
+    """
+    Start archiving old finished sessions in the background.
+    """
+    global _retention_task
+    _retention_task = asyncio.get_running_loop().create_task(_retention_loop())
+
+
+async def stop_session_retention():
+    if _retention_task is not None:
+        _retention_task.cancel()
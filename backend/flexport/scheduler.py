@@ -0,0 +1,220 @@
+import os
+import json
+import heapq
+import base64
+import asyncio
+import hashlib
+import itertools
+
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.models import SessionStatus, SessionStatusEnum
+from flexport.db import (
+    create_session,
+    get_pending_jobs,
+    fail_orphaned_sessions,
+    clear_session_job,
+    update_session_status,
+)
+from flexport.events import SESSION_EVENTS
+from flexport.progress import PROGRESS
+from flexport.tokens import SECRET_KEY
+
+load_dotenv()
+# Transfers running at once across all users
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", 8))
+# Transfers running at once for a single user
+SCHEDULER_MAX_PER_USER = int(os.getenv("SCHEDULER_MAX_PER_USER", 3))
+# Fernet key encrypting the arguments (including remote passwords) of persisted jobs;
+# derived from JWT_SECRET_KEY when unset. Jobs stored under another key are failed at startup.
+JOB_ENCRYPTION_KEY = os.getenv("JOB_ENCRYPTION_KEY")
+
+_JOB_CIPHER = Fernet(JOB_ENCRYPTION_KEY or base64.urlsafe_b64encode(hashlib.sha256(f"job:{SECRET_KEY}".encode()).digest()))
+
+
+def seal_job_args(args: dict) -> str:
+    """
+    Encrypt job arguments for the sessions table.
+    """
+    return _JOB_CIPHER.encrypt(json.dumps(args).encode()).decode()
+
+
+def open_job_args(sealed) -> dict:
+    """
+    Decrypt job arguments stored by `seal_job_args`; raises InvalidToken for another key.
+    """
+    return json.loads(_JOB_CIPHER.decrypt(sealed.encode()))
+
+
+class Scheduler:
+    """
+    Bounded scheduler for FTP, SFTP and link transfers.
+
+    Jobs wait in per-user priority queues and run under a global and a per-user
+    concurrency cap. When a slot frees up, the user with the fewest running jobs
+    goes next (ties: higher priority head job, then least recently served), so one
+    user's large batch cannot starve everybody else. Jobs are persisted with their
+    session row and re-queued at startup.
+    """
+
+    def __init__(self, max_concurrent: int = SCHEDULER_MAX_CONCURRENT, max_per_user: int = SCHEDULER_MAX_PER_USER):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self._handlers = {}
+        # username -> heap of (-priority, sequence, session_id, kind, args)
+        self._queues = {}
+        self._running = {}
+        self._running_by_user = {}
+        # username -> dispatch number of the user's latest dispatched job
+        self._last_served = {}
+        self._sequence = itertools.count()
+        self._dispatches = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self.completed = 0
+
+    def register(self, kind: str, handler):
+        """
+        Register the coroutine function that runs jobs of `kind`; it is called as
+        `handler(session_id=..., **args)` and records the final session state itself.
+        """
+        self._handlers[kind] = handler
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        await fail_orphaned_sessions("Interrupted by a restart")
+        for session_id, username, job, priority in await get_pending_jobs():
+            try:
+                args = open_job_args(job["args"])
+            except InvalidToken:
+                await update_session_status(
+                    session_id,
+                    SessionStatusEnum.failed,
+                    details="Interrupted by a restart; the job could not be decrypted",
+                    clear_job=True,
+                )
+                continue
+            SESSION_EVENTS.track(session_id, username)
+            self.submit(session_id, username, job["kind"], args, priority)
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self):
+        """
+        Stop dispatching and cancel running jobs; their sessions stay unfinished and
+        are re-queued on the next start.
+        """
+        if self._task is not None:
+            self._task.cancel()
+        tasks = [task for task, _ in self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, session_id: str, username: str, kind: str, args: dict, priority: int = 0):
+        """
+        Queue a job whose session row already exists.
+        """
+        heapq.heappush(self._queues.setdefault(username, []), (-priority, next(self._sequence), session_id, kind, args))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, session_id: str) -> bool:
+        """
+        Remove a job that has not started yet. Returns whether it was queued.
+        """
+        for queue in self._queues.values():
+            for i, item in enumerate(queue):
+                if item[2] == session_id:
+                    queue.pop(i)
+                    heapq.heapify(queue)
+                    return True
+        return False
+
+    def is_running(self, session_id: str) -> bool:
+        return session_id in self._running
+
+    def _next_user(self):
+        candidates = [
+            username for username, queue in self._queues.items()
+            if queue and self._running_by_user.get(username, 0) < self.max_per_user
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda username: (
+            self._running_by_user.get(username, 0),
+            self._queues[username][0][0],
+            self._last_served.get(username, -1),
+        ))
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while len(self._running) < self.max_concurrent:
+                username = self._next_user()
+                if username is None:
+                    break
+                _, _, session_id, kind, args = heapq.heappop(self._queues[username])
+                self._last_served[username] = next(self._dispatches)
+                self._running_by_user[username] = self._running_by_user.get(username, 0) + 1
+                task = asyncio.get_running_loop().create_task(self._run(session_id, username, kind, args))
+                self._running[session_id] = (task, username)
+
+    async def _run(self, session_id: str, username: str, kind: str, args: dict):
+        SESSION_EVENTS.publish(session_id, status=SessionStatusEnum.processing.value)
+        try:
+            await self._handlers[kind](session_id=session_id, **args)
+            await clear_session_job(session_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Handlers record their own final state; one that raised left the session open
+            logger.logger.error(f"Transfer job {session_id} failed: {e}")
+            await PROGRESS.finish(session_id, SessionStatusEnum.failed, details=str(e))
+        finally:
+            self._running.pop(session_id, None)
+            self._running_by_user[username] -= 1
+            self.completed += 1
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "completed": self.completed,
+            "users": {
+                username: {"running": self._running_by_user.get(username, 0), "queued": len(queue)}
+                for username, queue in self._queues.items()
+                if queue or self._running_by_user.get(username, 0)
+            },
+        }
+
+
+SCHEDULER = Scheduler()
+
+
+async def schedule_transfer(session: SessionStatus, kind: str, args: dict, priority: int = 0):
+    """
+    Persist a queued session together with its job and hand it to the scheduler.
+
+    The job's arguments are stored encrypted, so remote credentials never sit in
+    the database in plaintext; the job is dropped once the session finishes.
+    """
+    await create_session(session, job={"kind": kind, "args": seal_job_args(args)}, priority=priority)
+    SESSION_EVENTS.track(session.session_id, session.username, session.model_dump(mode="json"))
+    SCHEDULER.submit(session.session_id, session.username, kind, args, priority)
+
+
+async def start_scheduler():
+    """
+    Re-queue unfinished jobs from the sessions table and start dispatching.
+    """
+    await SCHEDULER.start()
+
+
+async def stop_scheduler():
+    await SCHEDULER.stop()
@@ -0,0 +1,434 @@
+import os
+import heapq
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.db import DATABASE_PATH
+from flexport.search_stream import walk_matches
+
+load_dotenv()
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "search_index.db")
+# Directories whose subdirectories are indexed, one index root per subdirectory
+# (e.g. one per user home); searches elsewhere walk the tree instead
+SEARCH_INDEX_ROOTS = [
+    os.path.realpath(root) for root in os.getenv("SEARCH_INDEX_ROOTS", "/home").split(os.pathsep) if root
+]
+# Indexed roots older than this are rescanned in the background after a query
+SEARCH_INDEX_REFRESH_SECONDS = int(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", 300))
+# FTS5 trigram matching needs at least this many characters
+TRIGRAM_MIN_QUERY = 3
+# Shorter queries scan every indexed name below the root: seconds they may run,
+# and rows they read per page
+SEARCH_SHORT_QUERY_TIMEOUT = float(os.getenv("SEARCH_SHORT_QUERY_TIMEOUT", 2))
+SEARCH_SHORT_QUERY_MAX_ROWS = 10000
+# Longest a refresh holds the index write lock before committing and letting others in
+SEARCH_INDEX_BATCH_SECONDS = 0.05
+# Seconds a query may walk the tree while its root is still being indexed
+SEARCH_WALK_TIMEOUT = float(os.getenv("SEARCH_WALK_TIMEOUT", 10))
+
+
+class QueryTooBroad(Exception):
+    """
+    A query shorter than TRIGRAM_MIN_QUERY ran out of SEARCH_SHORT_QUERY_TIMEOUT.
+    """
+
+
+def _subtree_bounds(root: str):
+    """
+    Return `(low, high)` so that `low <= path < high` selects paths strictly below `root`.
+    """
+    prefix = root.rstrip("/") + "/"
+    return prefix, prefix[:-1] + chr(ord("/") + 1)
+
+
+def _index_root(target: str):
+    """
+    Return the index root covering `target`, the subdirectory of a SEARCH_INDEX_ROOTS
+    entry it lies in, or None when `target` is not inside one.
+    """
+    for base in SEARCH_INDEX_ROOTS:
+        low, high = _subtree_bounds(base)
+        if low <= target < high:
+            return os.path.join(base, target[len(low):].split("/", 1)[0])
+    return None
+
+
+class SearchIndex:
+    """
+    On-disk filename index answering substring queries with an FTS5 trigram table.
+
+    Directories are indexed per root and refreshed incrementally: a directory is
+    re-listed only when its mtime changed since it was indexed, and unchanged
+    directories are descended through using the children already in the index.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._stale = set()
+        self._stale_lock = threading.Lock()
+        self._refreshing = set()
+        self._pending = queue.Queue()
+        self._worker = None
+        # Called with the path of every directory re-listed, e.g. to start watching it
+        self.on_rescan = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def init(self):
+        """
+        Create the index tables.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS index_roots (
+                root TEXT PRIMARY KEY,
+                refreshed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS index_dirs (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS index_files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE,
+                parent TEXT,
+                name TEXT,
+                is_dir INTEGER,
+                descend INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_index_files_parent ON index_files (parent);
+            CREATE VIRTUAL TABLE IF NOT EXISTS index_names USING fts5(
+                name, content='index_files', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS index_files_ai AFTER INSERT ON index_files BEGIN
+                INSERT INTO index_names (rowid, name) VALUES (new.id, new.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS index_files_ad AFTER DELETE ON index_files BEGIN
+                INSERT INTO index_names (index_names, rowid, name) VALUES ('delete', old.id, old.name);
+            END;
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def _remove_subtree(self, conn, directory: str):
+        low, high = _subtree_bounds(directory)
+        conn.execute("DELETE FROM index_files WHERE path >= ? AND path < ?", (low, high))
+        conn.execute("DELETE FROM index_dirs WHERE path = ? OR (path >= ? AND path < ?)", (directory, low, high))
+
+    def _rescan(self, conn, directory: str, mtime_ns: int, device: int):
+        """
+        Re-list one directory, apply the difference to the index and return its subdirectories.
+
+        Symlinked directories and mount points (subdirectories on another device than
+        `device`, the directory's own) are indexed but not descended into.
+        """
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                        descend = (
+                            is_dir and not entry.is_symlink() and entry.stat(follow_symlinks=False).st_dev == device
+                        )
+                    except OSError:
+                        continue
+                    entries[entry.path] = (entry.name, is_dir, descend)
+        except OSError:
+            self._remove_subtree(conn, directory)
+            return []
+
+        indexed = dict(conn.execute("SELECT path, descend FROM index_files WHERE parent = ?", (directory,)))
+        for path in indexed.keys() - entries.keys():
+            conn.execute("DELETE FROM index_files WHERE path = ?", (path,))
+            if indexed[path]:
+                self._remove_subtree(conn, path)
+        conn.executemany(
+            "INSERT INTO index_files (path, parent, name, is_dir, descend) VALUES (?, ?, ?, ?, ?)",
+            [
+                (path, directory, name, int(is_dir), int(descend))
+                for path, (name, is_dir, descend) in entries.items()
+                if path not in indexed
+            ],
+        )
+        conn.execute("INSERT OR REPLACE INTO index_dirs (path, mtime_ns) VALUES (?, ?)", (directory, mtime_ns))
+        if self.on_rescan is not None:
+            self.on_rescan(directory)
+        return [path for path, (_, _, descend) in entries.items() if descend]
+
+    def _walk(self, conn, start: str, full: bool):
+        """
+        Bring the index for the tree under `start` up to date.
+
+        With `full`, every indexed directory is stat'ed and re-listed if its mtime moved;
+        otherwise only `start` is re-listed, plus any subdirectories not yet indexed.
+        Directories are handled in batches of at most SEARCH_INDEX_BATCH_SECONDS, each
+        committed under the write lock, so a long walk never holds up queries waiting
+        to refresh a stale directory for more than one batch.
+        """
+        stack = [start]
+        while stack:
+            with self._write_lock:
+                batch_end = time.monotonic() + SEARCH_INDEX_BATCH_SECONDS
+                while stack and time.monotonic() < batch_end:
+                    self._walk_directory(conn, stack.pop(), full, stack)
+                conn.commit()
+
+    def _walk_directory(self, conn, directory: str, full: bool, stack: list):
+        try:
+            st = os.stat(directory)
+        except OSError:
+            self._remove_subtree(conn, directory)
+            return
+        mtime_ns = st.st_mtime_ns
+        row = conn.execute("SELECT mtime_ns FROM index_dirs WHERE path = ?", (directory,)).fetchone()
+        if row is not None and row[0] == mtime_ns:
+            if full:
+                stack.extend(path for (path,) in conn.execute(
+                    "SELECT path FROM index_files WHERE parent = ? AND descend = 1", (directory,)
+                ))
+            return
+        for subdirectory in self._rescan(conn, directory, mtime_ns, st.st_dev):
+            if full or conn.execute("SELECT 1 FROM index_dirs WHERE path = ?", (subdirectory,)).fetchone() is None:
+                stack.append(subdirectory)
+
+    def refresh(self, root: str):
+        """
+        Index `root` or bring an existing index of it up to date.
+        """
+        conn = self._connect()
+        try:
+            self._walk(conn, root, full=True)
+            with self._write_lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO index_roots (root, refreshed_at) VALUES (?, ?)", (root, time.time())
+                )
+                conn.commit()
+        finally:
+            conn.close()
+
+    def ensure_indexed(self, root: str) -> bool:
+        """
+        Return whether queries on `root` can be answered from the index.
+
+        Only roots inside SEARCH_INDEX_ROOTS are indexed, each under its own index
+        root (see `_index_root`). One not indexed yet is queued for the background
+        worker; until it is done this returns False and callers walk the tree instead.
+        An index root older than SEARCH_INDEX_REFRESH_SECONDS is queued for a refresh.
+        """
+        index_root = _index_root(root)
+        if index_root is None:
+            return False
+        conn = self._connect()
+        try:
+            covering = self._covering_root(conn, root, index_root)
+            ready = covering is not None and (
+                root == covering[0]
+                or conn.execute("SELECT 1 FROM index_dirs WHERE path = ?", (root,)).fetchone() is not None
+            )
+        finally:
+            conn.close()
+        # A directory missing from a freshly refreshed root is skipped on purpose (a
+        # mount point) or new, and then picked up through its stale parent
+        if covering is None or time.time() - covering[1] > SEARCH_INDEX_REFRESH_SECONDS:
+            self._refresh_in_background(covering[0] if covering is not None else index_root)
+        return ready
+
+    def _refresh_in_background(self, root: str):
+        """
+        Queue `root` for the single background refresh worker, unless it is queued already.
+        """
+        with self._stale_lock:
+            if root in self._refreshing:
+                return
+            self._refreshing.add(root)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="search-index-refresh", daemon=True)
+                self._worker.start()
+        self._pending.put(root)
+
+    def _work(self):
+        while True:
+            root = self._pending.get()
+            try:
+                self.refresh(root)
+            except Exception as e:
+                logger.logger.error(f"Error indexing {root}: {e}")
+            finally:
+                with self._stale_lock:
+                    self._refreshing.discard(root)
+
+    def mark_stale(self, directory):
+        """
+        Record that the contents of `directory` changed; it is re-listed before the next query.
+        """
+        with self._stale_lock:
+            self._stale.add(str(directory))
+
+    def _refresh_stale(self):
+        with self._stale_lock:
+            stale, self._stale = self._stale, set()
+        self.refresh_directories(stale)
+
+    def refresh_directories(self, directories):
+        """
+        Re-list already indexed `directories`, indexing any new subdirectories they contain.
+        """
+        if not directories:
+            return
+        conn = self._connect()
+        try:
+            for directory in directories:
+                if conn.execute("SELECT 1 FROM index_dirs WHERE path = ?", (directory,)).fetchone():
+                    self._walk(conn, directory, full=False)
+        finally:
+            conn.close()
+
+    def _covering_root(self, conn, target: str, top: str):
+        """
+        Return `(root, refreshed_at)` of an indexed root containing `target`, at or
+        below `top`, if any.
+        """
+        candidates = [target]
+        parent = os.path.dirname(target)
+        while candidates[-1] != top and parent != candidates[-1]:
+            candidates.append(parent)
+            parent = os.path.dirname(parent)
+        placeholders = ",".join("?" * len(candidates))
+        return conn.execute(
+            f"SELECT root, refreshed_at FROM index_roots WHERE root IN ({placeholders}) ORDER BY length(root) DESC",
+            candidates,
+        ).fetchone()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def search(self, root, query: str, after=None):
+        """
+        Yield `(is_dir, name, path)` for indexed entries below `root` whose name contains
+        `query` (case-insensitive), ordered directories first, then by name and path.
+
+        Callers check `ensure_indexed(root)` first. `after` is a `(not is_dir, name, path)`
+        key to resume after. Queries shorter than TRIGRAM_MIN_QUERY yield at most
+        SEARCH_SHORT_QUERY_MAX_ROWS rows and raise QueryTooBroad once they have run for
+        SEARCH_SHORT_QUERY_TIMEOUT seconds.
+        """
+        root = str(root)
+        self._refresh_stale()
+        conn = self._connect()
+        try:
+            conditions, params = [], []
+            if root != "/":
+                conditions.append("f.path >= ? AND f.path < ?")
+                params.extend(_subtree_bounds(root))
+            if after is not None:
+                conditions.append("(1 - f.is_dir, f.name, f.path) > (?, ?, ?)")
+                params.extend((int(after[0]), after[1], after[2]))
+
+            if len(query) >= TRIGRAM_MIN_QUERY:
+                sql = "SELECT f.is_dir, f.name, f.path FROM index_names JOIN index_files f ON f.id = index_names.rowid WHERE index_names MATCH ?"
+                params.insert(0, '"' + query.replace('"', '""') + '"')
+            else:
+                sql = "SELECT f.is_dir, f.name, f.path FROM index_files f WHERE instr(lower(f.name), ?) > 0"
+                params.insert(0, query.lower())
+            for condition in conditions:
+                sql += f" AND {condition}"
+            sql += " ORDER BY 1 - f.is_dir, f.name, f.path"
+            if len(query) < TRIGRAM_MIN_QUERY:
+                sql += f" LIMIT {SEARCH_SHORT_QUERY_MAX_ROWS}"
+                deadline = time.monotonic() + SEARCH_SHORT_QUERY_TIMEOUT
+                conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+
+            try:
+                for is_dir, name, path in conn.execute(sql, params):
+                    yield bool(is_dir), name, path
+            except sqlite3.OperationalError as e:
+                if str(e) == "interrupted":
+                    raise QueryTooBroad(
+                        f"Queries shorter than {TRIGRAM_MIN_QUERY} characters must match within "
+                        f"{SEARCH_SHORT_QUERY_TIMEOUT:g}s; use a longer query or a narrower path."
+                    ) from None
+                raise
+        finally:
+            conn.close()
+
+
+SEARCH_INDEX = SearchIndex()
+
+
+def init_search_index():
+    """
+    Create the search index tables at startup.
+    """
+    SEARCH_INDEX.init()
+
+
+def search_files_indexed(root: Path, query: str, current_user: str, has_access, limit: int, after=None):
+    """
+    Return `(records, has_more)` for up to `limit` accessible matches below `root`.
+
+    Access checks and stats run only on hits: a hit is returned when every directory
+    between `root` and the hit passes `has_access(directory, current_user)`. Hits that
+    disappeared from disk are skipped and their directory is marked stale.
+
+    While `root` is being indexed, the tree is walked instead, for at most
+    SEARCH_WALK_TIMEOUT seconds.
+    """
+    root = str(root)
+    if not SEARCH_INDEX.ensure_indexed(root):
+        return _search_walk(root, query, current_user, has_access, limit, after)
+    allowed = {root: True}
+
+    def accessible(directory: str) -> bool:
+        if directory not in allowed:
+            parent = os.path.dirname(directory)
+            allowed[directory] = accessible(parent) and has_access(Path(directory), current_user)
+        return allowed[directory]
+
+    records = []
+    rows = 0
+    with closing(SEARCH_INDEX.search(root, query, after)) as hits:
+        for is_dir, name, path in hits:
+            rows += 1
+            parent = os.path.dirname(path)
+            if not accessible(parent):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                SEARCH_INDEX.mark_stale(parent)
+                continue
+            if len(records) == limit:
+                return records, True
+            records.append(((not is_dir, name, path), name, path, st))
+    # A short query stopped at its row limit continues on the next page
+    return records, bool(records) and len(query) < TRIGRAM_MIN_QUERY and rows == SEARCH_SHORT_QUERY_MAX_ROWS
+
+
+def _search_walk(root: str, query: str, current_user: str, has_access, limit: int, after=None):
+    matches = (
+        ((is_file, name, path), name, path, st)
+        for is_file, name, path, st in walk_matches(
+            root, query, current_user, has_access, deadline=time.monotonic() + SEARCH_WALK_TIMEOUT
+        )
+        if after is None or (is_file, name, path) > after
+    )
+    head = heapq.nsmallest(limit + 1, matches, key=lambda record: record[0])
+    return head[:limit], len(head) > limit
@@ -0,0 +1,154 @@
+import os
+import stat
+import json
+import time
+import queue
+import asyncio
+import threading
+from pathlib import Path
+
+from flexport.listing import format_entry
+from flexport.executors import STREAM_POOL
+
+# Matches buffered between the walker thread and a slow client before the walker waits
+STREAM_BUFFER_SIZE = 256
+
+
+def walk_matches(root: str, query: str, current_user: str, has_access, max_depth=None, deadline=None, cancelled=None):
+    """
+    Walk the tree under `root` iteratively with `os.scandir`, yielding the record of
+    every entry whose name contains `query` (case-insensitive).
+
+    Directories are descended into when `has_access(directory, current_user)` allows
+    it and their depth below `root` is at most `max_depth`; symlinked directories are
+    reported but not descended into. The walk ends early once `deadline`
+    (a `time.monotonic()` value) passes or the `cancelled` event is set. Returns the
+    reason the walk ended: "complete", "deadline" or "cancelled".
+    """
+    needle = query.lower()
+    stack = [(root, 0)]
+    while stack:
+        if cancelled is not None and cancelled.is_set():
+            return "cancelled"
+        if deadline is not None and time.monotonic() > deadline:
+            return "deadline"
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                descend = entry.is_dir(follow_symlinks=False)
+                if needle in entry.name.lower():
+                    st = entry.stat(follow_symlinks=False)
+                    if stat.S_ISLNK(st.st_mode):
+                        st = os.stat(entry.path)
+                    yield (not stat.S_ISDIR(st.st_mode), entry.name, entry.path, st)
+            except OSError:
+                continue
+            if descend and (max_depth is None or depth < max_depth) and has_access(Path(entry.path), current_user):
+                stack.append((entry.path, depth + 1))
+    return "complete"
+
+
+def _encode(event: str, data: dict, fmt: str) -> str:
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+
+async def stream_search(root: str, query: str, current_user: str, has_access, fmt: str = "ndjson",
+                        max_results: int = 1000, max_depth=None, timeout=None, is_disconnected=None):
+    """
+    Run `walk_matches` on the stream pool, under `current_user`'s limit, and yield NDJSON
+    lines or SSE events as matches arrive.
+
+    Every match is a `match` event carrying the listing item; the stream ends with a
+    `done` event reporting the count, elapsed time and why the search stopped. The
+    walker is stopped when the client disconnects or the generator is closed.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    deadline = started + timeout if timeout else None
+    cancelled = threading.Event()
+    matches = queue.Queue(maxsize=STREAM_BUFFER_SIZE)
+    wakeup = asyncio.Event()
+    outcome = {}
+
+    def offer(record) -> bool:
+        # Wait for room in the buffer, but not past the deadline: a stalled client
+        # must not keep the scan thread busy
+        while not cancelled.is_set():
+            timeout = 0.5
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    outcome["reason"] = "deadline"
+                    return False
+            try:
+                matches.put(record, timeout=timeout)
+                return True
+            except queue.Full:
+                continue
+        outcome["reason"] = "cancelled"
+        return False
+
+    def produce():
+        walker = walk_matches(root, query, current_user, has_access, max_depth, deadline, cancelled)
+        count = 0
+        try:
+            while True:
+                try:
+                    record = next(walker)
+                except StopIteration as stop:
+                    outcome["reason"] = stop.value
+                    break
+                if not offer(record):
+                    break
+                loop.call_soon_threadsafe(wakeup.set)
+                count += 1
+                if count >= max_results:
+                    outcome["reason"] = "max_results"
+                    break
+        except Exception as e:
+            outcome["reason"] = "error"
+            outcome["detail"] = str(e)
+        finally:
+            walker.close()
+            # Everything the walker offered is in the buffer once this is set
+            outcome["finished"] = True
+            loop.call_soon_threadsafe(wakeup.set)
+
+    producer = asyncio.ensure_future(STREAM_POOL.run(current_user, produce))
+    count = 0
+    try:
+        while True:
+            try:
+                record = matches.get_nowait()
+            except queue.Empty:
+                if "finished" in outcome and matches.empty():
+                    break
+                wakeup.clear()
+                if not matches.empty() or "finished" in outcome:
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                continue
+            count += 1
+            yield _encode("match", {"item": format_entry(record)}, fmt)
+        yield _encode("done", {
+            "count": count,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+            "reason": outcome.get("reason", "complete"),
+            **({"detail": outcome["detail"]} if "detail" in outcome else {}),
+        }, fmt)
+    finally:
+        cancelled.set()
+        # A walk still waiting for a thread is dropped; a running one stops at its next directory
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
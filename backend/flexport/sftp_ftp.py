@@ -1,14 +1,37 @@
 import os
-import stat
-from pathlib import Path
+import json
+import time
+import asyncio
+import calendar
+import posixpath
+from collections import deque
+from pathlib import PurePosixPath
 
-import aioftp
 import asyncssh
 import aiofiles
+from dotenv import load_dotenv
 from fastapi import logger
 
 from flexport.models import SessionStatusEnum
 from flexport.db import update_session_status
+from flexport.progress import PROGRESS
+from flexport.changes import path_changed
+from flexport.remote_pool import REMOTE_POOL
+from flexport.metrics import TRANSFER_BYTES
+from flexport.sync import SyncPlan, manifest_source, sftp_checksums, ftp_checksums
+
+load_dotenv()
+# Connections, and so transfers, used at once by one FTP folder download
+FTP_PARALLEL_CONNECTIONS = int(os.getenv("FTP_PARALLEL_CONNECTIONS", 4))
+FTP_BLOCK_SIZE = 1024 * 64  # 64KB reads
+# Files of one SFTP folder download fetched at once over its connection
+SFTP_CONCURRENT_FILES = int(os.getenv("SFTP_CONCURRENT_FILES", 8))
+# Read requests in flight per SFTP file
+SFTP_MAX_REQUESTS = int(os.getenv("SFTP_MAX_REQUESTS", 128))
+# Bytes per SFTP read request; -1 uses the largest read the server allows
+SFTP_BLOCK_SIZE = int(os.getenv("SFTP_BLOCK_SIZE", -1))
+# Entries per `items` event of a streamed SFTP listing
+SFTP_STREAM_BATCH = 500
 
 
 # ============================================================
@@ -16,7 +39,7 @@ from flexport.db import update_session_status
 # ============================================================
 async def list_files_ftp(host, username, password, port=21, path="/"):
     """Asynchronous list of files and directories with metadata from an FTP server."""
-    async with aioftp.Client.context(host, port=port, user=username, password=password) as client:
+    async with REMOTE_POOL.ftp(host, port, username, password) as client:
         file_metadata = []
         async for path_info_tuple in client.list(path, recursive=False):
             path_ftp = str(path_info_tuple[0]).replace('/', '')
@@ -32,6 +55,62 @@ async def list_files_ftp(host, username, password, port=21, path="/"):
         return file_metadata
 
 
+def _ftp_mtime(info) -> float | None:
+    """
+    Parse the MLSD `modify` fact (YYYYMMDDHHMMSS[.sss], UTC) into a timestamp.
+    """
+    modify = info.get("modify")
+    if not modify:
+        return None
+    try:
+        return calendar.timegm(time.strptime(modify[:14], "%Y%m%d%H%M%S"))
+    except ValueError:
+        return None
+
+
+def _is_up_to_date(local_path: str, size, mtime) -> bool:
+    """
+    Whether `local_path` already holds a copy with the remote size and modification time.
+    """
+    if size is None or mtime is None:
+        return False
+    try:
+        st = os.stat(local_path)
+    except OSError:
+        return False
+    return st.st_size == size and int(st.st_mtime) == int(mtime)
+
+
+async def _ftp_walk(client, remote_root: str, local_root: str):
+    """
+    List the tree under `remote_root` (MLSD, falling back to LIST) and create its
+    directories under `local_root`. Returns `(remote_path, local_path, size, mtime)`
+    for every file.
+    """
+    os.makedirs(local_root, exist_ok=True)
+    files = []
+    remote_root = PurePosixPath(remote_root)
+    async for path, info in client.list(remote_root, recursive=True):
+        local_item_path = os.path.join(local_root, *path.relative_to(remote_root).parts)
+        if info["type"] == "dir":
+            os.makedirs(local_item_path, exist_ok=True)
+        elif info["type"] == "file":
+            size = int(info["size"]) if "size" in info else None
+            files.append((str(path), local_item_path, size, _ftp_mtime(info)))
+    return files
+
+
+async def _ftp_fetch_file(client, remote_path: str, local_path: str, mtime, on_bytes):
+    async with aiofiles.open(local_path, "wb") as local_file:
+        async with client.download_stream(remote_path) as stream:
+            async for block in stream.iter_by_block(FTP_BLOCK_SIZE):
+                on_bytes(len(block))
+                await local_file.write(block)
+    if mtime is not None:
+        # Stamp the remote mtime so an unchanged file is skipped next time
+        os.utime(local_path, (mtime, mtime))
+
+
 async def download_ftp(
     host: str,
     username: str,
@@ -40,52 +119,210 @@ async def download_ftp(
     local_path: str,
     session_id: str,
     port: int = 21,
+    sync: bool = False,
+    checksum: bool = False,
 ):
-    """Asynchronous file download using FTP."""
+    """
+    Asynchronous file or folder download using FTP.
+
+    Folders are mirrored into `local_path/<folder name>`: the tree is listed with
+    MLSD and its files are downloaded by FTP_PARALLEL_CONNECTIONS workers, each on
+    its own pooled connection, since FTP carries one transfer per control
+    connection. Files already present locally with the remote size and mtime are
+    skipped; progress covers the bytes of the whole folder.
+
+    With `sync`, files are compared with the sync manifest instead (see `SyncPlan`),
+    optionally by the remote XSHA256 `checksum` too, and the session details report
+    the bytes transferred and skipped.
+    """
     try:
         await update_session_status(session_id, SessionStatusEnum.processing)
 
-        async with aioftp.Client.context(host, port=port, user=username, password=password) as client:
-            is_file = await client.is_file(remote_path)
-            if not is_file:
-                await download_directory_ftp(host, username, password, remote_path, local_path)
-            async with aiofiles.open(local_path, "wb") as local_file:
-                async for block in client.download_stream(remote_path):
-                    await local_file.write(block)
+        async with REMOTE_POOL.ftp(host, port, username, password) as client:
+            info = await client.stat(remote_path)
+            if info["type"] == "dir":
+                local_path = os.path.join(local_path, PurePosixPath(remote_path).name)
+                files = await _ftp_walk(client, remote_path, local_path)
+            else:
+                if os.path.isdir(local_path):  # If `local_path` is a directory, append the file name
+                    local_path = os.path.join(local_path, PurePosixPath(remote_path).name)
+                size = int(info["size"]) if "size" in info else None
+                files = [(remote_path, local_path, size, _ftp_mtime(info))]
+            checksums = await ftp_checksums(client, [item[0] for item in files]) if sync and checksum else {}
 
-        await update_session_status(session_id, SessionStatusEnum.completed)
-    except Exception as e:
-        logger.logger.error(e)
-        await update_session_status(session_id, SessionStatusEnum.failed, details=str(e))
+        files = [(*item, checksums.get(item[0])) for item in files]
+        plan = SyncPlan(manifest_source("ftp", host, port, username), local_path) if sync else None
+        if plan is not None:
+            pending = deque(await plan.pending(files))
+        else:
+            pending = deque(item for item in files if not _is_up_to_date(*item[1:4]))
+        total_size = sum(size or 0 for _, _, size, _, _ in files)
+        done = {"bytes": total_size - sum(size or 0 for _, _, size, _, _ in pending)}
+        count = len(pending)
+
+        def on_bytes(received):
+            if PROGRESS.is_cancelled(session_id):
+                raise RuntimeError("Cancelled")
+            done["bytes"] += received
+            TRANSFER_BYTES.inc(received, protocol="ftp")
+            if total_size > 0:
+                PROGRESS.report(session_id, min(done["bytes"] / total_size, 1) * 100)
 
+        async def worker():
+            async with REMOTE_POOL.ftp(host, port, username, password) as client:
+                while pending:
+                    item = pending.popleft()
+                    await _ftp_fetch_file(client, item[0], item[1], item[3], on_bytes)
+                    if plan is not None:
+                        plan.transferred(*item)
+                    if total_size == 0:
+                        PROGRESS.report(session_id, (1 - len(pending) / count) * 100)
 
-async def download_directory_ftp(host, user, password, remote_path, local_path):
-    local_path_dir = Path(local_path) / str(remote_path).split('/')[-1]
-    async with aioftp.Client.context(host, user=user, password=password) as client:
-        await client.download(remote_path, local_path_dir, write_into=True)
+        tasks = [asyncio.ensure_future(worker()) for _ in range(min(FTP_PARALLEL_CONNECTIONS, count))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if plan is not None:
+                await plan.save()
+
+        path_changed(local_path)
+        await PROGRESS.finish(
+            session_id, SessionStatusEnum.completed, details=plan.details() if plan else "", progress=100
+        )
+    except Exception as e:
+        logger.logger.error(e)
+        await PROGRESS.finish(session_id, SessionStatusEnum.failed, details=str(e))
 
 
 # ============================================================
 # SFTP
 # ============================================================
-async def list_files_sftp(host, username, password, port=22, path="/"):
-    """Asynchronous list of files and directories with metadata from an SFTP server."""
-    async with asyncssh.connect(host, port=port, username=username, password=password, known_hosts=None) as conn:
-        async with conn.start_sftp_client() as sftp:
-            file_metadata = []
-            for item in await sftp.listdir(path):
-                item_path = os.path.join(path, item).replace("\\", "/")
-                stat_item = await sftp.stat(item_path)
-                file_metadata.append(
-                    {
-                        "name": item,
-                        "type": "directory" if stat.S_ISDIR(stat_item.permissions) else "file",
-                        "size": stat_item.size,
-                        "modified_time": stat_item.mtime,
-                        "permissions": oct(stat_item.permissions),
-                    }
-                )
-            return file_metadata
+def _sftp_entry(name: str, attrs) -> dict:
+    return {
+        "name": name,
+        "type": "directory" if attrs.type == asyncssh.FILEXFER_TYPE_DIRECTORY else "file",
+        "size": attrs.size,
+        "modified_time": attrs.mtime,
+        "permissions": oct(attrs.permissions) if attrs.permissions is not None else None,
+    }
+
+
+def _sort_key(item: dict):
+    return item["type"] != "directory", item["name"]
+
+
+async def iter_files_sftp(host, username, password, port=22, path="/"):
+    """
+    Yield the metadata of every entry of an SFTP directory as the server returns it.
+
+    Uses the attributes carried by the directory read itself; only symlinks are
+    stat'ed, to report what they point to.
+    """
+    async with REMOTE_POOL.sftp(host, port, username, password) as sftp:
+        async for entry in sftp.scandir(path):
+            if entry.filename in (".", ".."):
+                continue
+            attrs = entry.attrs
+            if attrs.type == asyncssh.FILEXFER_TYPE_SYMLINK:
+                try:
+                    attrs = await sftp.stat(posixpath.join(path, entry.filename))
+                except asyncssh.SFTPError:
+                    pass
+            yield _sftp_entry(entry.filename, attrs)
+
+
+async def list_files_sftp(host, username, password, port=22, path="/", page=1, page_size=None):
+    """
+    Asynchronous list of files and directories with metadata from an SFTP server.
+
+    Returns `(items, total_items)`: entries sorted directories first, then by name,
+    sliced to `page` when `page_size` is given.
+    """
+    items = [item async for item in iter_files_sftp(host, username, password, port, path)]
+    items.sort(key=_sort_key)
+    if page_size is not None:
+        start_idx = (page - 1) * page_size
+        return items[start_idx:start_idx + page_size], len(items)
+    return items, len(items)
+
+
+async def stream_files_sftp(host, username, password, port=22, path="/"):
+    """
+    List an SFTP directory as NDJSON: `items` events with up to SFTP_STREAM_BATCH
+    entries each as they arrive (unsorted), then a `done` event with the count.
+    Failures after the response started are reported as an `error` event.
+    """
+    batch, count = [], 0
+    try:
+        async for item in iter_files_sftp(host, username, password, port, path):
+            batch.append(item)
+            count += 1
+            if len(batch) >= SFTP_STREAM_BATCH:
+                yield json.dumps({"type": "items", "items": batch}) + "\n"
+                batch = []
+        if batch:
+            yield json.dumps({"type": "items", "items": batch}) + "\n"
+        yield json.dumps({"type": "done", "count": count}) + "\n"
+    except Exception as e:
+        yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+
+async def _sftp_walk(sftp, remote_root: str, local_root: str):
+    """
+    List the tree under `remote_root` and create its directories under `local_root`.
+
+    Sizes and types come from the attributes `scandir` returns with every name, so
+    only symlinks cost an extra `stat`; directories of one level are listed
+    concurrently. Returns `(remote_path, local_path, size, mtime)` for every file.
+    """
+    files = []
+    level = [(remote_root, local_root)]
+    while level:
+        for _, local_dir in level:
+            os.makedirs(local_dir, exist_ok=True)
+
+        async def list_directory(remote_dir, local_dir):
+            subdirectories = []
+            async for entry in sftp.scandir(remote_dir):
+                if entry.filename in (".", ".."):
+                    continue
+                remote_item_path = posixpath.join(remote_dir, entry.filename)
+                local_item_path = os.path.join(local_dir, entry.filename)
+                attrs = entry.attrs
+                if attrs.type == asyncssh.FILEXFER_TYPE_SYMLINK:
+                    attrs = await sftp.stat(remote_item_path)
+                if attrs.type == asyncssh.FILEXFER_TYPE_DIRECTORY:
+                    subdirectories.append((remote_item_path, local_item_path))
+                else:
+                    files.append((remote_item_path, local_item_path, attrs.size, attrs.mtime))
+            return subdirectories
+
+        listings = await asyncio.gather(*(list_directory(*directory) for directory in level))
+        level = [directory for subdirectories in listings for directory in subdirectories]
+    return files
+
+
+async def _sftp_fetch_file(sftp, remote_path: str, local_path: str, size, on_bytes):
+    """
+    Copy one remote file with up to SFTP_MAX_REQUESTS block reads in flight.
+
+    Blocks may arrive out of order, so they are written with `os.pwrite` at their
+    offset; `on_bytes(n)` is called for every block written.
+    """
+    fd = os.open(local_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        end = 0
+        async with sftp.open(remote_path, "rb", block_size=SFTP_BLOCK_SIZE, max_requests=SFTP_MAX_REQUESTS) as remote_file:
+            async for offset, data in await remote_file.read_parallel(-1 if size is None else size, 0):
+                await asyncio.to_thread(os.pwrite, fd, data, offset)
+                end = max(end, offset + len(data))
+                on_bytes(len(data))
+        os.ftruncate(fd, end)
+    finally:
+        os.close(fd)
 
 
 async def download_sftp(
@@ -96,49 +333,74 @@ async def download_sftp(
     local_path: str,
     session_id: str,
     port: int = 22,
+    sync: bool = False,
+    checksum: bool = False,
 ):
-    """Asynchronous file or folder download using SFTP."""
+    """
+    Asynchronous file or folder download using SFTP.
+
+    Folders are listed up front and their files fetched SFTP_CONCURRENT_FILES at a
+    time over one pooled SSH connection; progress covers the bytes of the whole folder.
+
+    With `sync`, only files that are new or changed since the last sync according
+    to the sync manifest are fetched (see `SyncPlan`), optionally also comparing a
+    `checksum` computed by `sha256sum` on the server, and the session details
+    report the bytes transferred and skipped.
+    """
     try:
         await update_session_status(session_id, SessionStatusEnum.processing)
 
-        async with asyncssh.connect(host, port=port, username=username, password=password, known_hosts=None) as conn:
-            async with conn.start_sftp_client() as sftp:
-
-                async def download_file(file_path, local_file_path):
-                    processed_size = 0
-                    total_size = (await sftp.stat(file_path)).size
-
-                    async with aiofiles.open(local_file_path, "wb") as local_file:
-                        async with sftp.open(file_path, "rb") as remote_file:
-                            while True:
-                                chunk = await remote_file.read(1024 * 64)
-                                if not chunk:
-                                    break
-                                await local_file.write(chunk)
-                                processed_size += len(chunk)
-                                await update_session_status(
-                                    session_id=session_id,
-                                    status=SessionStatusEnum.processing,
-                                    progress=(processed_size / total_size) * 100,
-                                )
-
-                async def download_folder(folder_path, local_folder_path):
-                    os.makedirs(local_folder_path, exist_ok=True)
-                    for item in await sftp.listdir(folder_path):
-                        remote_item_path = os.path.join(folder_path, item).replace("\\", "/")
-                        local_item_path = os.path.join(local_folder_path, item)
-                        if await sftp.isdir(remote_item_path):
-                            await download_folder(remote_item_path, local_item_path)
-                        else:
-                            await download_file(remote_item_path, local_item_path)
-
-                if await sftp.isdir(remote_path):
-                    await download_folder(remote_path, local_path)
-                else:
-                    if os.path.isdir(local_path):  # If `local_path` is a directory, append the file name
-                        local_path = os.path.join(local_path, os.path.basename(remote_path))
-                    await download_file(remote_path, local_path)
+        async with REMOTE_POOL.sftp(host, port, username, password, with_ssh=True) as (ssh, sftp):
+            remote_attrs = await sftp.stat(remote_path)
+            if remote_attrs.type == asyncssh.FILEXFER_TYPE_DIRECTORY:
+                files = await _sftp_walk(sftp, remote_path, local_path)
+            else:
+                if os.path.isdir(local_path):  # If `local_path` is a directory, append the file name
+                    local_path = os.path.join(local_path, posixpath.basename(remote_path))
+                files = [(remote_path, local_path, remote_attrs.size, remote_attrs.mtime)]
+
+            checksums = await sftp_checksums(ssh, [item[0] for item in files]) if sync and checksum else {}
+            files = [(*item, checksums.get(item[0])) for item in files]
+            plan = SyncPlan(manifest_source("sftp", host, port, username), local_path) if sync else None
+            pending = await plan.pending(files) if plan is not None else files
+
+            total_size = sum(size or 0 for _, _, size, _, _ in files)
+            done = {"bytes": total_size - sum(size or 0 for _, _, size, _, _ in pending), "files": 0}
+
+            def on_bytes(count):
+                if PROGRESS.is_cancelled(session_id):
+                    raise RuntimeError("Cancelled")
+                done["bytes"] += count
+                TRANSFER_BYTES.inc(count, protocol="sftp")
+                if total_size > 0:
+                    PROGRESS.report(session_id, (done["bytes"] / total_size) * 100)
+
+            semaphore = asyncio.Semaphore(SFTP_CONCURRENT_FILES)
+
+            async def fetch(item):
+                async with semaphore:
+                    if PROGRESS.is_cancelled(session_id):
+                        raise RuntimeError("Cancelled")
+                    await _sftp_fetch_file(sftp, item[0], item[1], item[2], on_bytes)
+                    if plan is not None:
+                        plan.transferred(*item)
+                    done["files"] += 1
+                    if total_size == 0:
+                        PROGRESS.report(session_id, (done["files"] / len(pending)) * 100)
+
+            tasks = [asyncio.ensure_future(fetch(item)) for item in pending]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if plan is not None:
+                    await plan.save()
 
-        await update_session_status(session_id, SessionStatusEnum.completed)
+        path_changed(local_path)
+        await PROGRESS.finish(
+            session_id, SessionStatusEnum.completed, details=plan.details() if plan else "", progress=100
+        )
     except Exception as e:
-        await update_session_status(session_id, SessionStatusEnum.failed, details=str(e))
+        await PROGRESS.finish(session_id, SessionStatusEnum.failed, details=str(e))
@@ -0,0 +1,127 @@
+import os
+import shlex
+
+import aioftp
+import asyncssh
+
+from flexport.db import get_sync_manifest, save_sync_manifest
+
+# Paths per `sha256sum` command when checksumming over SSH
+CHECKSUM_BATCH = 100
+
+
+def manifest_source(protocol: str, host: str, port: int, username: str) -> str:
+    """
+    Identify a remote server and account in the sync manifest.
+    """
+    return f"{protocol}://{username}@{host}:{port}"
+
+
+class SyncPlan:
+    """
+    Compare a remote listing with the sync manifest and track what a sync transferred.
+
+    A file is skipped when the manifest records the same remote size and mtime (and
+    checksum, when both sides have one) and the local copy still has the size and
+    mtime it was left with, so files changed on either side are transferred again.
+    """
+
+    def __init__(self, source: str, local_root: str):
+        self.source = source
+        self.local_root = local_root
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.transferred_files = 0
+        self.transferred_bytes = 0
+        self._synced = []
+
+    async def pending(self, files: list) -> list:
+        """
+        Return the `(remote_path, local_path, size, mtime, checksum)` entries of `files`
+        that need transferring.
+        """
+        manifest = await get_sync_manifest(self.source, self.local_root)
+        pending = []
+        for remote_path, local_path, size, mtime, checksum in files:
+            row = manifest.get(local_path)
+            if row is not None and self._unchanged(row, local_path, size, mtime, checksum):
+                self.skipped_files += 1
+                self.skipped_bytes += size or 0
+            else:
+                pending.append((remote_path, local_path, size, mtime, checksum))
+        return pending
+
+    @staticmethod
+    def _unchanged(row, local_path: str, size, mtime, checksum) -> bool:
+        synced_size, synced_mtime, synced_checksum, local_size, local_mtime_ns = row
+        if size is None or mtime is None or size != synced_size or int(mtime) != synced_mtime:
+            return False
+        if checksum and synced_checksum and checksum != synced_checksum:
+            return False
+        try:
+            st = os.stat(local_path)
+        except OSError:
+            return False
+        return st.st_size == local_size and st.st_mtime_ns == local_mtime_ns
+
+    def transferred(self, remote_path: str, local_path: str, size, mtime, checksum):
+        """
+        Record a file written to `local_path`; saved to the manifest by `save`.
+        """
+        st = os.stat(local_path)
+        self.transferred_files += 1
+        self.transferred_bytes += st.st_size
+        self._synced.append((
+            local_path, remote_path, size, int(mtime) if mtime is not None else None, checksum,
+            st.st_size, st.st_mtime_ns,
+        ))
+
+    async def save(self):
+        synced, self._synced = self._synced, []
+        await save_sync_manifest(self.source, synced)
+
+    def details(self) -> str:
+        return (
+            f"Transferred {self.transferred_files} files ({self.transferred_bytes} bytes), "
+            f"skipped {self.skipped_files} unchanged files ({self.skipped_bytes} bytes)"
+        )
+
+
+async def sftp_checksums(ssh, paths: list) -> dict:
+    """
+    SHA-256 of remote files computed by `sha256sum` on the server, keyed by path.
+    Paths the command could not read, or servers without a shell, are left out.
+    """
+    checksums = {}
+    for start in range(0, len(paths), CHECKSUM_BATCH):
+        batch = paths[start:start + CHECKSUM_BATCH]
+        try:
+            result = await ssh.run("sha256sum -- " + " ".join(shlex.quote(path) for path in batch), check=False)
+        except asyncssh.Error:
+            break
+        output = result.stdout or ""
+        if not output:
+            break
+        for line in output.splitlines():
+            digest, _, path = line.partition("  ")
+            if len(digest) == 64 and path:
+                checksums[path] = digest
+    return checksums
+
+
+async def ftp_checksums(client, paths: list) -> dict:
+    """
+    SHA-256 of remote files from the non-standard XSHA256 command, keyed by path.
+    Returns what was collected before the first refusal, as servers lacking the
+    command refuse every path.
+    """
+    checksums = {}
+    for path in paths:
+        try:
+            _, info = await client.command(f"XSHA256 {path}", "2xx")
+        except aioftp.StatusCodeError:
+            break
+        digest = next((word for word in " ".join(info).split() if len(word) == 64), None)
+        if digest is not None:
+            checksums[path] = digest.lower()
+    return checksums
@@ -1,13 +1,17 @@
 import os
+import time
+import asyncio
+import hashlib
 import datetime
+import threading
+from collections import OrderedDict
 
-import sqlite3
 import jwt
-from fastapi import Request, status, HTTPException
+from fastapi import Request, status, HTTPException, logger
 from fastapi.security import HTTPBearer
 from dotenv import load_dotenv
 
-from flexport.db import DATABASE_PATH
+from flexport.db import DB, get_sync_connection
 
 
 # Use environment variable or fallback to a default (only for development)
@@ -21,36 +25,83 @@ if not SECRET_KEY:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 600
+# Validated tokens are trusted from memory for at most this long before the table is re-checked
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 60))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+# Interval between purges of expired rows from the tokens table
+TOKEN_PURGE_SECONDS = int(os.getenv("TOKEN_PURGE_SECONDS", 3600))
 
 security = HTTPBearer()
 
 
-def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES):
+class TokenCache:
+    """
+    Bounded TTL cache of validated tokens, keyed by the token's SHA-256 digest.
+
+    Entries live for TOKEN_CACHE_TTL_SECONDS (never past the token's own expiry).
+    `remove_token` invalidates an entry immediately; other worker processes
+    notice a logout once their entry's TTL runs out.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> str | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            username, valid_until = entry
+            if time.time() >= valid_until:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return username
+
+    def put(self, token: str, username: str, expires_at: float):
+        with self._lock:
+            self._entries[self._key(token)] = (username, min(time.time() + self.ttl, expires_at))
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+
+TOKEN_CACHE = TokenCache()
+
+
+async def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES):
     to_encode = data.copy()
     expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=expires_delta or ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    save_token(encoded_jwt, data["sub"], expire)
+    await save_token(encoded_jwt, data["sub"], expire)
+    TOKEN_CACHE.put(encoded_jwt, data["sub"], expire.replace(tzinfo=datetime.timezone.utc).timestamp())
     return encoded_jwt
 
 
-def save_token(token: str, username: str, expiry: datetime.datetime):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO tokens (token, username, expiry) VALUES (?, ?, ?)",
-        (token, username, expiry),
-    )
-    conn.commit()
-    conn.close()
+async def save_token(token: str, username: str, expiry: datetime.datetime):
+    async with DB.write() as conn:
+        await conn.execute(
+            "INSERT INTO tokens (token, username, expiry) VALUES (?, ?, ?)",
+            (token, username, expiry),
+        )
 
 
 def get_saved_token(token: str) -> dict | None:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, expiry FROM tokens WHERE token = ?", (token,))
-    result = cursor.fetchone()
-    conn.close()
+    conn = get_sync_connection()
+    result = conn.execute("SELECT username, expiry FROM tokens WHERE token = ?", (token,)).fetchone()
     if result:
         return {"username": result[0], "expiry": result[1]}
     return None
@@ -73,17 +124,52 @@ def get_current_user(request: Request):
             raise credentials_exception
 
         # Check if token is still valid
+        if TOKEN_CACHE.get(token) == username:
+            return username
         token_data = get_saved_token(token)
         if not token_data or token_data["username"] != username:
             raise credentials_exception
+        TOKEN_CACHE.put(token, username, payload["exp"])
         return username
     except jwt.PyJWTError:
         raise credentials_exception
 
 
-def remove_token(token: str):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM tokens WHERE token = ?", (token,))
-    conn.commit()
-    conn.close()
+async def remove_token(token: str):
+    TOKEN_CACHE.invalidate(token)
+    async with DB.write() as conn:
+        await conn.execute("DELETE FROM tokens WHERE token = ?", (token,))
+
+
+async def purge_expired_tokens():
+    """
+    Delete tokens whose expiry has passed and return how many were removed.
+    """
+    async with DB.write() as conn:
+        cursor = await conn.execute("DELETE FROM tokens WHERE expiry < ?", (datetime.datetime.utcnow(),))
+        return cursor.rowcount
+
+
+async def _purge_loop():
+    while True:
+        try:
+            await purge_expired_tokens()
+        except Exception as e:
+            logger.logger.error(f"Failed to purge expired tokens: {e}")
+        await asyncio.sleep(TOKEN_PURGE_SECONDS)
+
+
+_purge_task = None
+
+
+async def start_token_purge():
+    """
+    Start purging expired tokens in the background.
+    """
+    global _purge_task
+    _purge_task = asyncio.get_running_loop().create_task(_purge_loop())
+
+
+async def stop_token_purge():
+    if _purge_task is not None:
+        _purge_task.cancel()
@@ -0,0 +1,195 @@
+import os
+import time
+import errno
+import shutil
+import uuid
+import asyncio
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from flexport.db import reserve_upload, mark_upload_chunk, delete_upload, get_stale_uploads
+from flexport.changes import path_changed
+from flexport.executors import QUICK_POOL
+from flexport.metrics import TRANSFER_BYTES
+
+load_dotenv()
+# Chunk size offered to clients that do not ask for one
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+UPLOAD_MIN_CHUNK_SIZE = 256 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Unfinished uploads older than this are removed together with their partial file
+UPLOAD_EXPIRY_SECONDS = int(os.getenv("UPLOAD_EXPIRY_SECONDS", 24 * 3600))
+# Per user cap on unfinished uploads and on the bytes preallocated for them
+UPLOAD_MAX_OPEN_PER_USER = int(os.getenv("UPLOAD_MAX_OPEN_PER_USER", 16))
+UPLOAD_MAX_RESERVED_BYTES_PER_USER = int(os.getenv("UPLOAD_MAX_RESERVED_BYTES_PER_USER", 8 * 1024 * 1024 * 1024))
+# Request body bytes gathered before each pwrite
+UPLOAD_WRITE_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that does not fit the upload; `status_code` is the HTTP status."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _chunk_count(size: int, chunk_size: int) -> int:
+    return max(1, (size + chunk_size - 1) // chunk_size)
+
+
+def _chunk_length(upload: dict, index: int) -> int:
+    return min(upload["chunk_size"], upload["size"] - index * upload["chunk_size"])
+
+
+def upload_status(upload: dict) -> dict:
+    """
+    Describe an upload for clients: its geometry and the chunks still missing.
+    """
+    chunks = _chunk_count(upload["size"], upload["chunk_size"])
+    received = set(upload["received"])
+    return {
+        "upload_id": upload["upload_id"],
+        "file_name": Path(upload["target"]).name,
+        "size": upload["size"],
+        "chunk_size": upload["chunk_size"],
+        "chunks": chunks,
+        "received": sorted(received),
+        "missing": [index for index in range(chunks) if index not in received],
+    }
+
+
+def _preallocate(path: Path, size: int):
+    """
+    Create the partial file at its final size; fails with ENOSPC before any data is
+    accepted when the filesystem cannot hold it.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        if size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):  # Filesystem without fallocate
+                    raise
+                os.ftruncate(fd, size)
+    except BaseException:
+        os.close(fd)
+        path.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+
+
+async def start_upload(directory: Path, file_name: str, size: int, username: str, chunk_size: int | None = None) -> dict:
+    """
+    Register an upload of `size` bytes to `directory/file_name` and preallocate its partial file.
+
+    The upload is refused when the user already has UPLOAD_MAX_OPEN_PER_USER unfinished
+    uploads or it would take their reserved bytes past UPLOAD_MAX_RESERVED_BYTES_PER_USER.
+    Filesystem work runs on the quick pool, under the user's limit.
+    """
+    await purge_stale_uploads(username)
+    if (await QUICK_POOL.run(username, shutil.disk_usage, directory)).free < size:
+        raise UploadError(507, "Not enough free space for this file.")
+    chunk_size = min(max(chunk_size or UPLOAD_CHUNK_SIZE, UPLOAD_MIN_CHUNK_SIZE), UPLOAD_MAX_CHUNK_SIZE)
+    upload_id = uuid.uuid4().hex
+    target = directory / file_name
+    part_path = directory / f".{file_name}.{upload_id}.part"
+    upload = {
+        "upload_id": upload_id,
+        "username": username,
+        "target": str(target),
+        "part_path": str(part_path),
+        "size": size,
+        "chunk_size": chunk_size,
+        "created_at": time.time(),
+    }
+    if not await reserve_upload(upload, UPLOAD_MAX_OPEN_PER_USER, UPLOAD_MAX_RESERVED_BYTES_PER_USER):
+        raise UploadError(429, "Too many unfinished uploads; finish or abort some first.")
+    try:
+        await QUICK_POOL.run(username, _preallocate, part_path, size)
+    except BaseException as e:
+        await delete_upload(upload_id)
+        if isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.EDQUOT):
+            raise UploadError(507, "Not enough free space for this file.")
+        raise
+    return {**upload, "received": []}
+
+
+async def write_chunk(upload: dict, offset: int, length: int | None, body) -> int:
+    """
+    Write the chunk starting at `offset` from the async byte iterator `body` with `os.pwrite`.
+
+    The offset must start a chunk and the declared `length` (Content-Length) must
+    match that chunk, so nothing is written for a request that cannot fit, and a
+    body running past the chunk is rejected. Chunks may arrive in any order and
+    in parallel. Returns the chunk index.
+    """
+    if offset % upload["chunk_size"] or not 0 <= offset < max(upload["size"], 1):
+        raise UploadError(400, "Offset does not start a chunk of this upload.")
+    index = offset // upload["chunk_size"]
+    expected = _chunk_length(upload, index)
+    if length is not None and length != expected:
+        raise UploadError(400, f"Chunk {index} must be {expected} bytes.")
+
+    fd = os.open(upload["part_path"], os.O_WRONLY)
+    try:
+        written = 0
+        buffer = bytearray()
+        async for data in body:
+            if written + len(buffer) + len(data) > expected:
+                raise UploadError(400, f"Chunk {index} must be {expected} bytes.")
+            buffer += data
+            if len(buffer) >= UPLOAD_WRITE_BUFFER:
+                await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        os.close(fd)
+    if written != expected:
+        raise UploadError(400, f"Chunk {index} ended after {written} of {expected} bytes.")
+    TRANSFER_BYTES.inc(written, protocol="upload")
+    await mark_upload_chunk(upload["upload_id"], index)
+    return index
+
+
+async def finish_upload(upload: dict) -> Path:
+    """
+    Move a fully received upload into place and forget it.
+    """
+    missing = upload_status(upload)["missing"]
+    if missing:
+        raise UploadError(409, f"{len(missing)} chunks are missing.")
+    target = Path(upload["target"])
+    os.replace(upload["part_path"], target)
+    await delete_upload(upload["upload_id"])
+    path_changed(target)
+    return target
+
+
+async def abort_upload(upload: dict):
+    Path(upload["part_path"]).unlink(missing_ok=True)
+    await delete_upload(upload["upload_id"])
+
+
+def _remove_files(paths):
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+
+
+async def purge_stale_uploads(username: str):
+    """
+    Remove uploads not finished within UPLOAD_EXPIRY_SECONDS and their partial files,
+    deleting the files on the quick pool under `username`'s limit.
+    """
+    stale = await get_stale_uploads(time.time() - UPLOAD_EXPIRY_SECONDS)
+    if not stale:
+        return
+    await QUICK_POOL.run(username, _remove_files, [part_path for _, part_path in stale])
+    for upload_id, _ in stale:
+        await delete_upload(upload_id)
@@ -1,9 +1,12 @@
 import stat
+import time
 from pwd import getpwnam
 from pathlib import Path
 
 import pam
 
+from flexport.metrics import ACCESS_CHECK_SECONDS
+
 
 def authenticate_user(username: str, password: str) -> bool:
     p = pam.pam()
@@ -14,6 +17,7 @@ def has_access_to_path(path: Path, current_user: str) -> bool:
     """
     Check if the current user has access to the specified path.
     """
+    start = time.perf_counter()
     try:
         user = getpwnam(current_user)
         file_stat = path.stat()
@@ -26,3 +30,5 @@ def has_access_to_path(path: Path, current_user: str) -> bool:
         return False
     except Exception:
         return False
+    finally:
+        ACCESS_CHECK_SECONDS.observe(time.perf_counter() - start)
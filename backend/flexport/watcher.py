@@ -0,0 +1,297 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import struct
+import asyncio
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from fastapi import logger
+
+from flexport.listing import LISTING_CACHE
+from flexport.search_index import SEARCH_INDEX
+
+load_dotenv()
+WATCHER_ENABLED = os.getenv("WATCHER_ENABLED", "1") == "1"
+# Maximum number of directories watched at once; least recently used watches are dropped
+WATCHER_MAX_DIRECTORIES = int(os.getenv("WATCHER_MAX_DIRECTORIES", 4096))
+# Events for the same directory arriving within this window are applied together
+WATCHER_COALESCE_MS = int(os.getenv("WATCHER_COALESCE_MS", 200))
+# Interval of the mtime poller used where inotify is unavailable
+WATCHER_POLL_SECONDS = float(os.getenv("WATCHER_POLL_SECONDS", 5))
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_MODIFY | IN_ATTRIB
+    | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher:
+    """
+    Watch directories known to the listing cache and search index and apply
+    filesystem changes made outside FlexPort to them.
+
+    Events are coalesced per directory for WATCHER_COALESCE_MS and applied as
+    deltas: changed entries are patched into cached listings and the directory
+    is re-listed in the search index. Uses inotify through ctypes on Linux and
+    falls back to polling directory mtimes elsewhere.
+    """
+
+    def __init__(self, max_directories: int = WATCHER_MAX_DIRECTORIES):
+        self.max_directories = max_directories
+        self.backend = None
+        self._fd = None
+        self._libc = None
+        self._loop = None
+        self._poll_task = None
+        self._flush_handle = None
+        self._lock = threading.Lock()
+        # path -> inotify watch descriptor (or last seen mtime_ns when polling), in LRU order
+        self._watches = OrderedDict()
+        self._paths_by_wd = {}
+        # directory -> (first event time, set of changed names or None for "everything")
+        self._pending = {}
+        self.events_received = 0
+        self.flushes = 0
+        self.overflows = 0
+        self.evictions = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self, loop):
+        self._loop = loop
+        if sys.platform.startswith("linux"):
+            try:
+                self._start_inotify()
+            except OSError as e:
+                logger.logger.warning(f"inotify unavailable, polling directories instead: {e}")
+        if self.backend is None:
+            self.backend = "poll"
+            self._poll_task = loop.create_task(self._poll())
+        LISTING_CACHE.on_store = self.watch
+        SEARCH_INDEX.on_rescan = self.watch
+
+    def _start_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._libc, self._fd = libc, fd
+        self._loop.add_reader(fd, self._read_events)
+        self.backend = "inotify"
+
+    async def stop(self):
+        LISTING_CACHE.on_store = None
+        SEARCH_INDEX.on_rescan = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        with self._lock:
+            self._watches.clear()
+            self._paths_by_wd.clear()
+
+    # ------------------------------------------------------------------
+    # Watch set
+    # ------------------------------------------------------------------
+    def watch(self, path: str):
+        """
+        Start watching `path`, evicting the least recently used watch if over the limit.
+        Cached listings of an evicted directory are dropped, as no events keep them
+        current any more. Safe to call from any thread.
+        """
+        evicted_paths = []
+        with self._lock:
+            if path in self._watches:
+                self._watches.move_to_end(path)
+                return
+            if self.backend == "inotify":
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+                if wd < 0:
+                    return
+                self._paths_by_wd[wd] = path
+                self._watches[path] = wd
+            else:
+                try:
+                    self._watches[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    return
+            while len(self._watches) > self.max_directories:
+                evicted_path, evicted = self._watches.popitem(last=False)
+                if self.backend == "inotify":
+                    self._libc.inotify_rm_watch(self._fd, evicted)
+                    self._paths_by_wd.pop(evicted, None)
+                evicted_paths.append(evicted_path)
+                self.evictions += 1
+        for evicted_path in evicted_paths:
+            LISTING_CACHE.invalidate(evicted_path)
+
+    # ------------------------------------------------------------------
+    # Event intake
+    # ------------------------------------------------------------------
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                self._handle_event(wd, mask, name)
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        self.events_received += 1
+        if mask & IN_Q_OVERFLOW:
+            self.overflows += 1
+            with self._lock:
+                paths = list(self._watches)
+            for path in paths:
+                self._enqueue(path, None)
+            return
+        with self._lock:
+            path = self._paths_by_wd.get(wd)
+            if mask & IN_IGNORED and path is not None:
+                self._paths_by_wd.pop(wd, None)
+                if self._watches.get(path) == wd:
+                    del self._watches[path]
+        if path is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            self._enqueue(path, None)
+            self._enqueue(os.path.dirname(path), [os.path.basename(path)])
+        elif name:
+            self._enqueue(path, [name])
+
+    def _enqueue(self, directory: str, names):
+        first_seen, pending = self._pending.get(directory, (time.monotonic(), set()))
+        if names is None or pending is None:
+            pending = None
+        else:
+            pending.update(names)
+        self._pending[directory] = (first_seen, pending)
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(WATCHER_COALESCE_MS / 1000, self._schedule_flush)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(WATCHER_POLL_SECONDS)
+            with self._lock:
+                watched = list(self._watches.items())
+            for path, mtime_ns in watched:
+                try:
+                    current = os.stat(path).st_mtime_ns
+                except OSError:
+                    current = None
+                if current != mtime_ns:
+                    self.events_received += 1
+                    with self._lock:
+                        if current is None:
+                            self._watches.pop(path, None)
+                        elif path in self._watches:
+                            self._watches[path] = current
+                    self._enqueue(path, None)
+
+    # ------------------------------------------------------------------
+    # Delta application
+    # ------------------------------------------------------------------
+    def _schedule_flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._loop.create_task(self._flush(batch))
+
+    async def _flush(self, batch: dict):
+        try:
+            await asyncio.to_thread(self._apply, batch)
+        except Exception as e:
+            logger.logger.error(f"Failed to apply filesystem changes: {e}")
+        lag_ms = (time.monotonic() - min(first_seen for first_seen, _ in batch.values())) * 1000
+        self.flushes += 1
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    @staticmethod
+    def _apply(batch: dict):
+        # The mtimes the deltas are keyed to, taken before any entry is re-read
+        observed = {}
+        for directory, (_, names) in batch.items():
+            try:
+                observed[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                pass
+        for directory, (_, names) in batch.items():
+            if names is None or directory not in observed:
+                LISTING_CACHE.invalidate(directory)
+            else:
+                LISTING_CACHE.apply_delta(directory, sorted(names), observed[directory])
+        SEARCH_INDEX.refresh_directories(list(batch))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            watched = len(self._watches)
+        return {
+            "backend": self.backend,
+            "watched_directories": watched,
+            "max_directories": self.max_directories,
+            "queue_depth": len(self._pending),
+            "queued_entries": sum(len(names) if names else 0 for _, names in self._pending.values()),
+            "events_received": self.events_received,
+            "flushes": self.flushes,
+            "overflows": self.overflows,
+            "evictions": self.evictions,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+WATCHER = Watcher()
+
+
+async def start_watcher():
+    """
+    Start the filesystem watcher on the running event loop.
+    """
+    if WATCHER_ENABLED:
+        WATCHER.start(asyncio.get_running_loop())
+
+
+async def stop_watcher():
+    """
+    Stop the filesystem watcher and release its watches.
+    """
+    if WATCHER.backend is not None:
+        await WATCHER.stop()
@@ -1,19 +1,31 @@
 import os
 import uuid
 import time
-import aiohttp
+import secrets
+import asyncio
 import aiofiles
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, status, Depends, File, UploadFile, Form, Request, BackgroundTasks, Query
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, status, Depends, File, UploadFile, Form, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2AuthorizationCodeBearer
+from fastapi.datastructures import Headers
 from dotenv import load_dotenv
 
-from flexport.tokens import create_access_token, get_current_user, remove_token
+from flexport.tokens import create_access_token, get_current_user, remove_token, start_token_purge, stop_token_purge
 from flexport.utils import authenticate_user, has_access_to_path
-from flexport.sftp_ftp import list_files_ftp, list_files_sftp, download_ftp, download_sftp
+from flexport.listing import LISTING_CACHE, format_entry, list_directory_after, list_directory_page
+from flexport.search_index import QueryTooBroad, init_search_index, search_files_indexed
+from flexport.search_stream import stream_search
+from flexport.changes import path_changed
+from flexport.watcher import WATCHER, start_watcher, stop_watcher
+from flexport.pagination import decode_cursor, encode_cursor, search_fingerprint, sessions_fingerprint
+from flexport.sftp_ftp import list_files_ftp, list_files_sftp, stream_files_sftp, download_ftp, download_sftp
+from flexport.links import download_file_from_link
+from flexport.downloads import DownloadResponse
+from flexport.http_client import HTTP_CLIENT, start_http_client, stop_http_client
+from flexport.remote_pool import REMOTE_POOL, start_remote_pool, stop_remote_pool
 from flexport.models import (
     Credentials,
     SessionStatus,
@@ -21,11 +33,35 @@ from flexport.models import (
     SessionTypeEnum,
     SFTPRequest,
     LinksUploadBody,
+    UploadInitBody,
+)
+from flexport.db import init_db, close_db, query_user_sessions, count_user_sessions, delete_session, get_upload
+from flexport.uploads import UploadError, upload_status, start_upload, write_chunk, finish_upload, abort_upload
+from flexport.scheduler import SCHEDULER, schedule_transfer, start_scheduler, stop_scheduler
+from flexport.progress import PROGRESS, start_progress_writer, stop_progress_writer
+from flexport.events import SESSION_EVENTS, stream_session_events
+from flexport.retention import start_session_retention, stop_session_retention
+from flexport.executors import IO_POOLS, SCAN_POOL, QUICK_POOL, SEARCH_POOL, stop_io_pools
+from flexport.metrics import (
+    REGISTRY,
+    TRANSFER_BYTES,
+    Counter,
+    Gauge,
+    MetricsMiddleware,
+    start_loop_lag_probe,
+    stop_loop_lag_probe,
 )
-from flexport.db import init_db, create_session, get_user_sessions, delete_session, update_session_status, get_session
 
 
 MAX_FILE_SIZE = 1 * 1024 * 1024 * 1024  # 1 GB
+# Room left in a direct upload's Content-Length for the multipart framing and form fields
+DIRECT_UPLOAD_FORM_OVERHEAD = 64 * 1024
+# Shapes of the sort keys carried by listing and search cursors
+LISTING_CURSOR_KEY = (bool, str)
+SEARCH_CURSOR_KEY = (bool, str, str)
+SEARCH_PAGE_SIZE = 1000
+SESSIONS_CURSOR_KEY = (int, str)
+SESSIONS_PAGE_SIZE = 100
 
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl="/login",
@@ -34,13 +70,41 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
 
 # FastAPI Application Instance
 app = FastAPI(
-    on_startup=[init_db],
+    on_startup=[
+        init_db, start_token_purge, start_session_retention, start_progress_writer, start_http_client,
+        start_remote_pool, start_scheduler, init_search_index, start_watcher, start_loop_lag_probe,
+    ],
+    on_shutdown=[
+        stop_watcher, stop_scheduler, stop_remote_pool, stop_http_client, stop_session_retention, stop_token_purge,
+        stop_progress_writer, stop_io_pools, stop_loop_lag_probe, close_db,
+    ],
     title="FlexPort",
     description="A flexible file transfer service.",
     version="0.1.0",
 )
 
 
+class DirectUploadSizeLimit:
+    """
+    ASGI middleware refusing a direct upload whose Content-Length already exceeds
+    MAX_FILE_SIZE, before FastAPI spools its body to a temporary file.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/direct_upload":
+            length = Headers(scope=scope).get("content-length", "")
+            if length.isdigit() and int(length) > MAX_FILE_SIZE + DIRECT_UPLOAD_FORM_OVERHEAD:
+                response = JSONResponse(
+                    content={"detail": "File is too large."}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
 # CORS Middleware Configuration
 load_dotenv()
 ORIGIN = os.getenv("ORIGIN")
@@ -51,23 +115,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(DirectUploadSizeLimit)
+# Bearer token required to scrape /metrics; the endpoint is open when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 
 # ==================================================================
 # Authentication Endpoints
 # ==================================================================
 @app.post("/login")
-def login(credentials: Credentials):
+async def login(credentials: Credentials):
     """
     Authenticate user and issue JWT token.
     """
-    is_authenticated = authenticate_user(credentials.username, credentials.password)
+    is_authenticated = await asyncio.to_thread(authenticate_user, credentials.username, credentials.password)
     if not is_authenticated:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
         )
-    token = create_access_token(data={"sub": credentials.username})
+    token = await create_access_token(data={"sub": credentials.username})
     response = JSONResponse(content={"success": True})
     response.set_cookie(
         key="token",
@@ -79,7 +147,7 @@ def login(credentials: Credentials):
 
 
 @app.post("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     """
     Logout user by removing the JWT token.
     """
@@ -87,7 +155,7 @@ def logout(request: Request):
     response = JSONResponse(content={"success": True})
     response.delete_cookie(key="token")
     if token:
-        remove_token(token)
+        await remove_token(token)
     return response
 
 
@@ -106,16 +174,7 @@ def check_token(request: Request):
 # ==================================================================
 # File Endpoints
 # ==================================================================
-@app.get("/list_files")
-def list_files(
-    path: str = "", 
-    page: int = Query(1, ge=1),
-    page_size: int = Query(100, ge=1, le=1000),
-    current_user: str = Depends(get_current_user)
-):
-    """
-    List files and directories in the specified path.
-    """
+def _list_files(path: str, page: int, page_size: int, cursor: str | None, current_user: str):
     target_path = Path(path).resolve() if path != "" else Path(f"/home/{current_user}")
 
     if not target_path.exists() or not target_path.is_dir():
@@ -130,43 +189,30 @@ def list_files(
             detail=f"You don't have permission to access {target_path}",
         )
 
+    after, cursor_fingerprint = None, None
+    if cursor:
+        try:
+            after, cursor_fingerprint = decode_cursor(cursor, LISTING_CURSOR_KEY)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     try:
-        all_items = []
-        for item in target_path.iterdir():
-            if not isinstance(item, PermissionError) and item.exists():
-                all_items.append({
-                    "name": item.name,
-                    "is_file": item.is_file(),
-                    "is_dir": item.is_dir(),
-                    "size": item.stat().st_size,
-                    "owner": item.owner(),
-                    "group": item.group(),
-                    "date_created": item.stat().st_ctime,
-                    "date_modified": item.stat().st_mtime,
-                    "permissions": oct(item.stat().st_mode & 0o777),
-                    "path": str(item),
-                })
-        
-        # Sort items (directories first, then by name)
-        sorted_items = sorted(all_items, key=lambda x: (not x["is_dir"], x["name"]))
-        
-        # Calculate total items and pages
-        total_items = len(sorted_items)
+        if after is None:
+            page_items, total_items, next_key, fingerprint = list_directory_page(target_path, page, page_size)
+        else:
+            page_items, total_items, next_key, fingerprint = list_directory_after(target_path, after, page_size)
         total_pages = (total_items + page_size - 1) // page_size
-        
-        # Get the current page of items
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_items = sorted_items[start_idx:end_idx]
-        
+
         return {
             "items": page_items,
             "current_path": str(target_path),
             "pagination": {
-                "page": page,
+                "page": page if after is None else None,
                 "page_size": page_size,
                 "total_items": total_items,
-                "total_pages": total_pages
+                "total_pages": total_pages,
+                "next_cursor": encode_cursor(next_key, fingerprint) if next_key else None,
+                "changed": cursor_fingerprint is not None and cursor_fingerprint != fingerprint,
             }
         }
     except Exception as e:
@@ -176,11 +222,178 @@ def list_files(
         )
 
 
-@app.get("/space_info")
-def check_available_space_on_disk(path: str = "", current_user: str = Depends(get_current_user)):
+@app.get("/list_files")
+async def list_files(
+    path: str = "", 
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    current_user: str = Depends(get_current_user)
+):
     """
-    Check available, used, and total space for the given path.
+    List files and directories in the specified path.
+
+    Pass the returned `next_cursor` as `cursor` to continue after the last item;
+    `page` is ignored when a cursor is given.
+    """
+    return await SCAN_POOL.run(current_user, _list_files, path, page, page_size, cursor, current_user)
+
+
+Gauge(
+    "flexport_transfers_running",
+    "Transfers running in the scheduler.",
+    collect=lambda: SCHEDULER.stats()["running"],
+)
+Gauge(
+    "flexport_transfers_queued",
+    "Transfers waiting in the scheduler's queues.",
+    collect=lambda: SCHEDULER.stats()["queued"],
+)
+Gauge(
+    "flexport_io_pool_calls",
+    "Calls running on, or waiting for, each I/O pool.",
+    ("pool", "state"),
+    collect=lambda: {
+        (pool.name, state): pool.stats()[state] for pool in IO_POOLS for state in ("running", "waiting")
+    },
+)
+Gauge(
+    "flexport_remote_connections",
+    "Open FTP/SFTP connections, and how many of them are idle in the pool.",
+    ("state",),
+    collect=lambda: {(state,): REMOTE_POOL.stats()[state] for state in ("open", "idle")},
+)
+Gauge(
+    "flexport_session_event_subscribers",
+    "Open session event streams.",
+    collect=lambda: SESSION_EVENTS.stats()["subscribers"],
+)
+Gauge(
+    "flexport_session_events_tracked_sessions",
+    "Sessions whose events are published to subscribers.",
+    collect=lambda: SESSION_EVENTS.stats()["tracked_sessions"],
+)
+Counter(
+    "flexport_session_events_published_total",
+    "Session events published.",
+    collect=lambda: SESSION_EVENTS.stats()["published"],
+)
+Gauge(
+    "flexport_transfer_user_jobs",
+    "Transfers running and queued per user with any.",
+    ("username", "state"),
+    collect=lambda: {
+        (username, state): jobs[state]
+        for username, jobs in SCHEDULER.stats()["users"].items()
+        for state in ("running", "queued")
+    },
+)
+Counter(
+    "flexport_remote_pool_connections_total",
+    "FTP/SFTP connections opened, reused from the pool, and discarded.",
+    ("event",),
+    collect=lambda: {(event,): REMOTE_POOL.stats()[event] for event in ("opened", "reused", "discarded")},
+)
+Gauge(
+    "flexport_http_client_open",
+    "Whether the shared HTTP client session is open.",
+    collect=lambda: int(HTTP_CLIENT.stats()["open"]),
+)
+Gauge(
+    "flexport_io_pool_workers",
+    "Threads of each I/O pool.",
+    ("pool",),
+    collect=lambda: {(pool.name,): pool.workers for pool in IO_POOLS},
+)
+Counter(
+    "flexport_io_pool_calls_total",
+    "Calls submitted to, and completed by, each I/O pool.",
+    ("pool", "state"),
+    collect=lambda: {
+        (pool.name, state): pool.stats()[state] for pool in IO_POOLS for state in ("submitted", "completed")
+    },
+)
+Gauge(
+    "flexport_io_pool_queue_seconds",
+    "Time calls waited for a thread and the user's slot: average, 95th percentile of recent calls, and maximum.",
+    ("pool", "stat"),
+    collect=lambda: {
+        (pool.name, stat): pool.stats()[f"queue_ms_{stat}"] / 1000 for pool in IO_POOLS for stat in ("avg", "p95", "max")
+    },
+)
+Counter(
+    "flexport_listing_cache_lookups_total",
+    "Directory listing cache lookups, per result.",
+    ("result",),
+    collect=lambda: {("hit",): LISTING_CACHE.hits, ("miss",): LISTING_CACHE.misses},
+)
+Gauge(
+    "flexport_listing_cache_records",
+    "Entries held by the directory listing cache, and its budget.",
+    ("state",),
+    collect=lambda: {
+        ("cached",): LISTING_CACHE.stats()["records"],
+        ("max",): LISTING_CACHE.max_records,
+    },
+)
+Gauge(
+    "flexport_listing_cache_directories",
+    "Directory snapshots held by the listing cache.",
+    collect=lambda: LISTING_CACHE.stats()["directories"],
+)
+Gauge(
+    "flexport_watcher_directories",
+    "Directories watched for changes, and the most that may be.",
+    ("state",),
+    collect=lambda: {("watched",): WATCHER.metrics()["watched_directories"], ("max",): WATCHER.max_directories},
+)
+Gauge(
+    "flexport_watcher_queue",
+    "Directories, and changed entries in them, waiting to be applied.",
+    ("kind",),
+    collect=lambda: (lambda metrics: {
+        ("directories",): metrics["queue_depth"],
+        ("entries",): metrics["queued_entries"],
+    })(WATCHER.metrics()),
+)
+Counter(
+    "flexport_watcher_events_total",
+    "Watcher events received, batches applied, inotify queue overflows and evicted watches.",
+    ("event",),
+    collect=lambda: {
+        ("received",): WATCHER.events_received,
+        ("flush",): WATCHER.flushes,
+        ("overflow",): WATCHER.overflows,
+        ("eviction",): WATCHER.evictions,
+    },
+)
+Gauge(
+    "flexport_watcher_lag_seconds",
+    "Time from a change's first event until it was applied: last batch and maximum.",
+    ("stat",),
+    collect=lambda: {("last",): WATCHER.last_lag_ms / 1000, ("max",): WATCHER.max_lag_ms / 1000},
+)
+Gauge(
+    "flexport_watcher_backend",
+    "Mechanism the watcher uses, as a label.",
+    ("backend",),
+    collect=lambda: {(WATCHER.backend or "none",): 1},
+)
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
     """
+    Expose counters, latency histograms and gauges in the Prometheus text format.
+    """
+    if METRICS_TOKEN is not None:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token, METRICS_TOKEN):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token.")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def _check_available_space_on_disk(path: str, current_user: str):
     target_path = Path(path).resolve() if path != "" else Path(f"/home/{current_user}")
 
     if not has_access_to_path(target_path, current_user):
@@ -203,6 +416,14 @@ def check_available_space_on_disk(path: str = "", current_user: str = Depends(ge
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@app.get("/space_info")
+async def check_available_space_on_disk(path: str = "", current_user: str = Depends(get_current_user)):
+    """
+    Check available, used, and total space for the given path.
+    """
+    return await QUICK_POOL.run(current_user, _check_available_space_on_disk, path, current_user)
+
+
 @app.post("/direct_upload")
 async def upload_files(
     current_path: str = Form(...),
@@ -223,6 +444,9 @@ async def upload_files(
     if not file.filename:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No file selected.")
 
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large.")
+
     file_path = upload_dir / file.filename
     
     # Stream the file to disk instead of loading it all into memory
@@ -234,21 +458,130 @@ async def upload_files(
             if not chunk:
                 break
             await buffer.write(chunk)
+            TRANSFER_BYTES.inc(len(chunk), protocol="upload")
 
+    path_changed(file_path)
     return {"message": "File uploaded successfully.", "uploaded_file": file.filename}
 
 
+async def _get_own_upload(upload_id: str, current_user: str) -> dict:
+    upload = await get_upload(upload_id)
+    if upload is None or upload["username"] != current_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found.")
+    return upload
+
+
+@app.post("/uploads")
+async def init_upload(body: UploadInitBody, current_user: str = Depends(get_current_user)):
+    """
+    Start a chunked upload. Size and free space are checked and the partial file is
+    preallocated before any data is sent; the response says how to split the file.
+    """
+    upload_dir = Path(body.current_path)
+
+    if not upload_dir.is_dir():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid upload directory.")
+
+    if not has_access_to_path(upload_dir, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
+
+    if not body.file_name or Path(body.file_name).name != body.file_name or body.file_name in (".", ".."):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file name.")
+
+    if body.size < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file size.")
+
+    if body.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large.")
+
+    try:
+        upload = await start_upload(upload_dir, body.file_name, body.size, current_user, body.chunk_size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return upload_status(upload)
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, current_user: str = Depends(get_current_user)):
+    """
+    Report the chunks an upload has received and those still missing, to resume it.
+    """
+    return upload_status(await _get_own_upload(upload_id, current_user))
+
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Write one chunk, sent as the raw request body, at `offset`.
+    """
+    upload = await _get_own_upload(upload_id, current_user)
+    length = request.headers.get("content-length")
+    try:
+        index = await write_chunk(upload, offset, int(length) if length and length.isdigit() else None, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"upload_id": upload_id, "chunk": index}
+
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, current_user: str = Depends(get_current_user)):
+    """
+    Move a complete upload into place.
+    """
+    upload = await _get_own_upload(upload_id, current_user)
+    try:
+        target = await finish_upload(upload)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"message": "File uploaded successfully.", "uploaded_file": target.name}
+
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str, current_user: str = Depends(get_current_user)):
+    """
+    Abandon an upload and remove its partial file.
+    """
+    await abort_upload(await _get_own_upload(upload_id, current_user))
+    return {"message": "Upload cancelled."}
+
+
+def _download_file(path: str, current_user: str):
+    download_path = Path(path)
+
+    if not download_path.exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
+
+    if not download_path.is_file():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file.")
+
+    if not has_access_to_path(download_path, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
+
+    return DownloadResponse(path=download_path, filename=download_path.name)
+
+
 @app.post("/direct_download")
-def download_file(
+async def download_file(
     path: str = Form(...),
     current_user: str = Depends(get_current_user),
 ):
     """
     Download a file from the specified directory.
     """
+    return await QUICK_POOL.run(current_user, _download_file, path, current_user)
+
+
+def _download_file_get(path: str, current_user: str):
     download_path = Path(path)
 
-    if not download_path.exists():
+    try:
+        stat_result = download_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
 
     if not download_path.is_file():
@@ -257,17 +590,22 @@ def download_file(
     if not has_access_to_path(download_path, current_user):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
 
-    return FileResponse(path=download_path, filename=download_path.name)
+    return DownloadResponse(path=download_path, filename=download_path.name, stat_result=stat_result)
 
 
-@app.delete("/delete_file")
-def delete_file(
-    path: str = Form(...),
+@app.api_route("/download", methods=["GET", "HEAD"])
+async def download_file_get(
+    path: str = Query(...),
     current_user: str = Depends(get_current_user),
 ):
     """
-    Delete a file from the specified directory.
+    Download a file with a plain GET, so browsers and download managers can resume
+    it, fetch ranges in parallel and revalidate it.
     """
+    return await QUICK_POOL.run(current_user, _download_file_get, path, current_user)
+
+
+def _delete_file(path: str, current_user: str):
     delete_path = Path(path)
 
     if not delete_path.exists():
@@ -280,9 +618,21 @@ def delete_file(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
 
     delete_path.unlink()
+    path_changed(delete_path)
     return {"message": "File deleted successfully.", "deleted_file": delete_path.name}
 
 
+@app.delete("/delete_file")
+async def delete_file(
+    path: str = Form(...),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Delete a file from the specified directory.
+    """
+    return await QUICK_POOL.run(current_user, _delete_file, path, current_user)
+
+
 # ==================================================================
 # FTP and SFTP Endpoints
 # ==================================================================
@@ -307,27 +657,57 @@ async def list_files_ftp_endpoint(credentials: SFTPRequest):
 
 
 @app.post("/sftp/list-files/")
-async def list_files_sftp_endpoint(credentials: SFTPRequest):
+async def list_files_sftp_endpoint(
+    credentials: SFTPRequest,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(1000, ge=1, le=10000),
+):
     """
-    List files and directories from an SFTP server.
+    List files and directories from an SFTP server, sorted directories first, then by name.
     """
     try:
-        file_list = await list_files_sftp(
+        file_list, total_items = await list_files_sftp(
             host=credentials.host,
             username=credentials.username,
             password=credentials.password,
             port=credentials.port or 22,
             path=credentials.path or "/",
+            page=page,
+            page_size=page_size,
         )
-        if file_list is None:
-            raise HTTPException(status_code=500, detail="Failed to fetch file list.")
-        return {"files": file_list}
+        return {
+            "files": file_list,
+            "pagination": {
+                "page": page,
+                "page_size": page_size,
+                "total_items": total_items,
+                "total_pages": (total_items + page_size - 1) // page_size,
+            },
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/sftp/list-files/stream")
+async def list_files_sftp_stream_endpoint(credentials: SFTPRequest):
+    """
+    Stream the entries of an SFTP directory as NDJSON while the server returns them.
+    """
+    return StreamingResponse(
+        stream_files_sftp(
+            host=credentials.host,
+            username=credentials.username,
+            password=credentials.password,
+            port=credentials.port or 22,
+            path=credentials.path or "/",
+        ),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/ftp/download/")
-async def download_ftp_endpoint(request: SFTPRequest, background_tasks: BackgroundTasks):
+async def download_ftp_endpoint(request: SFTPRequest):
     """
     Download files from an FTP server.
     """
@@ -342,23 +722,26 @@ async def download_ftp_endpoint(request: SFTPRequest, background_tasks: Backgrou
         username=request.local_user_id,
         progress=0,
     )
-    await create_session(session)
-
-    background_tasks.add_task(
-        download_ftp,
-        request.host,
-        request.username,
-        request.password,
-        request.path,
-        request.local_path,
-        session_id,
-        request.port,
+    await schedule_transfer(
+        session,
+        "ftp_download",
+        {
+            "host": request.host,
+            "username": request.username,
+            "password": request.password,
+            "remote_path": request.path,
+            "local_path": request.local_path,
+            "port": request.port,
+            "sync": request.sync,
+            "checksum": request.checksum,
+        },
+        priority=request.priority,
     )
     return {"message": "Download session created.", "session_id": session_id}
 
 
 @app.post("/sftp/download/")
-async def download_sftp_endpoint(request: SFTPRequest, background_tasks: BackgroundTasks):
+async def download_sftp_endpoint(request: SFTPRequest):
     """
     Download a file or folder from an SFTP server.
     """
@@ -374,17 +757,20 @@ async def download_sftp_endpoint(request: SFTPRequest, background_tasks: Backgro
         username=request.local_user_id,
         progress=0,
     )
-    await create_session(session)
-
-    background_tasks.add_task(
-        download_sftp,
-        request.host,
-        request.username,
-        request.password,
-        request.path,
-        request.local_path,
-        session_id,
-        request.port,
+    await schedule_transfer(
+        session,
+        "sftp_download",
+        {
+            "host": request.host,
+            "username": request.username,
+            "password": request.password,
+            "remote_path": request.path,
+            "local_path": request.local_path,
+            "port": request.port,
+            "sync": request.sync,
+            "checksum": request.checksum,
+        },
+        priority=request.priority,
     )
     return {"message": "Download session created", "session_id": session_id}
 
@@ -392,32 +778,102 @@ async def download_sftp_endpoint(request: SFTPRequest, background_tasks: Backgro
 # ==================================================================
 # Sessions Endpoints
 # ==================================================================
-@app.get("/sessions/{username}")
-async def get_sessions(username: str):
-    """
-    Get all sessions for a user.
-    """
-    db_sessions = await get_user_sessions(username)
-    sessions = []
-
-    for db_session in db_sessions:
-        sessions.append(
-            SessionStatus(
-                session_id=db_session[0],
-                username=db_session[1],
-                type=SessionTypeEnum(db_session[2]),
-                status=SessionStatusEnum(db_session[3]),
-                file_name=db_session[4],
-                started_at=db_session[5],
-                started_at_unix=db_session[6],
-                uploaded_at=db_session[7],
-                completed_at=db_session[8] or "",
-                details=db_session[9],
-                progress=int(db_session[10]) if db_session[10] else 0,
-            )
+def _session_from_row(db_session) -> SessionStatus:
+    return SessionStatus(
+        session_id=db_session[0],
+        username=db_session[1],
+        type=SessionTypeEnum(db_session[2]),
+        status=SessionStatusEnum(db_session[3]),
+        file_name=db_session[4],
+        started_at=db_session[5],
+        started_at_unix=db_session[6],
+        uploaded_at=db_session[7],
+        completed_at=db_session[8] or "",
+        details=db_session[9],
+        progress=int(db_session[10]) if db_session[10] else 0,
+    )
+
+
+@app.get("/events/sessions")
+async def session_events(current_user: str = Depends(get_current_user)):
+    """
+    Stream the current user's sessions as server-sent events: a snapshot, then only
+    the fields that changed, coalesced while the client is not reading.
+    """
+    # Subscribe before reading the snapshot so no change falls in between
+    subscription = SESSION_EVENTS.subscribe(current_user)
+    try:
+        # Unfinished sessions and the latest page of history; older pages come from /sessions/{username}
+        rows = await query_user_sessions(
+            current_user, statuses=[SessionStatusEnum.queued.value, SessionStatusEnum.processing.value],
+            limit=SESSIONS_PAGE_SIZE,
         )
+        latest = await query_user_sessions(current_user, limit=SESSIONS_PAGE_SIZE)
+        next_cursor = None
+        if len(latest) == SESSIONS_PAGE_SIZE:
+            next_cursor = encode_cursor(
+                (latest[-1][6], latest[-1][0]), sessions_fingerprint(current_user, [], [], None, None)
+            )
+        sessions = {row[0]: _session_from_row(row).model_dump(mode="json") for row in rows + latest}
+    except BaseException:
+        SESSION_EVENTS.unsubscribe(subscription)
+        raise
+    return StreamingResponse(
+        stream_session_events(subscription, {"sessions": list(sessions.values()), "next_cursor": next_cursor}),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return {"sessions": sessions}
+
+@app.get("/sessions/{username}")
+async def get_sessions(
+    username: str,
+    status_filter: list[SessionStatusEnum] = Query([], alias="status"),
+    type_filter: list[SessionTypeEnum] = Query([], alias="type"),
+    since: int | None = None,
+    until: int | None = None,
+    page_size: int = Query(SESSIONS_PAGE_SIZE, ge=1, le=1000),
+    cursor: str | None = None,
+):
+    """
+    Get a user's sessions, newest first.
+
+    Filter by any number of `status` and `type` values and by a `[since, until)`
+    range of start times (unix seconds). Pass the returned `next_cursor` as
+    `cursor` for the next page; the first page also carries a count summary.
+    """
+    statuses = [value.value for value in status_filter]
+    types = [value.value for value in type_filter]
+    fingerprint = sessions_fingerprint(username, statuses, types, since, until)
+
+    before = None
+    if cursor:
+        try:
+            before, cursor_fingerprint = decode_cursor(cursor, SESSIONS_CURSOR_KEY)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if cursor_fingerprint != fingerprint:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match these filters")
+
+    db_sessions = await query_user_sessions(
+        username, statuses, types, since, until, before=before, limit=page_size + 1
+    )
+    has_more = len(db_sessions) > page_size
+    db_sessions = db_sessions[:page_size]
+
+    summary = None
+    if before is None:
+        counts, archived = await count_user_sessions(username, types, since, until)
+        summary = {"total": sum(counts.values()), "by_status": counts, "archived": archived}
+
+    return {
+        "sessions": [_session_from_row(db_session) for db_session in db_sessions],
+        "pagination": {
+            "page_size": page_size,
+            "next_cursor": encode_cursor((db_sessions[-1][6], db_sessions[-1][0]), fingerprint) if has_more else None,
+        },
+        "summary": summary,
+    }
 
 
 @app.delete("/sessions/{session_id}")
@@ -425,91 +881,25 @@ async def delete_session_endpoint(session_id: str):
     """
     Delete a session by session_id.
     """
-    await delete_session(session_id)
+    # Only a running transfer reaches PROGRESS.finish, which drops its cancel flag
+    if not SCHEDULER.cancel(session_id) and SCHEDULER.is_running(session_id):
+        PROGRESS.cancel(session_id)
+    username = await delete_session(session_id)
+    if username is not None:
+        SESSION_EVENTS.deleted(session_id, username)
     return {"message": "Session deleted."}
 
 
 # ==================================================================
 # Links Based Upload
 # ==================================================================
-async def download_file_from_link(url, destination, username):
-    """Download a file asynchronously from a URL to a destination."""
-    # Get the file name from the URL
-    file_name = Path(url).name
-    file_path = Path(destination) / file_name
-
-    session_id = str(uuid.uuid4())
-    session = SessionStatus(
-        session_id=session_id,
-        type=SessionTypeEnum.link_download,  # FIXED: Using correct enum type
-        status=SessionStatusEnum.queued,
-        file_name=file_name,
-        started_at=time.strftime("%Y-%m-%d %H:%M:%S"),
-        started_at_unix=int(time.time()),
-        uploaded_at=str(destination),
-        username=username,
-        progress=0,
-    )
-    await create_session(session)
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    await update_session_status(
-                        session_id, 
-                        status=SessionStatusEnum.failed, 
-                        details=f"Failed to download file. Status: {response.status}"
-                    )
-                    return
-                
-                total_size = int(response.headers.get("Content-Length", 0))
-                downloaded_size = 0
-                
-                async with aiofiles.open(file_path, mode="wb") as f:
-                    async for chunk in response.content.iter_chunked(1024 * 64):  # 64KB chunks
-                        current_session = await get_session(session_id)
-                        if current_session is None or current_session[3] == SessionStatusEnum.failed:
-                            # If session was removed or marked as failed, abort
-                            break
-                            
-                        await f.write(chunk)
-                        downloaded_size += len(chunk)
-                        
-                        # Update progress if we know the total size
-                        if total_size > 0:
-                            progress = int((downloaded_size / total_size) * 100)
-                            await update_session_status(
-                                session_id,
-                                status=SessionStatusEnum.processing,
-                                progress=progress,
-                            )
-                
-                # Check if the session still exists and wasn't cancelled
-                current_session = await get_session(session_id)
-                if current_session is None or current_session[3] == SessionStatusEnum.failed:
-                    # If session was removed or marked as failed, remove the partial file
-                    file_path.unlink(missing_ok=True)
-                    return
-                
-                # Mark session as completed
-                await update_session_status(session_id, status=SessionStatusEnum.completed)
-                
-    except Exception as e:
-        # Handle any exceptions
-        await update_session_status(
-            session_id, 
-            status=SessionStatusEnum.failed, 
-            details=f"Error downloading file: {str(e)}"
-        )
-        # Remove partial file if it exists
-        if file_path.exists():
-            file_path.unlink()
+SCHEDULER.register("ftp_download", download_ftp)
+SCHEDULER.register("sftp_download", download_sftp)
+SCHEDULER.register("link_download", download_file_from_link)
 
 
 @app.post("/links_upload/")
 async def upload_files_from_links(
-    background_tasks: BackgroundTasks,
     links_body: LinksUploadBody,
     current_user: str = Depends(get_current_user),
 ):
@@ -526,21 +916,35 @@ async def upload_files_from_links(
     if not has_access_to_path(upload_dir, current_user):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
 
+    session_ids = []
     for link in links:
-        background_tasks.add_task(download_file_from_link, link, upload_dir, current_user)
+        session_id = str(uuid.uuid4())
+        session = SessionStatus(
+            session_id=session_id,
+            type=SessionTypeEnum.link_download,
+            status=SessionStatusEnum.queued,
+            file_name=Path(link).name,
+            started_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+            started_at_unix=int(time.time()),
+            uploaded_at=str(upload_dir),
+            username=current_user,
+            progress=0,
+        )
+        await schedule_transfer(
+            session,
+            "link_download",
+            {"url": link, "destination": str(upload_dir)},
+            priority=links_body.priority,
+        )
+        session_ids.append(session_id)
 
-    return {"message": "Files are being downloaded and uploaded."}
+    return {"message": "Files are being downloaded and uploaded.", "session_ids": session_ids}
 
 
 # main.py - Add a search endpoint
-@app.get("/search_files")
-def search_files(
-    query: str,
-    path: str = "",
-    current_user: str = Depends(get_current_user)
-):
+def _search_root(path: str, current_user: str) -> Path:
     """
-    Search for files matching the query in the specified path.
+    Resolve the directory a search starts from and check that `current_user` may read it.
     """
     target_path = Path(path).resolve() if path != "" else Path(f"/home/{current_user}")
 
@@ -555,41 +959,36 @@ def search_files(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"You don't have permission to access {target_path}",
         )
+    return target_path
+
+
+def _search_files(query: str, path: str, page_size: int, cursor: str | None, current_user: str):
+    target_path = _search_root(path, current_user)
+
+    after = None
+    if cursor:
+        try:
+            after, cursor_fingerprint = decode_cursor(cursor, SEARCH_CURSOR_KEY)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if cursor_fingerprint != search_fingerprint(str(target_path), query):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match this search")
 
     try:
-        search_results = []
-        
-        # Recursive search function
-        def search_directory(directory):
-            for item in directory.iterdir():
-                if not isinstance(item, PermissionError) and item.exists():
-                    # Check if name matches search query
-                    if query.lower() in item.name.lower():
-                        search_results.append({
-                            "name": item.name,
-                            "is_file": item.is_file(),
-                            "is_dir": item.is_dir(),
-                            "size": item.stat().st_size,
-                            "owner": item.owner(),
-                            "group": item.group(),
-                            "date_created": item.stat().st_ctime,
-                            "date_modified": item.stat().st_mtime,
-                            "permissions": oct(item.stat().st_mode & 0o777),
-                            "path": str(item),
-                        })
-                    
-                    # Recursively search directories
-                    if item.is_dir() and has_access_to_path(item, current_user):
-                        search_directory(item)
-        
-        # Start recursive search
-        search_directory(target_path)
-        
+        records, has_more = search_files_indexed(
+            target_path, query, current_user, has_access_to_path, limit=page_size, after=after
+        )
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(records[-1][0], search_fingerprint(str(target_path), query))
         return {
-            "items": sorted(search_results, key=lambda x: (not x["is_dir"], x["name"])),
+            "items": [format_entry(record) for record in records],
             "current_path": str(target_path),
-            "query": query
+            "query": query,
+            "next_cursor": next_cursor,
         }
+    except QueryTooBroad as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -597,6 +996,56 @@ def search_files(
         )
 
 
+@app.get("/search_files")
+async def search_files(
+    query: str,
+    path: str = "",
+    page_size: int = Query(SEARCH_PAGE_SIZE, ge=1, le=10000),
+    cursor: str | None = None,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Search for files matching the query in the specified path.
+
+    Matches come from the persistent filename index; at most `page_size` results are
+    returned and `next_cursor` continues after the last returned item.
+    """
+    return await SEARCH_POOL.run(current_user, _search_files, query, path, page_size, cursor, current_user)
+
+
+@app.get("/search_files/stream")
+async def search_files_stream(
+    request: Request,
+    query: str,
+    path: str = "",
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    max_results: int = Query(1000, ge=1, le=100000),
+    max_depth: int | None = Query(None, ge=0),
+    timeout: float | None = Query(30, gt=0, le=600),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Stream search matches as NDJSON lines or Server-Sent Events while the tree is walked.
+    """
+    target_path = await QUICK_POOL.run(current_user, _search_root, path, current_user)
+
+    return StreamingResponse(
+        stream_search(
+            str(target_path),
+            query,
+            current_user,
+            has_access_to_path,
+            fmt=format,
+            max_results=max_results,
+            max_depth=max_depth,
+            timeout=timeout,
+            is_disconnected=request.is_disconnected,
+        ),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,53 @@
+import base64
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from flexport.pagination import (
+    decode_cursor,
+    directory_fingerprint,
+    encode_cursor,
+    search_fingerprint,
+    sessions_fingerprint,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor((True, "a name/with ünicode", "/tmp/x"), "fp")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, (bool, str, str)) == ((True, "a name/with ünicode", "/tmp/x"), "fp")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", base64.urlsafe_b64encode(b"[1, 2]").decode(), "e30"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, (bool, str))
+
+
+@pytest.mark.parametrize("key", [(True,), (True, "a", "b"), ("yes", "a"), (1.5, "a")])
+def test_cursor_with_wrong_key_shape_is_rejected(key):
+    payload = json.dumps({"k": list(key), "f": "fp"}).encode()
+    with pytest.raises(ValueError):
+        decode_cursor(base64.urlsafe_b64encode(payload).decode(), (bool, str))
+
+
+def test_fingerprints_identify_their_result_set():
+    assert search_fingerprint("/home/a", "q") == search_fingerprint("/home/a", "q")
+    assert search_fingerprint("/home/a", "q") != search_fingerprint("/home/a", "qq")
+    assert sessions_fingerprint("u", ["b", "a"], [], None, None) == sessions_fingerprint("u", ["a", "b"], [], None, None)
+    assert sessions_fingerprint("u", [], [], 1, None) != sessions_fingerprint("u", [], [], None, 1)
+    st = SimpleNamespace(st_ino=7, st_mtime_ns=100)
+    assert directory_fingerprint(st) != directory_fingerprint(SimpleNamespace(st_ino=7, st_mtime_ns=101))
+
+
+def test_search_cursor_from_another_search_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "has_access_to_path", lambda path, user: True)
+    root = os.path.realpath(tmp_path)
+    cursor = encode_cursor((False, "a", f"{root}/a"), search_fingerprint(root, "other"))
+    with pytest.raises(HTTPException) as raised:
+        main._search_files("query", root, 10, cursor, "user")
+    assert raised.value.status_code == 400
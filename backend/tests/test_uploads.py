@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from flexport import uploads
+from flexport.uploads import UploadError, finish_upload, upload_status, write_chunk
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    marked = []
+
+    async def mark_upload_chunk(upload_id, index):
+        marked.append(index)
+
+    async def delete_upload(upload_id):
+        pass
+
+    monkeypatch.setattr(uploads, "mark_upload_chunk", mark_upload_chunk)
+    monkeypatch.setattr(uploads, "delete_upload", delete_upload)
+    part_path = tmp_path / ".file.part"
+    part_path.write_bytes(b"\0" * 10)
+    return {
+        "upload_id": "u1",
+        "target": str(tmp_path / "file"),
+        "part_path": str(part_path),
+        "size": 10,
+        "chunk_size": 4,
+        "received": marked,
+    }
+
+
+async def _body(*parts):
+    for part in parts:
+        yield part
+
+
+def test_status_lists_missing_chunks(upload):
+    upload["received"].extend([2, 0])
+    status = upload_status(upload)
+    assert (status["chunks"], status["received"], status["missing"]) == (3, [0, 2], [1])
+
+
+def test_empty_upload_has_one_chunk(upload):
+    upload["size"] = 0
+    assert upload_status(upload)["missing"] == [0]
+
+
+def test_chunks_land_at_their_offset(upload):
+    assert asyncio.run(write_chunk(upload, 8, 2, _body(b"yz"))) == 2
+    assert asyncio.run(write_chunk(upload, 0, None, _body(b"ab", b"cd"))) == 0
+    assert open(upload["part_path"], "rb").read() == b"abcd\0\0\0\0yz"
+    assert upload["received"] == [2, 0]
+
+
+@pytest.mark.parametrize("offset", [1, 10, 12, -4])
+def test_offset_must_start_a_chunk(upload, offset):
+    with pytest.raises(UploadError) as raised:
+        asyncio.run(write_chunk(upload, offset, None, _body(b"abcd")))
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("offset, length", [(0, 3), (0, 5), (8, 4)])
+def test_declared_length_must_match_the_chunk(upload, offset, length):
+    with pytest.raises(UploadError):
+        asyncio.run(write_chunk(upload, offset, length, _body(b"x" * length)))
+    assert open(upload["part_path"], "rb").read() == b"\0" * 10
+
+
+@pytest.mark.parametrize("parts", [(b"abc",), (b"ab", b"cde")])
+def test_body_must_fill_exactly_the_chunk(upload, parts):
+    with pytest.raises(UploadError):
+        asyncio.run(write_chunk(upload, 4, None, _body(*parts)))
+    assert upload["received"] == []
+
+
+def test_finish_requires_every_chunk(upload):
+    upload["received"].extend([0, 2])
+    with pytest.raises(UploadError) as raised:
+        asyncio.run(finish_upload(upload))
+    assert raised.value.status_code == 409
+
+
+def test_finish_moves_the_file_into_place(upload):
+    upload["received"].extend([0, 1, 2])
+    target = asyncio.run(finish_upload(upload))
+    assert str(target) == upload["target"] and target.read_bytes() == b"\0" * 10
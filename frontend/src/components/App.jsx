@@ -24,6 +24,9 @@ const App = () => {
     currentPath,
     spaceInfo,
     fetchFiles,
+    loadMoreFiles,
+    hasMoreFiles,
+    loadingMore,
     viewMode,
     setViewMode,
     showHidden,
@@ -35,6 +38,8 @@ const App = () => {
     showUploadSessionsPopup,
     setShowUploadSessionsPopup,
     uploadSessions,
+    loadOlderSessions,
+    hasOlderSessions,
     deleteUploadSession
   } = useAppContext();
 
@@ -102,6 +107,8 @@ const App = () => {
         {showUploadSessionsPopup && (
           <UploadSessionsPopup
             uploadSessions={uploadSessions}
+            loadOlderSessions={loadOlderSessions}
+            hasOlderSessions={hasOlderSessions}
             deleteUploadSession={deleteUploadSession}
             closePopup={() => setShowUploadSessionsPopup(false)}
           />
@@ -124,6 +131,9 @@ const App = () => {
           viewMode={viewMode}
           loading={loading}
           showSelection={showSelection}
+          loadMoreFiles={loadMoreFiles}
+          hasMoreFiles={hasMoreFiles}
+          loadingMore={loadingMore}
         />
       </div>
     </>
@@ -1,6 +1,6 @@
 // src/components/FileList.jsx
 
-import React from 'react';
+import React, { useEffect, useRef } from 'react';
 import FileItem from './FileItem';
 
 const FileList = ({
@@ -13,7 +13,23 @@ const FileList = ({
   viewMode,
   loading,
   showSelection,
+  loadMoreFiles,
+  hasMoreFiles,
+  loadingMore,
 }) => {
+  const sentinelRef = useRef(null);
+
+  // Fetch the next page when the end of the list scrolls into view
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !hasMoreFiles) return;
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) loadMoreFiles();
+    });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [hasMoreFiles, loadMoreFiles, loading]);
+
   const handleItemClick = (item) => {
     // Only navigate to directories if not in selection mode
     if (item.is_dir && !showSelection) {
@@ -75,6 +91,11 @@ const FileList = ({
             handleSelection={() => handleSelection(item)}
           />
         ))}
+        {hasMoreFiles && (
+          <div ref={sentinelRef} className="load-more">
+            {loadingMore && <div className="spinner"></div>}
+          </div>
+        )}
       </div>
     );
   } else {
@@ -98,6 +119,11 @@ const FileList = ({
             handleSelection={() => handleSelection(item)}
           />
         ))}
+        {hasMoreFiles && (
+          <div ref={sentinelRef} className="load-more">
+            {loadingMore && <div className="spinner"></div>}
+          </div>
+        )}
       </ul>
     );
   }
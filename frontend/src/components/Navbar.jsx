@@ -6,7 +6,7 @@ import eyeIcon from '../assets/images/eye.svg';
 import eyeOffIcon from '../assets/images/eye-closed.svg';
 import logoutIcon from '../assets/images/logout.svg';
 import uploadIcon from '../assets/images/cloud-upload.svg';
-import { handleDownload as apiHandleDownload, handleDelete as apiHandleDelete } from '../services/api';
+import { downloadUrl, handleDelete as apiHandleDelete } from '../services/api';
 
 const Navbar = ({
   viewMode,
@@ -53,22 +53,13 @@ const Navbar = ({
     
     for (const file of selectedFiles) {
       try {
-        const response = await apiHandleDownload(file.path);
-        
-        // Create a blob URL from the response
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        
-        // Create an anchor element to trigger the download
+        // Let the browser download the file from the GET endpoint
         const link = document.createElement('a');
-        link.href = url;
+        link.href = downloadUrl(file.path);
         link.setAttribute('download', file.name);
         document.body.appendChild(link);
         link.click();
-        
-        // Clean up
         document.body.removeChild(link);
-        window.URL.revokeObjectURL(url);
       } catch (error) {
         console.error(`Error downloading ${file.name}:`, error);
         alert(`Failed to download ${file.name}`);
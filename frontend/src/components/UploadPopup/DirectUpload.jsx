@@ -1,6 +1,6 @@
 // src/components/UploadPopup/DirectUpload.jsx
 import React, { useState } from 'react';
-import { handleDirectUpload as apiHandleDirectUpload } from '../../services/api';
+import { uploadFileInChunks } from '../../services/api';
 import { humanReadableSize } from '../../services/utils';
 import { toast } from 'react-toastify';
 import FolderBrowser from '../FolderBrowser';
@@ -36,19 +36,26 @@ const DirectUpload = ({ currentPath, fetchFiles, closeUploadPopup }) => {
 
     try {
       let successfulUploads = 0;
+      const totalBytes = selectedFiles.reduce((total, file) => total + file.size, 0);
+      let finishedBytes = 0;
 
       for (let i = 0; i < selectedFiles.length; i++) {
         const file = selectedFiles[i];
-        const res = await apiHandleDirectUpload(uploadPath, file);
-
-        if (res.ok) {
+        try {
+          // Chunks of each file go up in parallel; progress counts bytes across all files
+          await uploadFileInChunks(uploadPath, file, (sent) => {
+            if (totalBytes > 0) {
+              setUploadProgress(((finishedBytes + sent) / totalBytes) * 100);
+            }
+          });
           successfulUploads++;
-        } else {
-          toast.error(`Error uploading file: ${file.name}`);
+        } catch (error) {
+          console.error(error);
+          toast.error(error.message || `Error uploading file: ${file.name}`);
         }
 
-        // Update upload progress
-        setUploadProgress(((i + 1) / selectedFiles.length) * 100);
+        finishedBytes += file.size;
+        setUploadProgress(totalBytes > 0 ? (finishedBytes / totalBytes) * 100 : ((i + 1) / selectedFiles.length) * 100);
       }
 
       if (successfulUploads === selectedFiles.length) {
@@ -73,7 +80,7 @@ const DirectUpload = ({ currentPath, fetchFiles, closeUploadPopup }) => {
   return (
     <div>
       <h2>Direct Upload</h2>
-      <p className="upload-description">Use FileZilla or similar software for the large files!</p>
+      <p className="upload-description">Interrupted uploads resume when the same files are uploaded again.</p>
       
       {/* Destination folder selection */}
       <div className="destination-folder">
@@ -1,7 +1,7 @@
 // src/components/UploadPopup/FtpUpload.jsx
 
 import React, { useState, useEffect } from 'react';
-import { fetchFTPFiles, fetchSFTPFiles, downloadFTPFile, downloadSFTPFile } from '../../services/api';
+import { fetchFTPFiles, streamSFTPFiles, downloadFTPFile, downloadSFTPFile } from '../../services/api';
 import { humanReadableSize } from '../../services/utils';
 import { toast } from 'react-toastify';
 import FolderBrowser from '../FolderBrowser';
@@ -96,34 +96,47 @@ const FtpUpload = ({ currentPath, credentials, closeUploadPopup }) => {
     setConnectionError('');
     
     try {
-      const fetchFunction = ftpData.protocol === 'FTP' ? fetchFTPFiles : fetchSFTPFiles;
-      
-      const res = await fetchFunction({
-        ...ftpData,
-        path
-      });
-
-      if (!res.ok) {
-        const errorData = await res.json();
-        throw new Error(errorData.detail || 'Failed to fetch files');
-      }
-
-      const data = await res.json();
-      const files = data.files || [];
-
       // Sort files (directories first, then by name)
-      files.sort((a, b) => {
+      const sortFiles = (files) => files.sort((a, b) => {
         if (a.type === 'directory' && b.type !== 'directory') return -1;
         if (a.type !== 'directory' && b.type === 'directory') return 1;
         return a.name.localeCompare(b.name);
       });
 
-      // Add selected property to each file
-      files.forEach(file => {
-        file.selected = false;
-      });
+      if (ftpData.protocol === 'SFTP') {
+        // Render large remote directories progressively as batches arrive
+        let files = [];
+        await streamSFTPFiles({ ...ftpData, path }, (items) => {
+          items.forEach(file => {
+            file.selected = false;
+          });
+          files = sortFiles([...files, ...items]);
+          setFtpFiles(files);
+          setCurrentRemotePath(path);
+          setIsLoading(false);
+        });
+        setFtpFiles(files);
+      } else {
+        const res = await fetchFTPFiles({
+          ...ftpData,
+          path
+        });
+
+        if (!res.ok) {
+          const errorData = await res.json();
+          throw new Error(errorData.detail || 'Failed to fetch files');
+        }
 
-      setFtpFiles(files);
+        const data = await res.json();
+        const files = sortFiles(data.files || []);
+
+        // Add selected property to each file
+        files.forEach(file => {
+          file.selected = false;
+        });
+
+        setFtpFiles(files);
+      }
       setCurrentRemotePath(path);
       
       // Update path history for navigation
@@ -4,6 +4,8 @@ import React, { useState } from 'react';
 
 const UploadSessionsPopup = ({
   uploadSessions,
+  loadOlderSessions,
+  hasOlderSessions,
   deleteUploadSession,
   closePopup,
 }) => {
@@ -102,6 +104,11 @@ const UploadSessionsPopup = ({
               </div>
             ))
         )}
+        {hasOlderSessions && (
+          <button className="fancy-button" onClick={loadOlderSessions}>
+            Load Older Sessions
+          </button>
+        )}
       </div>
       <button
         className="fancy-button cancel-button"
@@ -7,8 +7,10 @@ import {
   fetchFiles as apiFetchFiles,
   fetchSpaceInfo as apiFetchSpaceInfo,
   fetchUploadSessions as apiFetchUploadSessions, 
-  deleteUploadSession as apiDeleteUploadSession
+  deleteUploadSession as apiDeleteUploadSession,
+  subscribeSessionEvents
 } from '../services/api';
+import { applySessionDeltas } from '../services/utils';
 
 // Create the context
 const AppContext = createContext(null);
@@ -31,7 +33,9 @@ export const AppProvider = ({ children }) => {
   // File manager state
   const [files, setFiles] = useState([]);
   const [currentPath, setCurrentPath] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [spaceInfo, setSpaceInfo] = useState({});
   const [viewMode, setViewMode] = useState('list');
   const [showHidden, setShowHidden] = useState(false);
@@ -40,6 +44,7 @@ export const AppProvider = ({ children }) => {
   
   // Upload sessions state
   const [uploadSessions, setUploadSessions] = useState([]);
+  const [sessionsCursor, setSessionsCursor] = useState(null);
   
   // UI state
   const [showUploadPopup, setShowUploadPopup] = useState(false);
@@ -101,6 +106,7 @@ export const AppProvider = ({ children }) => {
         
         setFiles(fetchedFiles);
         setCurrentPath(data.current_path);
+        setNextCursor(data.pagination.next_cursor);
         fetchSpaceInfo();
       } else {
         if (res.status === 401) {
@@ -117,6 +123,35 @@ export const AppProvider = ({ children }) => {
     }
   };
 
+  // Append the next page of the current directory (infinite scroll)
+  const loadMoreFiles = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await apiFetchFiles(currentPath, nextCursor);
+      if (res.ok) {
+        const data = await res.json();
+        const fetchedFiles = data.items;
+
+        fetchedFiles.forEach((file) => {
+          file.selected = !!selectedItems[file.name];
+        });
+
+        setFiles((prev) => [...prev, ...fetchedFiles]);
+        setNextCursor(data.pagination.next_cursor);
+      } else if (res.status === 401) {
+        alert('Session expired. Please log in again.');
+        setIsAuthenticated(false);
+      } else {
+        alert('Error retrieving files.');
+      }
+    } catch (error) {
+      alert('An error occurred while fetching files.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchSpaceInfo = async () => {
     try {
       const res = await apiFetchSpaceInfo();
@@ -133,17 +168,14 @@ export const AppProvider = ({ children }) => {
   };
   
   // Upload sessions actions
-  const fetchUploadSessions = async () => {
+  const loadOlderSessions = async () => {
+    if (!sessionsCursor) return;
     try {
-      const res = await apiFetchUploadSessions(credentials.username);
+      const res = await apiFetchUploadSessions(credentials.username, { cursor: sessionsCursor });
       if (res.ok) {
         const data = await res.json();
-        const sessions = data.sessions;
-
-        // Sort by started_at_unix
-        sessions.sort((a, b) => b.started_at_unix - a.started_at_unix);
-
-        setUploadSessions(sessions);
+        setUploadSessions((current) => applySessionDeltas(current, data.sessions));
+        setSessionsCursor(data.pagination.next_cursor);
       } else {
         alert('Error retrieving upload sessions');
       }
@@ -158,7 +190,7 @@ export const AppProvider = ({ children }) => {
       const res = await apiDeleteUploadSession(sessionId);
       if (res.ok) {
         alert('Upload session deleted');
-        fetchUploadSessions();
+        setUploadSessions((current) => applySessionDeltas(current, [{ session_id: sessionId, deleted: true }]));
       } else {
         alert('Error deleting upload session');
       }
@@ -181,14 +213,17 @@ export const AppProvider = ({ children }) => {
     }
   }, [isAuthenticated]);
   
-  // Fetch upload sessions when popup is shown
+  // Follow upload sessions over the event stream while the popup is shown
   useEffect(() => {
-    let interval;
-    if (showUploadSessionsPopup && isAuthenticated) {
-      fetchUploadSessions();
-      interval = setInterval(fetchUploadSessions, 5000); // Refresh every 5 seconds
-    }
-    return () => clearInterval(interval);
+    if (!showUploadSessionsPopup || !isAuthenticated) return;
+    const source = subscribeSessionEvents(
+      (snapshot) => {
+        setUploadSessions(applySessionDeltas([], snapshot.sessions));
+        setSessionsCursor(snapshot.next_cursor);
+      },
+      (deltas) => setUploadSessions((current) => applySessionDeltas(current, deltas)),
+    );
+    return () => source.close();
   }, [showUploadSessionsPopup, isAuthenticated]);
 
   const toggleHiddenFiles = () => setShowHidden(!showHidden);
@@ -220,11 +255,15 @@ export const AppProvider = ({ children }) => {
     spaceInfo,
     fetchSpaceInfo,
     fetchFiles,
+    loadMoreFiles,
+    hasMoreFiles: !!nextCursor,
+    loadingMore,
     goBack,
     
     // Upload sessions state and actions
     uploadSessions,
-    fetchUploadSessions,
+    loadOlderSessions,
+    hasOlderSessions: !!sessionsCursor,
     deleteUploadSession,
     
     // UI state and actions
@@ -1,38 +1,20 @@
 // src/hooks/useUploadSessions.js
 
 import { useState, useEffect } from 'react';
-import { fetchUploadSessions as apiFetchUploadSessions, deleteUploadSession as apiDeleteUploadSession } from '../services/api';
+import { deleteUploadSession as apiDeleteUploadSession, subscribeSessionEvents } from '../services/api';
+import { applySessionDeltas } from '../services/utils';
 
 const useUploadSessions = ({ showUploadSessionsPopup, credentials }) => {
   const [uploadSessions, setUploadSessions] = useState([]);
 
-  const fetchUploadSessions = async () => {
-    try {
-      const res = await apiFetchUploadSessions(credentials.username);
-      if (res.ok) {
-        const data = await res.json();
-        const sessions = data.sessions;
-
-        // Sort by started_at_unix
-        sessions.sort((a, b) => b.started_at_unix - a.started_at_unix);
-
-        setUploadSessions(sessions);
-      } else {
-        alert('Error retrieving upload sessions');
-      }
-    } catch (error) {
-      console.error(error);
-      alert('An error occurred while fetching upload sessions');
-    }
-  };
-
+  // Follow sessions over the event stream while the popup is shown
   useEffect(() => {
-    let interval;
-    if (showUploadSessionsPopup) {
-      fetchUploadSessions();
-      interval = setInterval(fetchUploadSessions, 5000); // Refresh every 5 seconds
-    }
-    return () => clearInterval(interval);
+    if (!showUploadSessionsPopup) return;
+    const source = subscribeSessionEvents(
+      (snapshot) => setUploadSessions(applySessionDeltas([], snapshot.sessions)),
+      (deltas) => setUploadSessions((current) => applySessionDeltas(current, deltas)),
+    );
+    return () => source.close();
   }, [showUploadSessionsPopup]);
 
   const deleteUploadSession = async (sessionId) => {
@@ -40,7 +22,7 @@ const useUploadSessions = ({ showUploadSessionsPopup, credentials }) => {
       const res = await apiDeleteUploadSession(sessionId);
       if (res.ok) {
         alert('Upload session deleted');
-        fetchUploadSessions();
+        setUploadSessions((current) => applySessionDeltas(current, [{ session_id: sessionId, deleted: true }]));
       } else {
         alert('Error deleting upload session');
       }
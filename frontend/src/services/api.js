@@ -28,9 +28,11 @@ export const checkAuth = async () => {
   return res;
 }
 
-export const fetchFiles = async (path) => {
+export const fetchFiles = async (path, cursor = null) => {
+  const params = new URLSearchParams({ path });
+  if (cursor) params.append('cursor', cursor);
   const res = await fetch(
-    `${API_BASE_URL}/list_files?path=${encodeURIComponent(path)}`,
+    `${API_BASE_URL}/list_files?${params.toString()}`,
     {
       method: 'GET',
       credentials: 'include',
@@ -47,29 +49,109 @@ export const fetchSpaceInfo = async () => {
   return res;
 }
 
-export const handleDirectUpload = async (path, file) => {
-  const formData = new FormData();
-  formData.append('file', file);
-  formData.append('current_path', path);
-  const res = await fetch(`${API_BASE_URL}/direct_upload`, {
+export const initUpload = async (path, file, chunkSize = null) => {
+  const res = await fetch(`${API_BASE_URL}/uploads`, {
     method: 'POST',
     credentials: 'include',
-    body: formData,
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ current_path: path, file_name: file.name, size: file.size, chunk_size: chunkSize }),
   });
   return res;
 }
 
-export const handleDownload = async (path) => {
-  const formData = new FormData();
-  formData.append('path', path);
-  const res = await fetch(`${API_BASE_URL}/direct_download`, {
+export const getUpload = async (uploadId) => {
+  const res = await fetch(`${API_BASE_URL}/uploads/${uploadId}`, {
+    method: 'GET',
+    credentials: 'include',
+  });
+  return res;
+}
+
+export const uploadChunk = async (uploadId, offset, blob) => {
+  const res = await fetch(`${API_BASE_URL}/uploads/${uploadId}?offset=${offset}`, {
+    method: 'PUT',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/octet-stream' },
+    body: blob,
+  });
+  return res;
+}
+
+export const finalizeUpload = async (uploadId) => {
+  const res = await fetch(`${API_BASE_URL}/uploads/${uploadId}/finalize`, {
     method: 'POST',
     credentials: 'include',
-    body: formData,
   });
   return res;
 }
 
+const CHUNK_ATTEMPTS = 3;
+
+// Uploads a file in chunks, `concurrency` at a time. The upload id is kept in
+// localStorage, so uploading the same file to the same folder again after a
+// failure or a page reload only sends the chunks the server is missing.
+export const uploadFileInChunks = async (path, file, onProgress, concurrency = 4) => {
+  const resumeKey = `upload:${path}/${file.name}:${file.size}:${file.lastModified}`;
+  let status = null;
+
+  const savedId = localStorage.getItem(resumeKey);
+  if (savedId) {
+    const res = await getUpload(savedId);
+    if (res.ok) status = await res.json();
+  }
+  if (!status) {
+    const res = await initUpload(path, file);
+    if (!res.ok) {
+      const errorData = await res.json();
+      throw new Error(errorData.detail || `Error uploading file: ${file.name}`);
+    }
+    status = await res.json();
+    localStorage.setItem(resumeKey, status.upload_id);
+  }
+
+  const { upload_id: uploadId, chunk_size: chunkSize } = status;
+  const queue = [...status.missing];
+  let sent = file.size - queue.reduce(
+    (total, index) => total + Math.min(chunkSize, file.size - index * chunkSize), 0
+  );
+  onProgress(sent, file.size);
+
+  const worker = async () => {
+    while (queue.length > 0) {
+      const index = queue.shift();
+      const offset = index * chunkSize;
+      const blob = file.slice(offset, offset + chunkSize);
+      for (let attempt = 1; ; attempt++) {
+        try {
+          const res = await uploadChunk(uploadId, offset, blob);
+          if (res.ok) break;
+          if (res.status < 500 || attempt >= CHUNK_ATTEMPTS) {
+            const errorData = await res.json();
+            throw new Error(errorData.detail || `Error uploading file: ${file.name}`);
+          }
+        } catch (error) {
+          if (attempt >= CHUNK_ATTEMPTS) throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** attempt));
+      }
+      sent += blob.size;
+      onProgress(sent, file.size);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(concurrency, queue.length) }, worker));
+
+  const res = await finalizeUpload(uploadId);
+  if (!res.ok) {
+    const errorData = await res.json();
+    throw new Error(errorData.detail || `Error uploading file: ${file.name}`);
+  }
+  localStorage.removeItem(resumeKey);
+  return res;
+}
+
+// The browser fetches this URL itself, so large downloads stream to disk and can be resumed
+export const downloadUrl = (path) => `${API_BASE_URL}/download?path=${encodeURIComponent(path)}`;
+
 export const handleDelete = async (path, file_name) => {
   const formData = new FormData();
   formData.append('path', path);
@@ -112,6 +194,44 @@ export const fetchSFTPFiles = async (ftpData) => {
   return res;
 }
 
+// Reads the NDJSON listing stream, calling onItems with each batch of entries as it arrives
+export const streamSFTPFiles = async (ftpData, onItems) => {
+  const res = await fetch(`${API_BASE_URL}/sftp/list-files/stream`, {
+    method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json'},
+    body: JSON.stringify(ftpData),
+  });
+  if (!res.ok) {
+    const errorData = await res.json();
+    throw new Error(errorData.detail || 'Failed to fetch files');
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let count = 0;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (!line) continue;
+      const event = JSON.parse(line);
+      if (event.type === 'items') {
+        onItems(event.items);
+      } else if (event.type === 'error') {
+        throw new Error(event.detail || 'Failed to fetch files');
+      } else if (event.type === 'done') {
+        count = event.count;
+      }
+    }
+  }
+  return count;
+}
+
 export const downloadSFTPFile = async (ftpData) => {
   const res = await fetch(`${API_BASE_URL}/sftp/download`, {
     method: 'POST',
@@ -134,14 +254,25 @@ export const handleLinksUpload = async (links, path) => {
 }
 
 
-export const fetchUploadSessions = async (username) => {
-  const res = await fetch(`${API_BASE_URL}/sessions/${username}`, {
+export const fetchUploadSessions = async (username, params = {}) => {
+  const query = new URLSearchParams(params);
+  const res = await fetch(`${API_BASE_URL}/sessions/${username}?${query}`, {
     method: 'GET',
     credentials: 'include',
   });
   return res;
 }
 
+// Opens the server-sent event stream of the current user's sessions: `onSnapshot` receives
+// the unfinished and latest sessions with a cursor for older ones (again after every
+// reconnect), `onUpdate` only the changed fields
+export const subscribeSessionEvents = (onSnapshot, onUpdate) => {
+  const source = new EventSource(`${API_BASE_URL}/events/sessions`, { withCredentials: true });
+  source.addEventListener('snapshot', (event) => onSnapshot(JSON.parse(event.data)));
+  source.addEventListener('update', (event) => onUpdate(JSON.parse(event.data).sessions));
+  return source;
+}
+
 export const deleteUploadSession = async (sessionId) => {
   const res = await fetch(`${API_BASE_URL}/sessions/${sessionId}`, {
     method: 'DELETE',
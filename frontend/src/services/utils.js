@@ -13,4 +13,23 @@ export const humanReadableSize = (size) => {
   }
 
   return `${readableSize.toFixed(2)} ${units[unitIndex]}`;
-};
\ No newline at end of file
+};
+
+// A delta announcing a new session (or a row of an older page) carries the whole session
+const isWholeSession = (delta) => delta.type !== undefined && delta.started_at !== undefined;
+
+// Merges session deltas from the event stream into a list of sessions, newest first.
+// Partial updates of sessions not in the list are ignored rather than rendered half-filled.
+export const applySessionDeltas = (sessions, deltas) => {
+  const byId = new Map(sessions.map((session) => [session.session_id, session]));
+  for (const delta of deltas) {
+    if (delta.deleted) {
+      byId.delete(delta.session_id);
+    } else if (byId.has(delta.session_id)) {
+      byId.set(delta.session_id, { ...byId.get(delta.session_id), ...delta });
+    } else if (isWholeSession(delta)) {
+      byId.set(delta.session_id, delta);
+    }
+  }
+  return [...byId.values()].sort((a, b) => b.started_at_unix - a.started_at_unix);
+};